@@ -0,0 +1,77 @@
+"""
+Import-time report for the app's cold start.
+Each module is imported in a fresh interpreter with `python -X importtime`, so
+the numbers match a cold process start; the slowest direct imports are listed
+under each module's total.
+
+Usage: python benchmarks/import_time.py [module ...] [--top N]
+"""
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+# What a cold app start imports, then what each document type adds on first use
+DEFAULT_MODULES = [
+    "components.document_generator",
+    "components.llm_selector",
+    "streamlit",
+    "generators.exercise_generator",
+    "generators.powerpoint_generator",
+    "generators.summary_generator",
+    "docx",
+    "pptx"
+]
+
+
+def measure(module, top):
+    """Import a module in a fresh interpreter and return (total ms, [(ms, name)] of its slowest direct imports)."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+
+    entries = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nesting is shown by two spaces per level after the separating space
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, int(cumulative) / 1000, name.strip()))
+
+    # Interpreter startup (site and what it pulls in) is not part of the module's cost
+    startup_end = max((i + 1 for i, (depth, _, name) in enumerate(entries) if depth == 0 and name == "site"), default=0)
+    entries = entries[startup_end:]
+
+    total_ms = sum(ms for depth, ms, _ in entries if depth == 0)
+    direct = sorted(((ms, name) for depth, ms, name in entries if depth == 1), reverse=True)
+    return total_ms, direct[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=5, help="slowest direct imports to list per module")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        try:
+            total_ms, slowest = measure(module, args.top)
+        except RuntimeError as e:
+            print(f"{module:<40} failed: {e}")
+            continue
+        print(f"{module:<40} {total_ms:8.1f} ms")
+        for ms, name in slowest:
+            print(f"    {name:<36} {ms:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+"""
+Concurrent-user load test for the Streamlit app.
+Starts the app and an Ollama-compatible provider stub, then drives simulated
+teachers over the browser's websocket protocol: each session fills in the
+form, clicks Generate, prepares the Word document and downloads it.
+Concurrency is ramped through the given levels; each level reports
+throughput, end-to-end latency percentiles, error rate and the server's RSS.
+
+Usage: python benchmarks/load_test.py [--levels 1,2,4,8] [--generations 3] [--json results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+import websockets
+from streamlit.proto.Alert_pb2 import Alert
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+from provider_stub import ProviderStub
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+APP_PATH = ROOT_DIR / "src" / "app.py"
+LOCALE_PATH = ROOT_DIR / "locales" / "en.json"
+
+SERVER_START_TIMEOUT_SECONDS = 60
+RSS_SAMPLE_SECONDS = 0.25
+
+
+def _locale(key):
+    """English UI text for a dotted locale key; widgets are found by their labels"""
+    value = json.loads(LOCALE_PATH.read_text(encoding="utf-8"))
+    for part in key.split("."):
+        value = value[part]
+    return value
+
+
+class SessionError(Exception):
+    """A simulated session saw an error instead of the expected result."""
+
+
+class SimulatedSession:
+    """One browser session: sends widget states and reads back the rendered elements."""
+
+    def __init__(self, app_url, timeout):
+        self.app_url = app_url
+        self.timeout = timeout
+        self.elements = []
+        self._widget_states = {}
+        self._socket = None
+
+    async def connect(self):
+        ws_url = self.app_url.replace("http", "ws", 1) + "/_stcore/stream"
+        self._socket = await websockets.connect(ws_url, subprotocols=["streamlit"], max_size=None)
+        await self.run()
+
+    async def close(self):
+        if self._socket is not None:
+            await self._socket.close()
+
+    def set(self, kind, label, value_type, value):
+        """Set a widget's value for the following runs, as the browser would."""
+        self._widget_states[self._widget_id(kind, label)] = (value_type, value)
+
+    async def click(self, label):
+        """Press a button and wait for the run it triggers."""
+        await self.run(trigger=self._widget_id("button", label))
+
+    async def run(self, trigger=None):
+        """Rerun the script with the current widget states and collect its elements."""
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        message.rerun_script.page_script_hash = ""
+        for widget_id, (value_type, value) in self._widget_states.items():
+            state = message.rerun_script.widget_states.widgets.add()
+            state.id = widget_id
+            if value_type == "string_array_value":
+                state.string_array_value.data.extend(value)
+            else:
+                setattr(state, value_type, value)
+        if trigger is not None:
+            state = message.rerun_script.widget_states.widgets.add()
+            state.id = trigger
+            state.trigger_value = True
+        await self._socket.send(message.SerializeToString())
+
+        elements = {}
+        deadline = time.monotonic() + self.timeout
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await asyncio.wait_for(self._socket.recv(), deadline - time.monotonic()))
+            kind = forward.WhichOneof("type")
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                elements[tuple(forward.metadata.delta_path)] = forward.delta.new_element
+            elif kind == "script_finished":
+                # A run cut short for a rerun is followed by the rerun itself
+                if forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    break
+                elements = {}
+        self.elements = list(elements.values())
+
+    def find(self, kind, label=None):
+        """The first element of a kind, optionally with the given label, from the last run."""
+        for element in self.elements:
+            if element.WhichOneof("type") == kind:
+                widget = getattr(element, kind)
+                if label is None or widget.label == label:
+                    return widget
+        return None
+
+    def shows_alert(self, alert_format, body):
+        """Whether the last run showed an alert of the given format and text."""
+        return any(element.WhichOneof("type") == "alert" and element.alert.format == alert_format and element.alert.body == body
+                   for element in self.elements)
+
+    def errors(self):
+        """Error messages and exceptions shown by the last run."""
+        messages = [element.alert.body for element in self.elements
+                    if element.WhichOneof("type") == "alert" and element.alert.format == Alert.ERROR]
+        messages.extend(element.exception.message for element in self.elements if element.WhichOneof("type") == "exception")
+        return messages
+
+    def _widget_id(self, kind, label):
+        widget = self.find(kind, label)
+        if widget is None:
+            raise SessionError(f"No {kind} labelled {label!r}; errors: {self.errors()}")
+        return widget.id
+
+
+class Teacher:
+    """Simulated teacher: configures the provider once, then generates and downloads documents."""
+
+    def __init__(self, app_url, ollama_host, timeout):
+        self.session = SimulatedSession(app_url, timeout)
+        self.ollama_host = ollama_host
+
+    async def start(self):
+        session = self.session
+        await session.connect()
+        session.set("selectbox", _locale("sidebar.ai_model_type_label"), "string_value",
+                    _locale("sidebar.ai_model_type_options")[2])
+        await session.run()
+        session.set("text_input", _locale("llm.ollama.host_label"), "string_value", self.ollama_host)
+        session.set("text_input", _locale("document_settings.subject_label"), "string_value", "Mathematics")
+        session.set("text_area", _locale("content_description.topic_label"), "string_value",
+                    "Adding and subtracting fractions with unlike denominators")
+        await session.run()
+
+    async def generate_and_download(self):
+        """Generate an exercise list and download it as Word; returns the bytes downloaded."""
+        session = self.session
+        await session.click(_locale("generation.generate_button"))
+        if not session.shows_alert(Alert.SUCCESS, _locale("generation.success_message")):
+            raise SessionError("; ".join(session.errors()) or "No generation result")
+
+        docx_label = _locale("generation.download_labels.docx")
+        await session.click(_locale("generation.prepare_download_template").format(label=docx_label))
+        download = session.find("download_button", docx_label)
+        if download is None:
+            raise SessionError("; ".join(session.errors()) or "No download button")
+        response = await asyncio.to_thread(requests.get, self.session.app_url + download.url, timeout=session.timeout)
+        response.raise_for_status()
+        return len(response.content)
+
+    async def stop(self):
+        await self.session.close()
+
+
+class RssSampler:
+    """Samples a process's resident set size on a background thread."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            rss = process_rss_mb(self.pid)
+            if rss is not None:
+                self.samples.append(rss)
+            self._stop.wait(RSS_SAMPLE_SECONDS)
+
+
+def process_rss_mb(pid):
+    """Resident set size of a process in MB, or None if it cannot be read."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        output = subprocess.run(["ps", "-o", "rss=", "-p", str(pid)], capture_output=True, text=True).stdout
+        return int(output.strip()) / 1024
+    except (OSError, ValueError):
+        return None
+
+
+def start_app(port, data_dir, env_overrides):
+    """Start the app headless with its own data files and wait until it is healthy."""
+    env = {
+        **os.environ,
+        # Fresh stores, and no answering from the similarity cache
+        "EDUADOCS_ARTIFACT_DIR": str(data_dir / "artifacts"),
+        "EDUADOCS_SIMILARITY_CACHE": str(data_dir / "similarity-cache.sqlite3"),
+        "EDUADOCS_SIMILARITY_SUGGEST": "2",
+        "EDUADOCS_SIMILARITY_REUSE": "2",
+        "EDUADOCS_QUESTION_BANK": str(data_dir / "question-bank.sqlite3"),
+        "EDUADOCS_COURSE_INDEX": str(data_dir / "course-index.sqlite3"),
+        **env_overrides
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", str(APP_PATH),
+         "--server.headless", "true", "--server.port", str(port), "--browser.gatherUsageStats", "false"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The app exited with status {process.returncode}")
+        try:
+            if requests.get(f"{url}/_stcore/health", timeout=1).ok:
+                return process, url
+        except requests.exceptions.ConnectionError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("The app did not become healthy in time")
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run_level(app_url, ollama_host, concurrency, generations, timeout):
+    """Run `concurrency` teachers generating `generations` documents each; returns latencies and errors."""
+    teachers = [Teacher(app_url, ollama_host, timeout) for _ in range(concurrency)]
+    latencies = []
+    errors = []
+
+    async def work(teacher):
+        for _ in range(generations):
+            start = time.monotonic()
+            try:
+                await teacher.generate_and_download()
+                latencies.append(time.monotonic() - start)
+            except (SessionError, asyncio.TimeoutError, requests.RequestException, websockets.WebSocketException) as e:
+                errors.append(str(e) or type(e).__name__)
+
+    try:
+        await asyncio.gather(*(teacher.start() for teacher in teachers))
+        start = time.monotonic()
+        await asyncio.gather(*(work(teacher) for teacher in teachers))
+        elapsed = time.monotonic() - start
+    finally:
+        await asyncio.gather(*(teacher.stop() for teacher in teachers), return_exceptions=True)
+
+    return latencies, errors, elapsed
+
+
+def summarise(concurrency, latencies, errors, elapsed, rss_samples):
+    attempts = len(latencies) + len(errors)
+    return {
+        "concurrency": concurrency,
+        "documents": len(latencies),
+        "errors": len(errors),
+        "error_rate": len(errors) / attempts if attempts else 0.0,
+        "throughput_per_minute": len(latencies) / elapsed * 60 if elapsed else 0.0,
+        "p50_seconds": percentile(latencies, 0.50) if latencies else None,
+        "p95_seconds": percentile(latencies, 0.95) if latencies else None,
+        "p99_seconds": percentile(latencies, 0.99) if latencies else None,
+        "rss_peak_mb": max(rss_samples) if rss_samples else None,
+        "rss_end_mb": rss_samples[-1] if rss_samples else None,
+        "sample_errors": sorted(set(errors))[:3]
+    }
+
+
+def print_header():
+    print(f"{'users':>5} {'docs':>5} {'err%':>6} {'docs/min':>9} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'RSS peak MB':>12}")
+
+
+def print_row(row):
+    seconds = [f"{row[key]:7.2f}" if row[key] is not None else f"{'-':>7}" for key in ("p50_seconds", "p95_seconds", "p99_seconds")]
+    rss = f"{row['rss_peak_mb']:12.0f}" if row["rss_peak_mb"] is not None else f"{'-':>12}"
+    print(f"{row['concurrency']:>5} {row['documents']:>5} {row['error_rate'] * 100:6.1f} "
+          f"{row['throughput_per_minute']:9.1f} {' '.join(seconds)} {rss}", flush=True)
+    for error in row["sample_errors"]:
+        print(f"      error: {error[:100]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--levels", default="1,2,4,8", help="comma-separated numbers of concurrent sessions")
+    parser.add_argument("--generations", type=int, default=3, help="documents each session generates per level")
+    parser.add_argument("--port", type=int, default=8765, help="port the app is started on")
+    parser.add_argument("--ollama-host", help="real Ollama host to use instead of the provider stub")
+    parser.add_argument("--stub-port", type=int, default=11500)
+    parser.add_argument("--first-token-ms", type=float, default=300, help="stub time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=60, help="stub token rate")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of stub generations that fail")
+    parser.add_argument("--provider-concurrency", type=int, help="app's concurrent request limit for Ollama")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds allowed per app run")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(",")]
+    env_overrides = {}
+    if args.provider_concurrency:
+        env_overrides["EDUADOCS_CONCURRENCY_OLLAMA"] = str(args.provider_concurrency)
+
+    stub = None
+    ollama_host = args.ollama_host
+    if not ollama_host:
+        stub = ProviderStub(args.stub_port, args.first_token_ms, args.tokens_per_second, args.error_rate).start()
+        ollama_host = stub.url
+
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="eduadocs-load-") as data_dir:
+        process, app_url = start_app(args.port, Path(data_dir), env_overrides)
+        try:
+            # One unmeasured generation loads the generator modules and document libraries
+            asyncio.run(run_level(app_url, ollama_host, 1, 1, args.timeout))
+            print_header()
+            for concurrency in levels:
+                with RssSampler(process.pid) as rss:
+                    latencies, errors, elapsed = asyncio.run(
+                        run_level(app_url, ollama_host, concurrency, args.generations, args.timeout)
+                    )
+                rows.append(summarise(concurrency, latencies, errors, elapsed, rss.samples))
+                print_row(rows[-1])
+        finally:
+            process.terminate()
+            process.wait()
+            if stub is not None:
+                stub.stop()
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(rows, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
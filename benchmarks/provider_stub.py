@@ -0,0 +1,172 @@
+"""
+Ollama-compatible LLM stub for load tests.
+Answers every generation with an exercise list of a fixed number of questions
+(JSON when a schema is requested, Markdown otherwise), streamed at a
+configurable time to first token and token rate, and fails a configurable
+share of requests. The app is pointed at it like at a real Ollama host.
+
+Usage: python benchmarks/provider_stub.py [--port 11500] [--first-token-ms 300] [--tokens-per-second 60]
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MODEL_NAME = "stub"
+# Characters per streamed token
+TOKEN_CHARS = 4
+
+
+def exercise_markdown(num_questions):
+    """A complete exercise list in the Markdown format the app asks for"""
+    lines = ["# Exercise List", "", "## Multiple Choice", ""]
+    for number in range(1, num_questions + 1):
+        lines.append(f"{number}. Which option completes statement {number} about the topic?")
+        lines.extend(f"   {letter}) Option {letter} for question {number}" for letter in "ABCD")
+        lines.append("")
+    lines.extend(["## Answer Key", ""])
+    lines.extend(f"{number}. {'ABCD'[number % 4]}" for number in range(1, num_questions + 1))
+    return "\n".join(lines) + "\n"
+
+
+def exercise_json(num_questions):
+    """A complete exercise list matching the app's ExerciseList schema"""
+    questions = [
+        {
+            "type": "Multiple Choice",
+            "question": f"Which option completes statement {number} about the topic?",
+            "options": [f"Option {letter} for question {number}" for letter in "ABCD"],
+            "answer": "ABCD"[number % 4],
+            "solution": ""
+        }
+        for number in range(1, num_questions + 1)
+    ]
+    return json.dumps({
+        "title": "Exercise List",
+        "introduction": "",
+        "sections": [{"title": "Multiple Choice", "instructions": "", "questions": questions}]
+    })
+
+
+class ProviderStub:
+    """Threaded HTTP server speaking the parts of the Ollama API the app uses."""
+
+    def __init__(self, port, first_token_ms=300, tokens_per_second=60, error_rate=0.0, num_questions=10):
+        self.first_token_seconds = first_token_ms / 1000
+        self.token_seconds = 1 / tokens_per_second if tokens_per_second > 0 else 0
+        self.error_rate = error_rate
+        self.responses = {False: exercise_markdown(num_questions), True: exercise_json(num_questions)}
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self):
+        """Serve on a background thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def handle(self):
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    # Clients dropping idle keep-alive connections
+                    pass
+
+            def _send_json(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path in ("/api/tags", "/api/ps"):
+                    self._send_json(200, {"models": [{"name": MODEL_NAME, "model": MODEL_NAME}]})
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path != "/api/generate":
+                    return self._send_json(404, {"error": "not found"})
+                # Model preloads carry no prompt
+                if not request.get("prompt"):
+                    return self._send_json(200, {"response": "", "done": True})
+
+                time.sleep(stub.first_token_seconds)
+                if random.random() < stub.error_rate:
+                    return self._send_json(500, {"error": "stub failure"})
+
+                text = stub.responses[bool(request.get("format"))]
+                if not request.get("stream"):
+                    time.sleep(stub.token_seconds * len(text) / TOKEN_CHARS)
+                    return self._send_json(200, {"response": text, "done": True})
+                self._stream(text)
+
+            def _stream(self, text):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                tokens = [text[i:i + TOKEN_CHARS] for i in range(0, len(text), TOKEN_CHARS)]
+                try:
+                    for index, token in enumerate(tokens):
+                        if index:
+                            time.sleep(stub.token_seconds)
+                        self._write_chunk({"response": token, "done": False})
+                    self._write_chunk({"response": "", "done": True})
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The app stops reading once the document is complete
+                    pass
+
+            def _write_chunk(self, payload):
+                line = (json.dumps(payload) + "\n").encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--tokens-per-second", type=float, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of generations answered with HTTP 500")
+    parser.add_argument("--questions", type=int, default=10, help="questions per generated exercise list")
+    args = parser.parse_args()
+
+    stub = ProviderStub(args.port, args.first_token_ms, args.tokens_per_second, args.error_rate, args.questions)
+    print(f"Provider stub listening on {stub.url} (model \"{MODEL_NAME}\")")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 import streamlit as st
 import sys
+import time
+import uuid
 from pathlib import Path
 
 # Add src directory to path for imports
@@ -8,9 +10,21 @@ sys.path.append(str(src_path))
 
 from components import llm_selector, document_generator, language_selector
 from utils.validation import validate_inputs
-from utils.language_manager import i18n, i18n_list
+from utils.language_manager import get_language_manager, i18n, i18n_list
+from utils.course_index import course_key, get_course_index
+from utils.rerun_profiler import get_rerun_profiler, profiling_enabled
+from utils.admission import admission_scope
+from llm_handlers.cancellation import CancellationToken, get_cancellation_metrics, run_cancellable
+
+# Document types understood by the generators, in the order of the localized options
+DOCUMENT_TYPES = ["Exercise List", "PowerPoint Presentation", "Summary", "Lesson Pack"]
+
+# Summary format styles understood by the renderers, in the order of the localized options
+SUMMARY_FORMAT_STYLES = ["Bullet Points", "Paragraphs", "Outline", "Q&A Format"]
 
 def main():
+    profiler = get_rerun_profiler()
+    
     st.set_page_config(
         page_title=i18n("page.title"),
         page_icon=i18n("page.icon"),
@@ -23,7 +37,8 @@ def main():
     # Sidebar for LLM selection and Language selection
     with st.sidebar:
         st.header(i18n("sidebar.ai_model_selection_header"))
-        selected_llm = llm_selector.display_llm_selector()
+        with profiler.section("llm_selector"):
+            selected_llm = llm_selector.display_llm_selector()
         
         # Display language selector at the bottom of sidebar
         language_selector.display_language_selector()
@@ -45,6 +60,10 @@ def main():
             i18n_list("document_settings.grade_level_options"),
             key="grade_level"
         )
+        document_title = st.text_input(
+            i18n("document_settings.document_title_label"),
+            help=i18n("document_settings.document_title_help")
+        )
         
         st.header(i18n("content_description.header"))
         doc_type = st.selectbox(
@@ -63,8 +82,12 @@ def main():
         exercise_list_type = doc_type_options[0] if len(doc_type_options) > 0 else "Exercise List"
         powerpoint_type = doc_type_options[1] if len(doc_type_options) > 1 else "PowerPoint Presentation"
         summary_type = doc_type_options[2] if len(doc_type_options) > 2 else "Summary"
+        lesson_pack_type = doc_type_options[3] if len(doc_type_options) > 3 else "Lesson Pack"
+        
+        # A lesson pack needs the settings of all three document types
+        is_lesson_pack = doc_type == lesson_pack_type
         
-        if doc_type == exercise_list_type:  # Exercise List
+        if doc_type == exercise_list_type or is_lesson_pack:  # Exercise List
             num_questions = st.number_input(
                 i18n("exercise_list.num_questions_label"), 
                 min_value=1, value=10, step=1
@@ -80,8 +103,13 @@ def main():
                 i18n_list("exercise_list.question_types_options"),
                 default=i18n_list("exercise_list.question_types_default")
             )
+            use_question_bank = st.checkbox(
+                i18n("exercise_list.use_question_bank_label"),
+                value=False,
+                help=i18n("exercise_list.use_question_bank_help")
+            )
         
-        elif doc_type == powerpoint_type:  # PowerPoint Presentation
+        if doc_type == powerpoint_type or is_lesson_pack:  # PowerPoint Presentation
             num_slides = st.number_input(
                 i18n("powerpoint.num_slides_label"), 
                 min_value=1, value=12, step=1
@@ -94,8 +122,13 @@ def main():
                 i18n("powerpoint.presentation_style_label"),
                 i18n_list("powerpoint.presentation_style_options")
             )
+            pptx_template = st.file_uploader(
+                i18n("powerpoint.template_label"),
+                type=["pptx"],
+                help=i18n("powerpoint.template_help")
+            )
         
-        elif doc_type == summary_type:  # Summary
+        if doc_type == summary_type or is_lesson_pack:  # Summary
             summary_length = st.selectbox(
                 i18n("summary.summary_length_label"),
                 i18n_list("summary.summary_length_options")
@@ -108,86 +141,147 @@ def main():
                 i18n("summary.format_style_label"),
                 i18n_list("summary.format_style_options")
             )
+            source_file = st.file_uploader(
+                i18n("summary.source_file_label"),
+                type=["pdf", "docx", "txt", "md"],
+                help=i18n("summary.source_file_help")
+            )
     
     with col2:
         st.header(i18n("generation.options_header"))
         
+        structured_output = st.checkbox(
+            i18n("generation.structured_output_label"),
+            value=True,
+            help=i18n("generation.structured_output_help")
+        )
+        
+        lang_manager = get_language_manager()
+        language_names = {code: name for name, code in lang_manager.SUPPORTED_LANGUAGES.items()}
+        output_languages = st.multiselect(
+            i18n("generation.output_languages_label"),
+            list(language_names),
+            default=[lang_manager.get_current_language()],
+            format_func=language_names.get,
+            help=i18n("generation.output_languages_help")
+        )
+        
+        course_files = st.file_uploader(
+            i18n("generation.course_material_label"),
+            type=["pdf", "docx", "txt", "md"],
+            accept_multiple_files=True,
+            help=i18n("generation.course_material_help")
+        )
+        course_documents = []
+        if subject.strip():
+            with profiler.section("course_index"):
+                _index_course_material(subject, course_files)
+                course_documents = get_course_index().documents(course_key(subject))
+        use_course_material = st.checkbox(
+            i18n("generation.use_course_material_label"),
+            value=bool(course_documents),
+            disabled=not course_documents,
+            help=i18n("generation.use_course_material_help")
+        )
+        if course_documents:
+            st.caption(i18n("generation.course_documents_template").format(
+                count=len(course_documents),
+                subject=subject.strip()
+            ))
+        
+        # Prepare generation parameters
+        params = {
+            "doc_type": DOCUMENT_TYPES[doc_type_options.index(doc_type)],
+            "subject": subject,
+            "grade_level": grade_level,
+            "topic": topic,
+            "llm_config": selected_llm,
+            "document_title": document_title.strip(),
+            "structured_output": structured_output,
+            "use_course_material": use_course_material and bool(course_documents),
+            "output_languages": output_languages or [lang_manager.get_current_language()]
+        }
+        
+        # Add specific parameters based on document type
+        if doc_type == exercise_list_type or is_lesson_pack:
+            params.update({
+                "num_questions": num_questions,
+                "difficulty": difficulty,
+                "question_types": question_types,
+                "use_question_bank": use_question_bank
+            })
+        if doc_type == powerpoint_type or is_lesson_pack:
+            params.update({
+                "num_slides": num_slides,
+                "include_images": include_images,
+                "presentation_style": presentation_style,
+                "pptx_template": pptx_template.getvalue() if pptx_template else None
+            })
+        if doc_type == summary_type or is_lesson_pack:
+            params.update({
+                "summary_length": summary_length,
+                "include_examples": include_examples,
+                "format_style": SUMMARY_FORMAT_STYLES[i18n_list("summary.format_style_options").index(format_style)],
+                "source_file": source_file,
+                "source_name": source_file.name if source_file else ""
+            })
+        
+        file_base_name = f"{subject}_{doc_type.replace(' ', '_')}"
+        
+        # Presentation-only changes are applied to the last generation locally
+        generation = st.session_state.get("generation")
+        if generation and document_generator.presentation_changed(generation["params"], params):
+            with profiler.section("rerender"):
+                st.session_state.generation = {
+                    "result": document_generator.rerender_document(params, generation["result"]),
+                    "file_base_name": file_base_name,
+                    "params": params
+                }
+        
+        # Offer a similar past generation as an instant starting point
+        similar = None
+        if subject.strip() and topic.strip():
+            # The lookup hashes the request and reads the index, so it only reruns when the form changes
+            lookup_key = document_generator.similar_document_key(params)
+            lookup = st.session_state.get("similar_lookup")
+            if lookup is None or lookup[0] != lookup_key:
+                with profiler.section("similarity"):
+                    lookup = st.session_state.similar_lookup = (lookup_key, document_generator.find_similar_document(params))
+            similar = lookup[1]
+        if similar and not similar["reusable"]:
+            st.info(i18n("generation.similar_found_template").format(
+                score=round(similar["score"] * 100),
+                subject=similar["subject"],
+                topic=similar["topic"][:80]
+            ))
+            if st.button(i18n("generation.use_similar_button"), use_container_width=True):
+                st.session_state.generation = {
+                    "result": document_generator.reuse_document(params, similar),
+                    "file_base_name": file_base_name,
+                    "params": params
+                }
+        
+        cancelled = st.session_state.pop("generation_cancelled", False)
+        interrupted = st.session_state.pop("interrupted_generation", None)
+        if interrupted:
+            provider, seconds = interrupted
+            get_cancellation_metrics().record(provider, "cancel_button" if cancelled else "rerun", seconds)
+        if cancelled:
+            st.info(i18n("generation.cancelled_message"))
+        
         if st.button(i18n("generation.generate_button"), type="primary", use_container_width=True):
             # Validate inputs
             is_valid, validation_message = validate_inputs(subject, topic, selected_llm)
             
             if is_valid:
-                with st.spinner(i18n("generation.spinner_message")):
-                    try:
-                        # Prepare generation parameters
-                        params = {
-                            "doc_type": doc_type,
-                            "subject": subject,
-                            "grade_level": grade_level,
-                            "topic": topic,
-                            "llm_config": selected_llm
-                        }
-                        
-                        # Add specific parameters based on document type
-                        if doc_type == exercise_list_type:
-                            params.update({
-                                "num_questions": num_questions,
-                                "difficulty": difficulty,
-                                "question_types": question_types
-                            })
-                        elif doc_type == powerpoint_type:
-                            params.update({
-                                "num_slides": num_slides,
-                                "include_images": include_images,
-                                "presentation_style": presentation_style
-                            })
-                        elif doc_type == summary_type:
-                            params.update({
-                                "summary_length": summary_length,
-                                "include_examples": include_examples,
-                                "format_style": format_style
-                            })
-                        
-                        # Generate document
-                        result = document_generator.generate_document(params)
-                        
-                        if result["success"]:
-                            st.success(i18n("generation.success_message"))
-                            
-                            # Display preview
-                            st.header(i18n("generation.document_preview_header"))
-                            with st.expander(i18n("generation.view_generated_content"), expanded=True):
-                                st.markdown(result["content"])
-                            
-                            # Download options
-                            st.header(i18n("generation.download_options_header"))
-                            col_download1, col_download2 = st.columns(2)
-                            
-                            with col_download1:
-                                if result.get("docx_file"):
-                                    st.download_button(
-                                        label=i18n("generation.download_word_label"),
-                                        data=result["docx_file"],
-                                        file_name=f"{subject}_{doc_type.replace(' ', '_')}.docx",
-                                        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                                    )
-                            
-                            with col_download2:
-                                if result.get("pptx_file"):
-                                    st.download_button(
-                                        label=i18n("generation.download_ppt_label"),
-                                        data=result["pptx_file"],
-                                        file_name=f"{subject}_{doc_type.replace(' ', '_')}.pptx",
-                                        mime="application/vnd.openxmlformats-officedocument.presentationml.presentation"
-                                    )
-                        else:
-                            st.error(i18n("generation.error_generating_template").format(error=result['error']))
-                            
-                    except Exception as e:
-                        st.error(i18n("generation.exception_template").format(error=str(e)))
+                _run_generation(params, file_base_name)
             else:
                 st.warning(validation_message)
         
+        if "generation" in st.session_state:
+            with profiler.section("results"):
+                _display_generation(st.session_state.generation)
+        
         # Help section
         with st.expander(i18n("help.title")):
             getting_started = i18n_list("help.getting_started_steps")
@@ -212,6 +306,245 @@ def main():
             - {tips[2] if len(tips) > 2 else ""}
             - {tips[3] if len(tips) > 3 else ""}
             """)
+    
+    if profiling_enabled():
+        _display_rerun_profile(profiler)
+
+def _display_rerun_profile(profiler):
+    """Show recent rerun timings in the sidebar"""
+    
+    stats = profiler.stats()
+    if not stats:
+        return
+    
+    with st.sidebar.expander(i18n("profiler.header")):
+        st.caption(i18n("profiler.summary_template").format(
+            last=round(stats["last_ms"]),
+            p50=round(stats["p50_ms"]),
+            p95=round(stats["p95_ms"]),
+            over=stats["over_budget"],
+            count=stats["count"],
+            budget=round(profiler.budget_ms)
+        ))
+        for name, ms in sorted(stats["sections"].items(), key=lambda item: -item[1]):
+            st.caption(f"{name}: {ms:.1f} ms")
+        for name, ms in stats["excluded"].items():
+            st.caption(i18n("profiler.excluded_template").format(name=name, seconds=round(ms / 1000, 1)))
+        
+        cancellations = get_cancellation_metrics().stats()
+        if cancellations["count"]:
+            st.caption(i18n("profiler.cancelled_template").format(
+                count=cancellations["count"],
+                reasons=", ".join(f"{reason} {count}" for reason, count in sorted(cancellations["by_reason"].items())),
+                seconds=round(cancellations["seconds"])
+            ))
+
+def _index_course_material(subject, course_files):
+    """Add newly uploaded course files to the subject's retrieval index"""
+    
+    indexed = st.session_state.setdefault("indexed_course_files", set())
+    for course_file in course_files or []:
+        if (subject, course_file.file_id) in indexed:
+            continue
+        try:
+            get_course_index().add_document(course_key(subject), course_file, course_file.name)
+        except Exception as e:
+            st.warning(i18n("generation.course_material_error_template").format(name=course_file.name, error=str(e)))
+        indexed.add((subject, course_file.file_id))
+
+def _run_generation(params, file_base_name):
+    """Generate a document and keep it in the session; returns whether it succeeded"""
+    
+    queue_status = st.empty()
+    provider = params["llm_config"]["provider"]
+    
+    def show_queue_position(ahead, wait_seconds):
+        queue_status.info(i18n("generation.queued_template").format(
+            position=ahead + 1,
+            minutes=max(1, round(wait_seconds / 60))
+        ))
+    
+    def show_elapsed(seconds):
+        queue_status.caption(i18n("generation.elapsed_template").format(seconds=round(seconds)))
+    
+    try:
+        cancel_slot = st.empty()
+        cancel_slot.button(i18n("generation.cancel_button"), key="cancel_generation", on_click=_request_cancel)
+        
+        # LLM requests queue for provider slots under this session, shared fairly by all sessions
+        with admission_scope(_session_id()) as admission:
+            
+            def show_progress(seconds):
+                # Each update is also where Streamlit interrupts this run on a rerun or closed session
+                queued = admission.queue_position()
+                if queued is not None:
+                    show_queue_position(*queued)
+                else:
+                    show_elapsed(seconds)
+            
+            token = CancellationToken()
+            start = time.monotonic()
+            try:
+                # Generation time is not UI cost; keep it out of the rerun timings
+                with st.spinner(i18n("generation.spinner_message")), get_rerun_profiler().excluded("generation"):
+                    # Generate document on a worker thread, cancelled if this run is interrupted
+                    result = run_cancellable(token, show_progress, document_generator.generate_document, params)
+            except BaseException as e:
+                if token.cancelled:
+                    _record_cancellation(provider, e, time.monotonic() - start)
+                raise
+        cancel_slot.empty()
+        queue_status.empty()
+        
+        if result["success"]:
+            st.success(i18n("generation.success_message"))
+            # The new document is in the similarity index now
+            st.session_state.pop("similar_lookup", None)
+            
+            # Keep the generation so its files can be rendered on demand
+            st.session_state.generation = {
+                "result": result,
+                "file_base_name": file_base_name,
+                "params": params
+            }
+            return True
+        
+        st.error(i18n("generation.error_generating_template").format(error=result['error']))
+            
+    except Exception as e:
+        queue_status.empty()
+        st.error(i18n("generation.exception_template").format(error=str(e)))
+    
+    return False
+
+def _request_cancel():
+    """Cancel button callback; the click's rerun interrupts the running generation"""
+    st.session_state.generation_cancelled = True
+
+def _record_cancellation(provider, error, seconds):
+    """Count an interrupted generation in the cancellation metrics
+    
+    Whether a rerun came from the Cancel button is only known once the next
+    run has called the button's callback, so reruns are recorded then.
+    """
+    name = type(error).__name__
+    if name == "RerunException":
+        st.session_state.interrupted_generation = (provider, seconds)
+    else:
+        reason = "session_closed" if name == "StopException" else "error"
+        get_cancellation_metrics().record(provider, reason, seconds)
+
+def _session_id():
+    """Stable identifier of the browser session, for fair queueing"""
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    return st.session_state.session_id
+
+def _display_generation(generation):
+    """Show the preview and download options for the last generated document"""
+    
+    result = generation["result"]
+    
+    if result.get("reused_from"):
+        reused_from = result["reused_from"]
+        st.info(i18n("generation.reused_template").format(
+            score=round(reused_from["score"] * 100),
+            subject=reused_from["subject"],
+            topic=reused_from["topic"][:80]
+        ))
+        if st.button(i18n("generation.regenerate_button")):
+            # On failure stay on this run, so its error is shown above the reused document
+            if _run_generation({**generation["params"], "force_regenerate": True}, generation["file_base_name"]):
+                st.rerun()
+    
+    if "languages" in result:
+        _display_languages(result, generation["file_base_name"])
+    else:
+        _display_result(result, generation["file_base_name"])
+
+def _display_languages(result, file_base_name):
+    """Show each language of a multilingual generation in its own tab"""
+    
+    language_names = {code: name for name, code in get_language_manager().SUPPORTED_LANGUAGES.items()}
+    
+    for error in result.get("errors", []):
+        st.warning(i18n("generation.error_generating_template").format(error=error))
+    
+    languages = [(code, language_result) for code, language_result in result["languages"].items() if language_result["success"]]
+    tabs = st.tabs([language_names.get(code, code) for code, _ in languages])
+    for tab, (code, language_result) in zip(tabs, languages):
+        with tab:
+            _display_result(language_result, f"{file_base_name}_{code}", key_prefix=f"{code}_")
+
+def _display_result(result, file_base_name, key_prefix=""):
+    """Show the preview and download options of a single document or lesson pack"""
+    
+    if "documents" in result:
+        _display_lesson_pack(result, file_base_name, key_prefix)
+        return
+    
+    if "bank_questions" in result:
+        st.caption(i18n("generation.question_bank_template").format(
+            bank=result["bank_questions"],
+            generated=result["generated_questions"]
+        ))
+    if result.get("warning"):
+        st.warning(result["warning"])
+    
+    # Display preview
+    st.header(i18n("generation.document_preview_header"))
+    with st.expander(i18n("generation.view_generated_content"), expanded=True):
+        st.markdown(result["content"])
+    
+    st.header(i18n("generation.download_options_header"))
+    _display_downloads(result["artifacts"], file_base_name, key_prefix=key_prefix)
+
+def _display_lesson_pack(result, file_base_name, key_prefix=""):
+    """Show the shared outline and each document of a lesson pack"""
+    
+    doc_type_labels = dict(zip(DOCUMENT_TYPES, i18n_list("content_description.document_type_options")))
+    
+    st.header(i18n("generation.document_preview_header"))
+    with st.expander(i18n("generation.lesson_outline_label")):
+        st.markdown(result["content"])
+    
+    for error in result.get("errors", []):
+        st.warning(i18n("generation.error_generating_template").format(error=error))
+    
+    for doc_type, document in result["documents"].items():
+        if not document["success"]:
+            continue
+        
+        label = doc_type_labels.get(doc_type, doc_type)
+        with st.expander(label):
+            st.markdown(document["content"])
+        
+        _display_downloads(
+            document["artifacts"],
+            f"{file_base_name}_{doc_type.replace(' ', '_')}",
+            key_prefix=f"{key_prefix}{doc_type}"
+        )
+
+def _display_downloads(artifacts, file_base_name, key_prefix=""):
+    """Show download buttons, rendering each format only once it is requested"""
+    
+    download_columns = st.columns(2)
+    
+    for index, fmt in enumerate(artifacts.formats()):
+        label = i18n(f"generation.download_labels.{fmt}")
+        with download_columns[index % 2]:
+            if not artifacts.is_rendered(fmt):
+                if not st.button(i18n("generation.prepare_download_template").format(label=label), key=f"prepare_{key_prefix}{fmt}"):
+                    continue
+            st.download_button(
+                label=label,
+                data=artifacts.read(fmt),
+                file_name=artifacts.file_name(file_base_name, fmt),
+                mime=artifacts.mime(fmt),
+                key=f"download_{key_prefix}{fmt}",
+                on_click="ignore"
+            )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with get_rerun_profiler().rerun():
+        main()
\ No newline at end of file
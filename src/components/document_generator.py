@@ -1,21 +1,291 @@
-from generators.exercise_generator import generate_exercises
-from generators.powerpoint_generator import generate_powerpoint
-from generators.summary_generator import generate_summary
+import importlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from llm_handlers.cancellation import submit_in_scope
+from utils.similarity_cache import OPTION_KEYS, get_similarity_cache
+from utils.course_index import context_token_budget, course_key, get_course_index
+
+# Generator module, generate function and render function (rebuilding a
+# document from stored content) per document type. Modules are imported on
+# first use, so only the selected document type's dependencies are loaded.
+DOCUMENT_GENERATORS = {
+    "Exercise List": ("generators.exercise_generator", "generate_exercises", "render_exercises"),
+    "PowerPoint Presentation": ("generators.powerpoint_generator", "generate_powerpoint", "render_powerpoint"),
+    "Summary": ("generators.summary_generator", "generate_summary", "render_summary")
+}
+
+# Documents produced by a lesson pack, in display order
+LESSON_PACK_DOCUMENTS = ["Exercise List", "PowerPoint Presentation", "Summary"]
+
+# Parameters that only change how generated content is rendered; a generation
+# can be re-rendered for new values without calling the LLM again
+PRESENTATION_KEYS = ["format_style", "pptx_template", "document_title"]
 
 def generate_document(params):
-    """Main document generation coordinator"""
+    """Main document generation coordinator
+    
+    Near-identical past requests are served from the similarity cache unless
+    `force_regenerate` is set. With `use_course_material`, excerpts from the
+    course's indexed material are retrieved once and shared by all prompts.
+    With several `output_languages`, the document is generated in each of them.
+    """
     
     try:
         doc_type = params["doc_type"]
+        params = _language_params(params)
         
-        if doc_type == "Exercise List":
-            return generate_exercises(params)
-        elif doc_type == "PowerPoint Presentation":
-            return generate_powerpoint(params)
-        elif doc_type == "Summary":
-            return generate_summary(params)
+        if params.get("use_course_material") and "course_excerpts" not in params:
+            params = {**params, "course_excerpts": retrieve_course_excerpts(params)}
+        
+        if len(params.get("output_languages") or []) > 1:
+            return generate_multilingual(params)
+        
+        if doc_type in DOCUMENT_GENERATORS and not params.get("force_regenerate"):
+            match = find_similar_document(params)
+            if match and match["reusable"]:
+                return reuse_document(params, match)
+        
+        if doc_type == "Lesson Pack":
+            return generate_lesson_pack(params)
+        elif doc_type in DOCUMENT_GENERATORS:
+            result = _load_generator(doc_type, "generate")(params)
         else:
             return {"success": False, "error": "Unknown document type"}
-            
+        
+        if result["success"] and params.get("source_file") is None:
+            get_similarity_cache().add(params, result["content"])
+        
+        return result
+    
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+def find_similar_document(params):
+    """Find a past generation similar enough to offer instead of a new one"""
+    
+    # Summaries of uploaded material depend on the file, not just the topic
+    if params.get("doc_type") not in DOCUMENT_GENERATORS or params.get("source_file") is not None:
+        return None
+    if len(params.get("output_languages") or []) > 1:
+        return None
+    return get_similarity_cache().find(params)
+
+def similar_document_key(params):
+    """Everything `find_similar_document` depends on, to reuse its result while the form is unchanged"""
+    
+    options = json.dumps({key: params.get(key) for key in OPTION_KEYS}, sort_keys=True, default=str)
+    return (
+        params.get("doc_type"),
+        params.get("grade_level"),
+        params.get("subject"),
+        params.get("topic"),
+        options,
+        params.get("source_name")
+    )
+
+def retrieve_course_excerpts(params):
+    """Chunks of the course material most relevant to the requested topic"""
+    
+    return get_course_index().retrieve(
+        course_key(params["subject"]),
+        f"{params['topic']} {params['subject']}",
+        context_token_budget()
+    )
+
+def reuse_document(params, match):
+    """Build a document from a similar past generation without calling the LLM"""
+    
+    get_similarity_cache().touch(match["key"])
+    result = _load_generator(params["doc_type"], "render")(match["content"], _language_params(params))
+    result["reused_from"] = {key: match[key] for key in ("score", "subject", "topic", "grade_level")}
+    return result
+
+def presentation_changed(old_params, new_params):
+    """Whether two requests differ in presentation options and in nothing else"""
+    
+    content_keys = (set(old_params) | set(new_params)) - set(PRESENTATION_KEYS)
+    if any(_comparable(old_params.get(key)) != _comparable(new_params.get(key)) for key in content_keys):
+        return False
+    return any(old_params.get(key) != new_params.get(key) for key in PRESENTATION_KEYS)
+
+def rerender_document(params, result):
+    """Rebuild a generation's preview and files for new presentation options, without the LLM"""
+    
+    params = _language_params(params)
+    
+    if "languages" in result:
+        languages = {
+            code: rerender_document({**params, "output_language": code}, language_result) if language_result["success"] else language_result
+            for code, language_result in result["languages"].items()
+        }
+        return {**result, "languages": languages}
+    
+    if "documents" in result:
+        documents = {
+            doc_type: rerender_document({**params, "doc_type": doc_type}, document) if document["success"] else document
+            for doc_type, document in result["documents"].items()
+        }
+        return {**result, "documents": documents}
+    
+    rendered = _load_generator(params["doc_type"], "render")(result["content"], params, result.get("structured"))
+    return {**result, **rendered}
+
+def _comparable(value):
+    """Uploaded files are compared by identity of their upload rather than as objects"""
+    return getattr(value, "file_id", value)
+
+def generate_lesson_pack(params):
+    """Generate exercises, slides and summary from one shared lesson outline
+    
+    The outline is generated once, unless given in `outline`, and passed to
+    every document as context, then the three documents are expanded concurrently.
+    """
+    
+    outline = params.get("outline")
+    if not outline:
+        try:
+            outline = _generate_lesson_outline(params)
+        except Exception as e:
+            return {"success": False, "error": f"Lesson outline generation failed: {str(e)}"}
+    
+    doc_params = {**params, "outline": outline}
+    
+    with ThreadPoolExecutor(max_workers=len(LESSON_PACK_DOCUMENTS)) as executor:
+        futures = {
+            doc_type: submit_in_scope(executor, _load_generator(doc_type, "generate"), {**doc_params, "doc_type": doc_type})
+            for doc_type in LESSON_PACK_DOCUMENTS
+        }
+        documents = {doc_type: future.result() for doc_type, future in futures.items()}
+    
+    errors = [f"{doc_type}: {result['error']}" for doc_type, result in documents.items() if not result["success"]]
+    if len(errors) == len(documents):
+        return {"success": False, "error": "; ".join(errors)}
+    
+    return {
+        "success": True,
+        "content": outline,
+        "documents": documents,
+        "errors": errors
+    }
+
+def generate_multilingual(params):
+    """Generate the same document in each of the requested output languages
+    
+    The structure is generated once: the lesson outline, plus the notes of an
+    uploaded source file. Every language is then written from it concurrently,
+    so the whole takes about as long as a single-language document.
+    """
+    
+    doc_type = params["doc_type"]
+    if doc_type != "Lesson Pack" and doc_type not in DOCUMENT_GENERATORS:
+        return {"success": False, "error": "Unknown document type"}
+    
+    try:
+        shared = _generate_shared_structure(params)
     except Exception as e:
-        return {"success": False, "error": str(e)}
\ No newline at end of file
+        return {"success": False, "error": f"Shared structure generation failed: {str(e)}"}
+    
+    # Banked questions exist in a single language, so every language writes its own
+    language_params = {**params, **shared, "use_question_bank": False}
+    generate = generate_lesson_pack if doc_type == "Lesson Pack" else _load_generator(doc_type, "generate")
+    languages = params["output_languages"]
+    
+    with ThreadPoolExecutor(max_workers=len(languages)) as executor:
+        futures = {
+            code: submit_in_scope(executor, generate, {**language_params, "output_language": code})
+            for code in languages
+        }
+        results = {code: future.result() for code, future in futures.items()}
+    
+    errors = [f"{code}: {result['error']}" for code, result in results.items() if not result["success"]]
+    if len(errors) == len(results):
+        return {"success": False, "error": "; ".join(errors)}
+    
+    return {
+        "success": True,
+        "content": shared.get("outline", ""),
+        "languages": results,
+        "errors": errors
+    }
+
+def _generate_shared_structure(params):
+    """Language-independent parameters every language of a multilingual generation is written from"""
+    
+    doc_types = LESSON_PACK_DOCUMENTS if params["doc_type"] == "Lesson Pack" else [params["doc_type"]]
+    condense_source = "Summary" in doc_types and params.get("source_file") is not None
+    
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = {}
+        if condense_source:
+            from generators.summary_generator import condense_source_material
+            futures["source_notes"] = submit_in_scope(executor, condense_source_material, params)
+        # A summary of uploaded material follows the material rather than an outline
+        if doc_types != ["Summary"] or not condense_source:
+            futures["outline"] = submit_in_scope(executor, _generate_lesson_outline, params, doc_types)
+        return {key: future.result() for key, future in futures.items()}
+
+def _language_params(params):
+    """Set `output_language` when a single output language is requested"""
+    
+    languages = params.get("output_languages") or []
+    if len(languages) == 1 and "output_language" not in params:
+        return {**params, "output_language": languages[0]}
+    return params
+
+def _load_generator(doc_type, role):
+    """Import a document type's generator module and return its "generate" or "render" function"""
+    
+    module_name, generate_name, render_name = DOCUMENT_GENERATORS[doc_type]
+    module = importlib.import_module(module_name)
+    return getattr(module, generate_name if role == "generate" else render_name)
+
+def _generate_lesson_outline(params, doc_types=LESSON_PACK_DOCUMENTS):
+    """Generate the canonical lesson outline shared by all documents of a pack"""
+    
+    from generators.schemas import LessonOutline, json_schema_for, outline_to_text, parse_structured_response, structured_instructions, course_context
+    from generators.stop_conditions import JsonComplete
+    from llm_handlers.api_handler import get_llm_response
+    
+    schema = json_schema_for(LessonOutline)
+    prompt = f"""
+    Plan a lesson for {params['subject']} at {params['grade_level']} level.
+    
+    Topic: {params['topic']}
+    {course_context(params)}
+    Produce a lesson outline that {_outline_documents(params, doc_types)} will be written from:
+    - "title": the lesson title
+    - "learning_objectives": 3-5 measurable objectives
+    - "vocabulary": key terms students should learn
+    - "sections": the lesson's main sections in teaching order, each with a "heading",
+      concise "key_points" and optional "examples"
+    
+    Keep it concise; the individual documents will expand on it.
+    {structured_instructions(schema)}
+    """
+    
+    raw_outline = get_llm_response(prompt, params["llm_config"], json_schema=schema, stop_condition=JsonComplete())
+    
+    try:
+        outline = parse_structured_response(raw_outline, LessonOutline)
+    except ValueError:
+        # Free-form outlines still work as shared context
+        if not raw_outline or not raw_outline.strip():
+            raise
+        return raw_outline.strip()
+    
+    return outline_to_text(outline.model_dump())
+
+def _outline_documents(params, doc_types):
+    """Describe the documents a lesson outline is written for"""
+    
+    documents = []
+    if "Exercise List" in doc_types:
+        documents.append(f"an exercise list ({params['num_questions']} questions)")
+    if "PowerPoint Presentation" in doc_types:
+        documents.append(f"a {params['num_slides']}-slide presentation")
+    if "Summary" in doc_types:
+        documents.append("a summary")
+    
+    if len(documents) == 1:
+        return documents[0]
+    return f"{', '.join(documents[:-1])} and {documents[-1]}"
@@ -2,6 +2,14 @@ import streamlit as st
 import os
 import requests
 from utils.language_manager import i18n, i18n_list, i18n_dict
+from llm_handlers.api_handler import preload_ollama_model
+from llm_handlers.model_router import MODEL_CAPABILITY, get_model_router
+from llm_handlers.ollama_pool import parse_hosts
+import re
+
+# Ollama model families and names of embedding and reranking models
+_EMBEDDING_FAMILIES = {"bert", "nomic-bert", "jina-bert-v2", "xlm-roberta"}
+_NON_GENERATIVE_NAME_PATTERN = re.compile(r'embed|rerank', re.IGNORECASE)
 
 def display_llm_selector():
     """Display LLM selection interface and return configuration"""
@@ -22,6 +30,7 @@ def display_llm_selector():
     huggingface_llm = llm_options[1] if len(llm_options) > 1 else "Hugging Face"
     ollama_llm = llm_options[2] if len(llm_options) > 2 else "Ollama (Local)"
     openai_llm = llm_options[3] if len(llm_options) > 3 else "OpenAI API"
+    auto_llm = llm_options[4] if len(llm_options) > 4 else "Automatic"
     
     if llm_type == google_llm:  # Google GenAI
         config.update(_configure_google())
@@ -31,6 +40,8 @@ def display_llm_selector():
         config.update(_configure_ollama())
     elif llm_type == huggingface_llm:  # Hugging Face
         config.update(_configure_huggingface())
+    elif llm_type == auto_llm:  # Automatic
+        config.update(_configure_auto())
     
     return config
 
@@ -77,17 +88,28 @@ def _configure_ollama():
         help=i18n("llm.ollama.host_help")
     )
     
-    # Check if Ollama is running
-    ollama_status = _check_ollama_connection(host)
+    # Several comma-separated hosts form a pool; check each one
+    hosts = parse_hosts(host)
+    host_statuses = [_check_ollama_connection(url) for url in hosts]
+    connected_hosts = [status for status in host_statuses if status["connected"]]
+    ollama_status = {"connected": bool(connected_hosts)}
     
     if ollama_status["connected"]:
-        st.success(i18n("llm.ollama.connected_template").format(host=host))
+        if len(hosts) > 1:
+            st.success(i18n("llm.ollama.connected_hosts_template").format(
+                connected=len(connected_hosts),
+                total=len(hosts)
+            ))
+        else:
+            st.success(i18n("llm.ollama.connected_template").format(host=host))
         
-        # Try to fetch available models
-        available_models = ollama_status.get("models", [])
+        # Models available on any connected host
+        available_models = sorted({name for status in connected_hosts for name in status.get("models", [])})
         
         if available_models:
             model = st.selectbox(i18n("sidebar.ai_model_type_label"), available_models)
+            # Load the model now so the first generation doesn't wait for it
+            preload_ollama_model(hosts, model)
         else:
             model = st.text_input(
                 i18n("llm.ollama.model_name_label"),
@@ -120,6 +142,7 @@ def _configure_ollama():
     
     return {
         "host": host,
+        "hosts": hosts,
         "model": model,
         "temperature": temperature,
         "provider": "ollama",
@@ -200,6 +223,88 @@ def _configure_google():
         "provider": "google"
     }
 
+def _configure_auto():
+    """Configure automatic model selection across every available provider"""
+    st.subheader(i18n("llm.auto.header"))
+    st.caption(i18n("llm.auto.description"))
+    
+    candidates = []
+    
+    # Hosted models with a configured API key
+    for provider, secret_name in (("google", "GOOGLE_API_KEY"), ("openai", "OPENAI_API_KEY")):
+        api_key = ""
+        try:
+            api_key = st.secrets.get(secret_name, "")
+        except:
+            api_key = os.getenv(secret_name, "")
+        if api_key:
+            for model in i18n_list(f"llm.{provider}.model_options"):
+                if model in MODEL_CAPABILITY:
+                    candidates.append({"api_key": api_key, "model": model, "provider": provider})
+    
+    # Local models on any reachable Ollama host
+    host = st.text_input(
+        i18n("llm.auto.ollama_host_label"),
+        value="http://localhost:11434",
+        help=i18n("llm.ollama.host_help")
+    )
+    hosts = parse_hosts(host)
+    host_statuses = [_check_ollama_connection(url) for url in hosts]
+    ollama_models = sorted({name for status in host_statuses if status["connected"] for name in status.get("models", [])})
+    temperature = st.slider(
+        i18n("llm.ollama.temperature_label"),
+        0.0, 1.0, 0.7
+    )
+    for model in ollama_models:
+        candidates.append({
+            "host": host,
+            "hosts": hosts,
+            "model": model,
+            "temperature": temperature,
+            "provider": "ollama",
+            "connected": True
+        })
+    
+    if candidates:
+        stats = get_model_router().stats()
+        lines = []
+        for candidate in candidates:
+            model_stats = stats.get((candidate["provider"], candidate["model"]))
+            if model_stats:
+                lines.append(i18n("llm.auto.telemetry_template").format(
+                    provider=candidate["provider"],
+                    model=candidate["model"],
+                    p50=model_stats["p50_seconds"],
+                    rate=model_stats["tokens_per_second"],
+                    errors=model_stats["error_rate"],
+                    calls=model_stats["calls"]
+                ))
+            else:
+                lines.append(i18n("llm.auto.untested_template").format(
+                    provider=candidate["provider"],
+                    model=candidate["model"]
+                ))
+        st.markdown(f"**{i18n('llm.auto.candidates_label')}**")
+        st.caption("  \n".join(lines))
+    else:
+        st.warning(i18n("llm.auto.no_candidates"))
+    
+    return {
+        "model": "auto",
+        "candidates": candidates,
+        "provider": "auto"
+    }
+
+def _is_generative(model_data):
+    """Whether an Ollama model from /api/tags generates text, judged by its name and family"""
+    details = model_data.get("details") or {}
+    families = set(details.get("families") or []) | {details.get("family", "")}
+    if families & _EMBEDDING_FAMILIES:
+        return False
+    return not _NON_GENERATIVE_NAME_PATTERN.search(model_data.get("name", ""))
+
+# Reruns within the TTL reuse the last status instead of calling the server again
+@st.cache_data(ttl=10, show_spinner=False)
 def _check_ollama_connection(host):
     """Check if Ollama is running and get available models"""
     try:
@@ -207,7 +312,8 @@ def _check_ollama_connection(host):
         response = requests.get(f"{host}/api/tags", timeout=3)
         if response.status_code == 200:
             models_data = response.json().get("models", [])
-            models = [model["name"] for model in models_data]
+            # Embedding and reranking models cannot write a document
+            models = [model["name"] for model in models_data if _is_generative(model)]
             return {"connected": True, "models": models}
         else:
             return {"connected": False, "error": f"HTTP {response.status_code}"}
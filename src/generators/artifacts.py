@@ -0,0 +1,309 @@
+"""
+Lazy, per-format rendering of generated documents.
+A generation keeps its parsed content and renders each download format only
+the first time it is requested. Renderers write straight into a file in the
+artifact store, so a document is not built up in memory while it is
+rendered; it is only read back for a download button that offers it, and
+the generation itself just remembers the files' keys.
+"""
+
+import html
+import re
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional
+
+from utils.artifact_store import get_artifact_store
+
+# Download format -> (file extension, MIME type)
+FORMATS = {
+    "docx": ("docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+    "pptx": ("pptx", "application/vnd.openxmlformats-officedocument.presentationml.presentation"),
+    "markdown": ("md", "text/markdown"),
+    "html": ("html", "text/html"),
+    "pdf": ("pdf", "application/pdf"),
+}
+
+# Characters encoded at a time when writing text exports
+_TEXT_SLICE_CHARS = 64 * 1024
+
+# Fixed labels written into documents, per output language; English is the default
+DOCUMENT_LABELS = {
+    "pt": {
+        "Exercise List": "Lista de Exercícios",
+        "Presentation": "Apresentação",
+        "Summary": "Resumo",
+        "Topic": "Tema",
+        "Grade Level": "Nível de Ensino",
+    },
+}
+
+
+class DocumentArtifacts:
+    """Renders a generation's downloadable files on demand."""
+
+    def __init__(self, title: str, markdown: str, renderers: Optional[Dict[str, Callable[[BinaryIO], None]]] = None):
+        """
+        Args:
+            title: Document title used by the HTML and PDF exports
+            markdown: Markdown rendering of the content, the source for text exports
+            renderers: Format-specific renderers (e.g. "docx", "pptx") writing
+                the document to the binary file they are given
+        """
+        self.title = title
+        self.markdown = markdown
+        self._renderers = dict(renderers or {})
+        self._renderers.setdefault("markdown", lambda out: write_text(self.markdown, out))
+        self._renderers.setdefault("html", lambda out: write_html(self.markdown, self.title, out))
+        self._renderers.setdefault("pdf", lambda out: write_pdf(self.markdown, self.title, out))
+        self._rendered: Dict[str, str] = {}
+
+    def formats(self) -> List[str]:
+        """Available formats, office formats first."""
+        return [fmt for fmt in FORMATS if fmt in self._renderers]
+
+    def is_rendered(self, fmt: str) -> bool:
+        """Whether a format has been rendered and is still in the artifact store."""
+        key = self._rendered.get(fmt)
+        return key is not None and get_artifact_store().exists(key)
+
+    def render(self, fmt: str) -> str:
+        """Render a format into the artifact store and return its key.
+
+        The earlier result is reused unless the store has evicted it.
+        """
+        if not self.is_rendered(fmt):
+            if fmt not in self._renderers:
+                raise ValueError(f"Unsupported format: {fmt}")
+            self._rendered[fmt] = get_artifact_store().write(self._renderers[fmt], f".{FORMATS[fmt][0]}")
+        return self._rendered[fmt]
+
+    def open(self, fmt: str) -> BinaryIO:
+        """Open a rendered format for reading, rendering it first if needed."""
+        try:
+            return get_artifact_store().open(self.render(fmt))
+        except FileNotFoundError:
+            # Evicted between render and open, render it again
+            self._rendered.pop(fmt, None)
+            return get_artifact_store().open(self.render(fmt))
+
+    def read(self, fmt: str) -> bytes:
+        """The bytes of a rendered format, with the file closed again."""
+        with self.open(fmt) as f:
+            return f.read()
+
+    def file_name(self, base_name: str, fmt: str) -> str:
+        return f"{base_name}.{FORMATS[fmt][0]}"
+
+    def mime(self, fmt: str) -> str:
+        return FORMATS[fmt][1]
+
+
+def document_label(params: Dict[str, Any], label: str) -> str:
+    """A fixed document label in the generation's output language."""
+    return DOCUMENT_LABELS.get(params.get("output_language"), {}).get(label, label)
+
+
+def document_title(params: Dict[str, Any], kind: str) -> str:
+    """The teacher's own document title, or the subject followed by the document kind."""
+    return params.get("document_title") or f"{params['subject']} - {document_label(params, kind)}"
+
+
+def apply_document_title(structured: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    """A structured document carrying the teacher's own title, if one was given."""
+    if not params.get("document_title"):
+        return structured
+    return {**structured, "title": params["document_title"]}
+
+
+def iter_lines(text: str) -> Iterator[str]:
+    """Yield the lines of a text one at a time, like `text.split('\\n')` without building the list."""
+    start = 0
+    end = text.find('\n')
+    while end != -1:
+        yield text[start:end]
+        start = end + 1
+        end = text.find('\n', start)
+    yield text[start:]
+
+
+def write_text(text: str, out: BinaryIO) -> None:
+    """Write text as UTF-8 in slices, without an encoded copy of all of it."""
+    for start in range(0, len(text), _TEXT_SLICE_CHARS):
+        out.write(text[start:start + _TEXT_SLICE_CHARS].encode("utf-8"))
+
+
+def _markdown_blocks(markdown: str):
+    """Yield (kind, level, text) blocks from the Markdown subset the LLMs produce."""
+    for line in iter_lines(markdown):
+        line = line.strip()
+        if not line or line.startswith('---'):
+            continue
+        line = re.sub(r'\*\*(.*?)\*\*', r'\1', line)
+
+        heading = re.match(r'^(#{1,6})\s*#*\s*(.+)', line)
+        numbered = re.match(r'^(\d+)[\.\)]\s+(.+)', line)
+        if heading:
+            yield "heading", min(len(heading.group(1)), 4), heading.group(2).strip()
+        elif line.startswith(('- ', '* ', '• ')):
+            yield "bullet", 0, line[2:]
+        elif numbered:
+            yield "numbered", int(numbered.group(1)), numbered.group(2)
+        elif line.startswith('> '):
+            yield "quote", 0, line[2:]
+        else:
+            yield "paragraph", 0, line
+
+
+def write_html(markdown: str, title: str, out: BinaryIO) -> None:
+    """Write Markdown content as a standalone HTML page, block by block."""
+    out.write((
+        "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+        f"<title>{html.escape(title)}</title>\n</head>\n<body>\n"
+    ).encode("utf-8"))
+    open_list = None
+
+    for kind, level, text in _markdown_blocks(markdown):
+        list_tag = {"bullet": "ul", "numbered": "ol"}.get(kind)
+        tags = []
+        if open_list and open_list != list_tag:
+            tags.append(f"</{open_list}>")
+            open_list = None
+        if list_tag and open_list is None:
+            tags.append(f"<{list_tag}>")
+            open_list = list_tag
+
+        text = html.escape(text)
+        if kind == "heading":
+            tags.append(f"<h{level}>{text}</h{level}>")
+        elif list_tag:
+            value = f' value="{level}"' if kind == "numbered" else ""
+            tags.append(f"<li{value}>{text}</li>")
+        elif kind == "quote":
+            tags.append(f"<blockquote>{text}</blockquote>")
+        else:
+            tags.append(f"<p>{text}</p>")
+        out.write(("\n".join(tags) + "\n").encode("utf-8"))
+
+    if open_list:
+        out.write(f"</{open_list}>\n".encode("utf-8"))
+    out.write(b"</body>\n</html>\n")
+
+
+# Page geometry for the PDF export (A4, points)
+_PDF_PAGE_WIDTH = 595
+_PDF_PAGE_HEIGHT = 842
+_PDF_MARGIN = 56
+_PDF_FONT_SIZES = {1: 18, 2: 15, 3: 13, 4: 12}
+_PDF_BODY_SIZE = 11
+
+# Fixed PDF objects; page content and page objects are numbered after them
+_PDF_CATALOG_ID = 1
+_PDF_PAGES_ID = 2
+_PDF_FIXED_OBJECTS = {
+    _PDF_CATALOG_ID: b"<< /Type /Catalog /Pages 2 0 R >>",
+    3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    4: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+}
+
+
+def write_pdf(markdown: str, title: str, out: BinaryIO) -> None:
+    """Write Markdown content as a simple text PDF using the standard Helvetica fonts.
+
+    Each page is written as soon as it is full, so only one page is held in memory.
+    """
+    writer = _PdfWriter(out)
+    for object_id, body in _PDF_FIXED_OBJECTS.items():
+        writer.add(object_id, body)
+
+    page_ids = []
+    next_id = max(_PDF_FIXED_OBJECTS) + 1
+
+    def write_page(page):
+        nonlocal next_id
+        stream = '\n'.join(page).encode("cp1252", errors="replace")
+        writer.add(next_id, b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        writer.add(next_id + 1,
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+            b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>"
+            % (_PDF_PAGE_WIDTH, _PDF_PAGE_HEIGHT, next_id)
+        )
+        page_ids.append(next_id + 1)
+        next_id += 2
+
+    current = []
+    y = _PDF_PAGE_HEIGHT - _PDF_MARGIN
+    for font, size, text in _pdf_lines(markdown, title):
+        # Helvetica averages roughly half an em per character
+        max_chars = max(20, int((_PDF_PAGE_WIDTH - 2 * _PDF_MARGIN) / (size * 0.5)))
+        for wrapped in _wrap_text(text, max_chars):
+            if y - size * 1.4 < _PDF_MARGIN:
+                write_page(current)
+                current = []
+                y = _PDF_PAGE_HEIGHT - _PDF_MARGIN
+            y -= size * 1.4
+            current.append(f"BT /{font} {size} Tf {_PDF_MARGIN} {y:.1f} Td ({_pdf_escape(wrapped)}) Tj ET")
+        y -= size * 0.4
+    write_page(current)
+
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    writer.add(_PDF_PAGES_ID, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids)))
+    writer.finish(_PDF_CATALOG_ID)
+
+
+def _pdf_lines(markdown: str, title: str):
+    """Yield (font, size, text) for each line of the PDF export."""
+    yield "F2", _PDF_FONT_SIZES[1], title
+    for kind, level, text in _markdown_blocks(markdown):
+        if kind == "heading":
+            yield "F2", _PDF_FONT_SIZES[level], text
+        elif kind == "bullet":
+            yield "F1", _PDF_BODY_SIZE, f"• {text}"
+        elif kind == "numbered":
+            yield "F1", _PDF_BODY_SIZE, f"{level}. {text}"
+        else:
+            yield "F1", _PDF_BODY_SIZE, text
+
+
+class _PdfWriter:
+    """Writes numbered PDF objects as they come and the cross-reference table at the end."""
+
+    def __init__(self, out: BinaryIO):
+        self._out = out
+        self._position = 0
+        self._offsets: Dict[int, int] = {}
+        self._write(b"%PDF-1.4\n")
+
+    def add(self, object_id: int, body: bytes) -> None:
+        self._offsets[object_id] = self._position
+        self._write(b"%d 0 obj\n" % object_id + body + b"\nendobj\n")
+
+    def finish(self, root_id: int) -> None:
+        xref_offset = self._position
+        size = max(self._offsets) + 1
+        self._write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for object_id in range(1, size):
+            self._write(b"%010d 00000 n \n" % self._offsets[object_id])
+        self._write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, root_id, xref_offset))
+
+    def _write(self, data: bytes) -> None:
+        self._out.write(data)
+        self._position += len(data)
+
+
+def _wrap_text(text: str, max_chars: int) -> List[str]:
+    words = text.split()
+    if not words:
+        return [""]
+    wrapped = []
+    line = words[0]
+    for word in words[1:]:
+        if len(line) + 1 + len(word) > max_chars:
+            wrapped.append(line)
+            line = word
+        else:
+            line = f"{line} {word}"
+    wrapped.append(line)
+    return wrapped
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
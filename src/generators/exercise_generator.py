@@ -1,29 +1,233 @@
 from llm_handlers.api_handler import get_llm_response
-from docx import Document
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-import io
+from generators.schemas import ExerciseList, NoStructuredOutput, json_schema_for, parse_structured_response, structured_instructions, outline_context, course_context, language_instruction
+from generators.repair import parse_exercise_content, repair_exercise_content, repair_exercise_structure
+from generators.artifacts import DocumentArtifacts, apply_document_title, document_label, document_title, iter_lines
+from generators.large_documents import word_document
+from generators.stop_conditions import AnswerKeyComplete, JsonComplete
+from utils.question_bank import DEFAULT_LANGUAGE, get_question_bank
+import re
 
 def generate_exercises(params):
-    """Generate exercise list document"""
+    """Generate exercise list document
+    
+    With `use_question_bank`, the list is assembled from previously generated
+    questions in the output language and the LLM is only asked for the ones
+    the bank is missing.
+    """
+    
+    if params.get("use_question_bank"):
+        return _assemble_from_question_bank(params)
+    
+    result = _generate_exercises_with_llm(params)
+    if result["success"]:
+        _store_in_question_bank(params, result)
+    
+    return result
+
+def _generate_exercises_with_llm(params):
+    """Generate a complete exercise list with the LLM"""
+    
+    if params.get("structured_output"):
+        return _generate_structured_exercises(params)
     
     prompt = _build_exercise_prompt(params)
     
     try:
         # Get content from LLM
-        content = get_llm_response(prompt, params["llm_config"])
+        content = get_llm_response(
+            prompt,
+            params["llm_config"],
+            max_tokens=_output_token_budget(params),
+            stop_condition=AnswerKeyComplete(params["num_questions"])
+        )
+        
+        # Complete questions missing options or answers
+        content, repaired = repair_exercise_content(content, params)
+        
+        return {
+            "success": True,
+            "content": content,
+            "artifacts": _build_exercise_artifacts(content, params),
+            "repaired_units": repaired
+        }
+        
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+def render_exercises(content, params, structured=None):
+    """Build an exercise list result from existing content without calling the LLM"""
+    if structured:
+        content = _exercises_to_markdown(apply_document_title(structured, params))
+    return {
+        "success": True,
+        "content": content,
+        "artifacts": _build_exercise_artifacts(content, params)
+    }
+
+def _assemble_from_question_bank(params):
+    """Assemble an exercise list from the question bank, topping up from the LLM"""
+    
+    banked = get_question_bank().search(
+        params["subject"],
+        params["grade_level"],
+        params["topic"],
+        difficulty=params["difficulty"],
+        question_types=params["question_types"],
+        limit=params["num_questions"],
+        language=_bank_language(params)
+    )
+    questions = [{key: value for key, value in question.items() if key != "id"} for question in banked]
+    
+    missing = params["num_questions"] - len(questions)
+    warning = None
+    if missing > 0:
+        topup_params = {
+            **params,
+            "num_questions": missing,
+            "structured_output": True,
+            "exclude_questions": [question["question"] for question in questions]
+        }
+        topup = _generate_exercises_with_llm(topup_params)
+        if topup["success"]:
+            _store_in_question_bank(params, topup)
+            questions.extend(_questions_from_result(topup, params)[:missing])
+        elif not questions:
+            return topup
+        else:
+            warning = topup["error"]
+    
+    exercises = {
+        "title": document_title(params, "Exercise List"),
+        "introduction": "",
+        "sections": _group_questions_by_type(questions)
+    }
+    content = _exercises_to_markdown(exercises)
+    
+    result = {
+        "success": True,
+        "content": content,
+        "structured": exercises,
+        "artifacts": _build_exercise_artifacts(content, params),
+        "bank_questions": len(banked),
+        "generated_questions": len(questions) - len(banked)
+    }
+    if warning:
+        result["warning"] = warning
+    return result
+
+def _group_questions_by_type(questions):
+    """Group questions into one section per question type, keeping their order"""
+    
+    sections = {}
+    for question in questions:
+        section_title = question["type"] or "Questions"
+        sections.setdefault(section_title, {"title": section_title, "instructions": "", "questions": []})
+        sections[section_title]["questions"].append(question)
+    
+    return list(sections.values())
+
+def _store_in_question_bank(params, result):
+    """Add a generation's questions to the question bank; never fails the generation"""
+    
+    try:
+        get_question_bank().add_questions(
+            {
+                "subject": params["subject"],
+                "grade_level": params["grade_level"],
+                "difficulty": params["difficulty"],
+                "topic": params["topic"],
+                "language": _bank_language(params)
+            },
+            _questions_from_result(result, params)
+        )
+    except Exception as e:
+        print(f"Warning: Could not store questions in the question bank: {e}")
+
+def _bank_language(params):
+    """Language the questions of a generation are banked and searched under"""
+    return params.get("output_language") or DEFAULT_LANGUAGE
+
+def _questions_from_result(result, params):
+    """Extract question dicts from a structured or Markdown generation result"""
+    
+    if result.get("structured"):
+        return [
+            question
+            for section in result["structured"]["sections"]
+            for question in section["questions"]
+        ]
+    
+    questions, answer_lines, _ = parse_exercise_content(result["content"])
+    return [
+        {
+            "type": _guess_question_type(question, params["question_types"]),
+            "question": question["question"],
+            "options": question["options"],
+            "answer": answer_lines.get(question["number"], (None, ""))[1],
+            "solution": ""
+        }
+        for question in questions
+    ]
+
+def _guess_question_type(question, question_types):
+    """Match a Markdown question's section heading to one of the requested types"""
+    
+    section = question["section"].lower()
+    for question_type in question_types:
+        if section and (question_type.lower() in section or section in question_type.lower()):
+            return question_type
+    if len(question_types) == 1:
+        return question_types[0]
+    return question["section"]
+
+def _generate_structured_exercises(params):
+    """Generate exercise list document from schema-validated JSON output"""
+    
+    schema = json_schema_for(ExerciseList)
+    prompt = _build_structured_exercise_prompt(params, schema)
+    
+    try:
+        raw_content = get_llm_response(
+            prompt,
+            params["llm_config"],
+            json_schema=schema,
+            max_tokens=_output_token_budget(params),
+            stop_condition=JsonComplete()
+        )
         
-        # Create Word document
-        docx_file = _create_exercise_docx(content, params)
+        try:
+            exercises = parse_structured_response(raw_content, ExerciseList)
+        except NoStructuredOutput:
+            # Model ignored the JSON instructions, render the text as Markdown
+            content, repaired = repair_exercise_content(raw_content, params)
+            return {
+                "success": True,
+                "content": content,
+                "artifacts": _build_exercise_artifacts(content, params),
+                "repaired_units": repaired
+            }
+        
+        structured = exercises.model_dump()
+        repaired = repair_exercise_structure(structured, params)
+        content = _exercises_to_markdown(apply_document_title(structured, params))
         
         return {
             "success": True,
             "content": content,
-            "docx_file": docx_file
+            "structured": structured,
+            "artifacts": _build_exercise_artifacts(content, params),
+            "repaired_units": repaired
         }
         
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+def _output_token_budget(params):
+    """Expected size of the generated exercise list, in tokens"""
+    # Question, options and worked answer per question; JSON adds its keys on top
+    per_question = 250 if params.get("structured_output") else 200
+    return 300 + params['num_questions'] * per_question
+
 def _build_exercise_prompt(params):
     """Build prompt for exercise generation"""
     
@@ -31,6 +235,9 @@ def _build_exercise_prompt(params):
     Create a comprehensive exercise list for {params['subject']} at {params['grade_level']} level.
     
     Topic: {params['topic']}
+    {outline_context(params)}
+    {course_context(params)}
+    {language_instruction(params)}
     Number of questions: {params['num_questions']}
     Difficulty: {params['difficulty']}
     Question types: {', '.join(params['question_types'])}
@@ -62,34 +269,112 @@ def _build_exercise_prompt(params):
     
     return prompt
 
-def _create_exercise_docx(content, params):
-    """Create Word document from exercise content"""
+def _build_structured_exercise_prompt(params, schema):
+    """Build prompt for exercise generation as JSON"""
     
-    doc = Document()
+    prompt = f"""
+    Create a comprehensive exercise list for {params['subject']} at {params['grade_level']} level.
     
-    # Title
-    title = doc.add_heading(f"{params['subject']} - Exercise List", 0)
-    title.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER  # Center alignment
+    Topic: {params['topic']}
+    {outline_context(params)}
+    {course_context(params)}
+    {language_instruction(params)}
+    Number of questions: {params['num_questions']}
+    Difficulty: {params['difficulty']}
+    Question types: {', '.join(params['question_types'])}
     
-    # Subtitle
-    doc.add_heading(f"Topic: {params['topic']}", level=2)
-    doc.add_heading(f"Grade Level: {params['grade_level']}", level=3)
+    Return exactly {params['num_questions']} questions in total, grouped into "sections".
+    - Give the list a "title" and a brief "introduction" to the topic
+    - Each section has a "title", clear "instructions" and its "questions"
+    - Organize sections by question type, or by difficulty if mixed difficulty is selected
+    - Each question has a "type" (one of the question types above), the "question" text and its "answer"
+    - Multiple choice questions must have exactly 4 "options" (A, B, C, D) and the correct letter as "answer"
+    - Other question types use an empty "options" list
+    - Problem-solving questions include a step-by-step "solution"
+    {_excluded_questions_context(params)}
+    Make sure the content is age-appropriate and educationally valuable.
+    {structured_instructions(schema)}
+    """
     
-    # Add content with proper markdown formatting
-    _add_formatted_content_to_docx(doc, content)
+    return prompt
+
+def _excluded_questions_context(params):
+    """Prompt fragment listing questions the new ones must not repeat"""
+    
+    if not params.get("exclude_questions"):
+        return ""
+    existing = '\n'.join(f"    - {question}" for question in params["exclude_questions"])
+    return f"""
+    The list already contains these questions; write different ones:
+{existing}
+    """
+
+def _exercises_to_markdown(exercises):
+    """Render structured exercises as Markdown, ending with an answer key"""
+    
+    lines = [f"# {exercises['title']}", ""]
+    if exercises['introduction']:
+        lines.extend([exercises['introduction'], ""])
+    
+    answers = []
+    number = 0
+    for section in exercises['sections']:
+        lines.extend([f"## {section['title']}", ""])
+        if section['instructions']:
+            lines.extend([section['instructions'], ""])
+        
+        for question in section['questions']:
+            number += 1
+            lines.append(f"{number}. {question['question']}")
+            for letter, option in zip("ABCDEFGH", question['options']):
+                # Keep the model's own labels if it already lettered the options
+                if re.match(r'^[A-Ha-h][\).:]\s', option):
+                    lines.append(f"   {option}")
+                else:
+                    lines.append(f"   {letter}) {option}")
+            lines.append("")
+            
+            answer = question['answer']
+            if question['solution']:
+                answer = f"{answer} - {question['solution']}" if answer else question['solution']
+            answers.append(f"{number}. {answer}")
     
-    # Save to bytes
-    doc_io = io.BytesIO()
-    doc.save(doc_io)
-    doc_io.seek(0)
+    lines.extend(["## Answer Key", ""])
+    lines.extend(answers)
     
-    return doc_io.getvalue()
+    return '\n'.join(lines)
+
+def _build_exercise_artifacts(content, params):
+    """Downloadable files for an exercise list, rendered on demand"""
+    return DocumentArtifacts(
+        document_title(params, "Exercise List"),
+        content,
+        {"docx": lambda out: _create_exercise_docx(content, params, out)}
+    )
+
+def _create_exercise_docx(content, params, out):
+    """Write the Word document for exercise content to a file"""
+    
+    # python-docx is only loaded once a document is actually rendered
+    from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+    
+    # Very large documents are streamed instead of built in memory
+    with word_document(out, len(content)) as doc:
+        
+        # Title
+        title = doc.add_heading(document_title(params, "Exercise List"), 0)
+        title.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER  # Center alignment
+        
+        # Subtitle
+        doc.add_heading(f"{document_label(params, 'Topic')}: {params['topic']}", level=2)
+        doc.add_heading(f"{document_label(params, 'Grade Level')}: {params['grade_level']}", level=3)
+        
+        # Add content with proper markdown formatting
+        _add_formatted_content_to_docx(doc, content)
 
 def _add_formatted_content_to_docx(doc, content):
     """Add formatted content to Word document, parsing Markdown formatting"""
-    lines = content.split('\n')
-    
-    for i, line in enumerate(lines):
+    for line in iter_lines(content):
         line = line.strip()
         if not line:
             doc.add_paragraph("")
@@ -0,0 +1,270 @@
+"""
+Bounded-memory rendering of very large documents.
+python-docx and python-pptx keep the whole document tree in memory and slow
+down as it grows. Above a size threshold, Word documents are instead written
+paragraph by paragraph straight into the output zip, and presentations are
+built in sections of slides whose parts are copied into the output as each
+section is done, so memory stays flat however large the document is.
+"""
+
+import io
+import os
+import re
+import threading
+import zipfile
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional
+from xml.sax.saxutils import escape
+
+# Defaults, overridable through the environment
+DEFAULT_LARGE_DOCUMENT_CHARS = 100_000
+DEFAULT_LARGE_PRESENTATION_SLIDES = 100
+
+# Slides built together when a presentation is rendered in sections
+PRESENTATION_SECTION_SLIDES = 50
+
+# python-docx paragraph alignments by their enum value
+_ALIGNMENTS = {0: "left", 1: "center", 2: "right", 3: "both"}
+# Characters python-docx would reject in text
+_INVALID_XML_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_docx_template = None
+_docx_template_lock = threading.Lock()
+
+
+def large_document_chars() -> int:
+    """Content length from which Word documents are streamed."""
+    return int(os.getenv("EDUADOCS_LARGE_DOCUMENT_CHARS") or DEFAULT_LARGE_DOCUMENT_CHARS)
+
+
+def large_presentation_slides() -> int:
+    """Slide count from which presentations are rendered in sections."""
+    return int(os.getenv("EDUADOCS_LARGE_PRESENTATION_SLIDES") or DEFAULT_LARGE_PRESENTATION_SLIDES)
+
+
+@contextmanager
+def word_document(out: BinaryIO, content_chars: int) -> Iterator[Any]:
+    """
+    A Word document that is saved to `out` when the block ends.
+
+    Small documents are python-docx Documents; from `large_document_chars()`
+    of content it is a StreamingDocument offering the same add_heading and
+    add_paragraph methods.
+    """
+    if content_chars >= large_document_chars():
+        with StreamingDocument(out) as doc:
+            yield doc
+        return
+
+    from docx import Document
+    doc = Document()
+    yield doc
+    doc.save(out)
+
+
+class _Paragraph:
+    """A paragraph not yet written, so its alignment can still be set as with python-docx."""
+
+    def __init__(self, text: str, style_id: Optional[str]):
+        self.text = text
+        self.style_id = style_id
+        self.alignment = None
+
+    def to_xml(self) -> str:
+        properties = ""
+        if self.style_id:
+            properties += f'<w:pStyle w:val="{self.style_id}"/>'
+        if self.alignment is not None:
+            properties += f'<w:jc w:val="{_ALIGNMENTS[int(self.alignment)]}"/>'
+        if properties:
+            properties = f"<w:pPr>{properties}</w:pPr>"
+
+        text = _INVALID_XML_CHARS.sub("", self.text)
+        if not text:
+            return f"<w:p>{properties}</w:p>" if properties else "<w:p/>"
+        pieces = []
+        for index, piece in enumerate(text.split("\t")):
+            if index:
+                pieces.append("<w:tab/>")
+            if piece:
+                space = ' xml:space="preserve"' if piece != piece.strip() else ""
+                pieces.append(f"<w:t{space}>{escape(piece)}</w:t>")
+        return f"<w:p>{properties}<w:r>{''.join(pieces)}</w:r></w:p>"
+
+
+class StreamingDocument:
+    """Word document written paragraph by paragraph into a zip, using python-docx's default template."""
+
+    def __init__(self, out: BinaryIO):
+        self._out = out
+        self._package = None
+        self._body = None
+        self._pending = None
+
+    def __enter__(self):
+        template = _get_docx_template()
+        self._styles = template["styles"]
+        self._package = zipfile.ZipFile(self._out, "w", zipfile.ZIP_DEFLATED)
+        for name, data in template["parts"].items():
+            self._package.writestr(name, data)
+        self._body = io.TextIOWrapper(self._package.open("word/document.xml", "w"), encoding="utf-8")
+        self._body.write(template["head"])
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            if exc_type is None:
+                self._flush()
+                self._body.write(_get_docx_template()["tail"])
+            self._body.close()
+        finally:
+            self._package.close()
+
+    def add_heading(self, text: str = "", level: int = 1) -> _Paragraph:
+        return self.add_paragraph(text, "Title" if level == 0 else f"Heading {level}")
+
+    def add_paragraph(self, text: str = "", style: Optional[str] = None) -> _Paragraph:
+        self._flush()
+        style_id = self._styles.get(style.lower(), style.replace(" ", "")) if style else None
+        self._pending = _Paragraph(text, style_id)
+        return self._pending
+
+    def _flush(self) -> None:
+        if self._pending is not None:
+            self._body.write(self._pending.to_xml())
+            self._pending = None
+
+
+def _get_docx_template() -> Dict[str, Any]:
+    """Parts of python-docx's empty default document, split around the body content."""
+    global _docx_template
+    with _docx_template_lock:
+        if _docx_template is None:
+            from docx import Document
+
+            empty = io.BytesIO()
+            Document().save(empty)
+            with zipfile.ZipFile(empty) as package:
+                parts = {name: package.read(name) for name in package.namelist()}
+            document = parts.pop("word/document.xml").decode("utf-8")
+            body_start = document.index("<w:body>") + len("<w:body>")
+            styles = {
+                name.lower(): style_id
+                for style_id, name in re.findall(
+                    r'<w:style\b[^>]*w:styleId="([^"]+)"[^>]*>\s*<w:name w:val="([^"]+)"',
+                    parts["word/styles.xml"].decode("utf-8")
+                )
+            }
+            _docx_template = {
+                "parts": parts,
+                "head": document[:body_start],
+                "tail": document[body_start:],
+                "styles": styles
+            }
+        return _docx_template
+
+
+# Presentation parts that belong to one slide, with the number in their name
+_SLIDE_PART = re.compile(r'^ppt/slides/(?:_rels/)?slide(\d+)\.xml(?:\.rels)?$')
+_NOTES_PART = re.compile(r'^ppt/notesSlides/(?:_rels/)?notesSlide(\d+)\.xml(?:\.rels)?$')
+_SLIDE_TARGET = re.compile(r'(?<=slides/slide)(\d+)(?=\.xml)')
+_NOTES_TARGET = re.compile(r'(?<=notesSlides/notesSlide)(\d+)(?=\.xml)')
+_RELATIONSHIP_ID = re.compile(r'^rId(\d+)$')
+
+
+def write_presentation_in_sections(out: BinaryIO, slides: List[Any],
+                                   render_section: Callable[[List[Any], BinaryIO], None],
+                                   section_slides: int = PRESENTATION_SECTION_SLIDES) -> None:
+    """
+    Write a presentation built `section_slides` slides at a time.
+
+    `render_section(slides, out)` saves a complete presentation of the given
+    slides from the same base template, with a notes master, so all sections
+    share their non-slide parts. The slides and notes of every section are
+    renumbered into the output, and the presentation part, its
+    relationships and the content types are written last for all slides.
+    """
+    from lxml import etree
+    from pptx.opc.constants import CONTENT_TYPE, RELATIONSHIP_TYPE
+
+    slide_count = 0
+    notes_count = 0
+    shared = None
+
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as package:
+        for start in range(0, len(slides), section_slides):
+            section = io.BytesIO()
+            render_section(slides[start:start + section_slides], section)
+
+            with zipfile.ZipFile(section) as source:
+                if shared is None:
+                    shared = {
+                        name: source.read(name)
+                        for name in ("[Content_Types].xml", "ppt/presentation.xml", "ppt/_rels/presentation.xml.rels")
+                    }
+                    for name in source.namelist():
+                        if name not in shared and not _SLIDE_PART.match(name) and not _NOTES_PART.match(name):
+                            package.writestr(name, source.read(name))
+
+                def slide_number(match, offset=slide_count):
+                    return str(offset + int(match.group(1)))
+
+                def notes_number(match, offset=notes_count):
+                    return str(offset + int(match.group(1)))
+
+                section_notes = 0
+                for name in source.namelist():
+                    slide_match = _SLIDE_PART.match(name)
+                    notes_match = _NOTES_PART.match(name)
+                    if not slide_match and not notes_match:
+                        continue
+                    data = source.read(name)
+                    if name.endswith(".rels"):
+                        text = data.decode("utf-8")
+                        text = _SLIDE_TARGET.sub(slide_number, text)
+                        data = _NOTES_TARGET.sub(notes_number, text).encode("utf-8")
+                    match = slide_match or notes_match
+                    offset = slide_count if slide_match else notes_count
+                    if notes_match:
+                        section_notes = max(section_notes, int(notes_match.group(1)))
+                    package.writestr(f"{name[:match.start(1)]}{offset + int(match.group(1))}{name[match.end(1):]}", data)
+
+            slide_count += min(section_slides, len(slides) - start)
+            notes_count += section_notes
+
+        # Relationships from the presentation to every slide
+        rels = etree.fromstring(shared["ppt/_rels/presentation.xml.rels"])
+        for rel in list(rels):
+            if rel.get("Type") == RELATIONSHIP_TYPE.SLIDE:
+                rels.remove(rel)
+        next_rid = 1 + max((int(match.group(1)) for match in (_RELATIONSHIP_ID.match(rel.get("Id")) for rel in rels) if match), default=0)
+        slide_rids = []
+        for number in range(1, slide_count + 1):
+            rid = f"rId{next_rid + number - 1}"
+            etree.SubElement(rels, rels.tag.replace("Relationships", "Relationship"),
+                             Id=rid, Type=RELATIONSHIP_TYPE.SLIDE, Target=f"slides/slide{number}.xml")
+            slide_rids.append(rid)
+        package.writestr("ppt/_rels/presentation.xml.rels", etree.tostring(rels, xml_declaration=True, encoding="UTF-8", standalone=True))
+
+        # The slide list in presentation order
+        presentation = etree.fromstring(shared["ppt/presentation.xml"])
+        namespaces = {"p": presentation.nsmap["p"], "r": presentation.nsmap["r"]}
+        slide_list = presentation.find("p:sldIdLst", namespaces)
+        for slide_id in list(slide_list):
+            slide_list.remove(slide_id)
+        for index, rid in enumerate(slide_rids):
+            slide_id = etree.SubElement(slide_list, f"{{{namespaces['p']}}}sldId", id=str(256 + index))
+            slide_id.set(f"{{{namespaces['r']}}}id", rid)
+        package.writestr("ppt/presentation.xml", etree.tostring(presentation, xml_declaration=True, encoding="UTF-8", standalone=True))
+
+        # Content types of every slide and notes slide
+        types = etree.fromstring(shared["[Content_Types].xml"])
+        override_tag = f"{{{types.nsmap[None]}}}Override"
+        for override in list(types):
+            if override.get("ContentType") in (CONTENT_TYPE.PML_SLIDE, CONTENT_TYPE.PML_NOTES_SLIDE):
+                types.remove(override)
+        for number in range(1, slide_count + 1):
+            etree.SubElement(types, override_tag, PartName=f"/ppt/slides/slide{number}.xml", ContentType=CONTENT_TYPE.PML_SLIDE)
+        for number in range(1, notes_count + 1):
+            etree.SubElement(types, override_tag, PartName=f"/ppt/notesSlides/notesSlide{number}.xml", ContentType=CONTENT_TYPE.PML_NOTES_SLIDE)
+        package.writestr("[Content_Types].xml", etree.tostring(types, xml_declaration=True, encoding="UTF-8", standalone=True))
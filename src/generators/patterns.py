@@ -0,0 +1,15 @@
+"""
+Patterns for recognising the structure of generated exercise Markdown.
+Shared by the repair pass and the streaming stop conditions.
+"""
+
+import re
+
+# Question types answered by picking an option (English and Portuguese)
+MULTIPLE_CHOICE_PATTERN = re.compile(r'multiple[\s-]*choice|m[úu]ltipla\s+escolha', re.IGNORECASE)
+# Heading text of an answer key section
+ANSWER_KEY_PATTERN = re.compile(r'answer\s*key|answers|gabarito|respostas', re.IGNORECASE)
+# Numbered question or answer key entry: "3. ..." or "3) ..."
+QUESTION_PATTERN = re.compile(r'^(\d+)[\.\)]\s+(.+)')
+# Lettered answer option: "A) ...", "- (b) ...", "C. ..."
+OPTION_PATTERN = re.compile(r'^(?:[-*•]\s+)?\(?([A-Ha-h])[\)\.:]\s+(.+)')
@@ -1,34 +1,109 @@
 from llm_handlers.api_handler import get_llm_response
-from pptx import Presentation
-from pptx.util import Inches
-from pptx.enum.text import PP_ALIGN
+from generators.schemas import PresentationOutline, NoStructuredOutput, json_schema_for, parse_structured_response, structured_instructions, outline_context, course_context, language_instruction
+from generators.repair import repair_slides
+from generators.artifacts import DocumentArtifacts, document_title, iter_lines
+from generators.large_documents import large_presentation_slides, write_presentation_in_sections
+from generators.stop_conditions import JsonComplete, SlidesComplete
+from pathlib import Path
+import hashlib
 import io
 import re
 
+# Base presentations keyed by template, each with its precomputed layout map
+_TEMPLATE_CACHE = {}
+_TEMPLATE_CACHE_SIZE = 8
+
 def generate_powerpoint(params):
     """Generate PowerPoint presentation"""
     
+    if params.get("structured_output"):
+        return _generate_structured_powerpoint(params)
+    
     prompt = _build_powerpoint_prompt(params)
     
     try:
         # Get content from LLM
-        content = get_llm_response(prompt, params["llm_config"])
+        content = get_llm_response(
+            prompt,
+            params["llm_config"],
+            max_tokens=_output_token_budget(params),
+            stop_condition=SlidesComplete(params["num_slides"], params["include_images"])
+        )
         
         if not content or content.strip() == "":
             return {"success": False, "error": "LLM returned empty content"}
         
-        # Create PowerPoint file
-        pptx_file = _create_powerpoint_pptx(content, params)
+        return _build_powerpoint_result(content, params)
         
+    except Exception as e:
+        return {"success": False, "error": f"PowerPoint generation failed: {str(e)}"}
+
+def render_powerpoint(content, params, structured=None):
+    """Build a presentation result from existing slide text without calling the LLM"""
+    slides_data = structured["slides"] if structured else _parse_powerpoint_content(content)
+    return {
+        "success": True,
+        "content": content,
+        "artifacts": _build_powerpoint_artifacts(slides_data, params)
+    }
+
+def _build_powerpoint_result(content, params):
+    """Parse text content and repair defective slides"""
+    
+    slides_data = _parse_powerpoint_content(content)
+    repaired = repair_slides(slides_data, params)
+    if repaired:
+        content = _slides_to_text(slides_data)
+    
+    return {
+        "success": True,
+        "content": content,
+        "artifacts": _build_powerpoint_artifacts(slides_data, params),
+        "repaired_units": repaired
+    }
+
+def _generate_structured_powerpoint(params):
+    """Generate PowerPoint presentation from schema-validated JSON output"""
+    
+    schema = json_schema_for(PresentationOutline)
+    prompt = _build_structured_powerpoint_prompt(params, schema)
+    
+    try:
+        raw_content = get_llm_response(
+            prompt,
+            params["llm_config"],
+            json_schema=schema,
+            max_tokens=_output_token_budget(params),
+            stop_condition=JsonComplete()
+        )
+        
+        if not raw_content or raw_content.strip() == "":
+            return {"success": False, "error": "LLM returned empty content"}
+        
+        try:
+            outline = parse_structured_response(raw_content, PresentationOutline)
+        except NoStructuredOutput:
+            # Model ignored the JSON instructions, fall back to text parsing
+            return _build_powerpoint_result(raw_content, params)
+        
+        slides_data = [slide.model_dump() for slide in outline.slides]
+        repaired = repair_slides(slides_data, params)
         return {
             "success": True,
-            "content": content,
-            "pptx_file": pptx_file
+            "content": _slides_to_text(slides_data),
+            "structured": {"slides": slides_data},
+            "artifacts": _build_powerpoint_artifacts(slides_data, params),
+            "repaired_units": repaired
         }
         
     except Exception as e:
         return {"success": False, "error": f"PowerPoint generation failed: {str(e)}"}
 
+def _output_token_budget(params):
+    """Expected size of the generated slides, in tokens"""
+    # Title, bullets, speaker notes and image suggestion per slide
+    return 200 + params['num_slides'] * 150
+
 def _build_powerpoint_prompt(params):
     """Build prompt for PowerPoint generation"""
     
@@ -36,6 +111,9 @@ def _build_powerpoint_prompt(params):
     Create a {params['num_slides']}-slide PowerPoint presentation outline for {params['subject']} at {params['grade_level']} level.
     
     Topic: {params['topic']}
+    {outline_context(params)}
+    {course_context(params)}
+    {language_instruction(params)}
     Presentation style: {params['presentation_style']}
     Include images: {params['include_images']}
     
@@ -70,14 +148,82 @@ def _build_powerpoint_prompt(params):
     
     return prompt
 
-def _create_powerpoint_pptx(content, params):
-    """Create PowerPoint file from content"""
+def _build_structured_powerpoint_prompt(params, schema):
+    """Build prompt for PowerPoint generation as JSON"""
+    
+    prompt = f"""
+    Create a {params['num_slides']}-slide PowerPoint presentation outline for {params['subject']} at {params['grade_level']} level.
+    
+    Topic: {params['topic']}
+    {outline_context(params)}
+    {course_context(params)}
+    {language_instruction(params)}
+    Presentation style: {params['presentation_style']}
+    
+    Return exactly {params['num_slides']} objects in "slides". For each slide:
+    - "title": the slide title
+    - "bullets": 3-5 concise bullet points
+    - "notes": speaker notes for the slide
+    - "image": {'a description of a relevant image' if params['include_images'] else 'an empty string'}
+    
+    Guidelines:
+    - Make content appropriate for {params['grade_level']} level
+    - Use {params['presentation_style']} style
+    - Include practical examples when possible
+    - Ensure logical flow between slides
+    {structured_instructions(schema)}
+    """
+    
+    return prompt
+
+def _slides_to_text(slides_data):
+    """Render slide data in the SLIDE/NOTES/IMAGE text format used for previews"""
+    
+    blocks = []
+    for number, slide in enumerate(slides_data, start=1):
+        lines = [f"SLIDE {number}: {slide['title']}"]
+        lines.extend(f"- {bullet}" for bullet in slide['bullets'])
+        if slide['notes']:
+            lines.append(f"NOTES: {slide['notes']}")
+        if slide['image']:
+            lines.append(f"IMAGE: {slide['image']}")
+        blocks.append('\n'.join(lines))
+    
+    return '\n\n'.join(blocks)
+
+def _slides_to_markdown(slides_data):
+    """Render slide data as Markdown for the text-based exports"""
+    
+    lines = []
+    for slide in slides_data:
+        lines.extend([f"## {slide['title']}", ""])
+        lines.extend(f"- {bullet}" for bullet in slide['bullets'])
+        if slide.get('notes'):
+            lines.extend(["", f"> {slide['notes']}"])
+        if slide.get('image'):
+            lines.extend(["", f"Image: {slide['image']}"])
+        lines.append("")
+    
+    return '\n'.join(lines).strip()
+
+def _build_powerpoint_artifacts(slides_data, params):
+    """Downloadable files for a presentation, rendered on demand"""
+    return DocumentArtifacts(
+        document_title(params, "Presentation"),
+        _slides_to_markdown(slides_data),
+        {"pptx": lambda out: _create_powerpoint_pptx(None, params, out, slides_data=slides_data)}
+    )
+
+def _create_powerpoint_pptx(content, params, out, slides_data=None):
+    """Write a PowerPoint file from content, or from already parsed slide data"""
     
     try:
-        prs = Presentation()
+        # Start from the cached base presentation for the selected template
+        template_bytes, layout_map = _get_base_template(params.get("pptx_template"))
         
         # Parse content and create slides
-        slides_data = _parse_powerpoint_content(content)
+        if slides_data is None:
+            slides_data = _parse_powerpoint_content(content)
         
         if not slides_data:
             # Create a fallback slide if parsing fails
@@ -88,78 +234,161 @@ def _create_powerpoint_pptx(content, params):
                 'image': ''
             }]
         
-        for slide_data in slides_data:
-            # Use title and content layout
-            slide_layout = prs.slide_layouts[1]  # Title and Content layout
-            slide = prs.slides.add_slide(slide_layout)
-            
-            # Set title - check if title placeholder exists
-            if slide.shapes.title:
-                slide.shapes.title.text = slide_data.get('title', 'Slide Title')
-            
-            # Add content using a more robust approach
-            bullets = slide_data.get('bullets', [])
-            
-            # Find the content placeholder
-            content_shape = None
-            for shape in slide.shapes:
-                if hasattr(shape, 'placeholder_format') and shape.placeholder_format.idx == 1:
-                    content_shape = shape
-                    break
-            
-            # If we found the content placeholder, add text to it
-            if content_shape:
-                try:
-                    # Access text_frame safely with getattr
-                    tf = getattr(content_shape, 'text_frame', None)
-                    if tf:
-                        tf.clear()
-                        
-                        if bullets:
-                            # Set the first bullet point
-                            tf.text = bullets[0]
-                            
-                            # Add additional bullet points
-                            for bullet in bullets[1:]:
-                                p = tf.add_paragraph()
-                                p.text = bullet
-                                p.level = 0
-                        else:
-                            tf.text = "No content available"
-                    else:
-                        raise AttributeError("No text_frame available")
-                        
-                except (AttributeError, Exception):
-                    # If text_frame doesn't exist, add a text box instead
-                    _add_text_box_to_slide(slide, bullets)
-            else:
-                # No content placeholder found, add a text box
-                _add_text_box_to_slide(slide, bullets)
-            
-            # Add speaker notes if available
-            notes_text = slide_data.get('notes', '')
-            if notes_text:
-                try:
-                    notes_slide = slide.notes_slide
-                    if notes_slide and hasattr(notes_slide, 'notes_text_frame'):
-                        text_frame = notes_slide.notes_text_frame
-                        if text_frame:
-                            text_frame.text = notes_text
-                except Exception:
-                    pass  # Skip notes if there's an issue
-        
-        # Save to bytes
-        pptx_io = io.BytesIO()
-        prs.save(pptx_io)
-        pptx_io.seek(0)
-        
-        return pptx_io.getvalue()
+        if len(slides_data) < large_presentation_slides():
+            _save_slides(template_bytes, layout_map, slides_data, out)
+        else:
+            # Very large decks are built a section at a time so the whole
+            # slide tree is never held in memory
+            write_presentation_in_sections(
+                out,
+                slides_data,
+                lambda section, section_out: _save_slides(template_bytes, layout_map, section, section_out, notes_master=True)
+            )
         
     except Exception as e:
         raise Exception(f"Failed to create PowerPoint file: {str(e)}")
 
+def _save_slides(template_bytes, layout_map, slides_data, out, notes_master=False):
+    """Save a presentation of the given slides on the base template to a file"""
+    
+    # python-pptx is only loaded once a presentation is actually rendered
+    from pptx import Presentation
+    
+    prs = Presentation(io.BytesIO(template_bytes))
+    slide_layout = prs.slide_layouts[layout_map["layout_index"]]
+    title_pos = layout_map["title_pos"]
+    body_pos = layout_map["body_pos"]
+    
+    if notes_master:
+        # Every section then has the same shared parts, notes or not
+        prs.notes_master
+    
+    for slide_data in slides_data:
+        slide = prs.slides.add_slide(slide_layout)
+        
+        # New slides hold the layout's cloned placeholders in layout order,
+        # so the precomputed positions index straight into the shape tree
+        shapes = slide.shapes
+        
+        if title_pos is not None:
+            shapes[title_pos].text_frame.text = slide_data.get('title', 'Slide Title')
+        
+        bullets = slide_data.get('bullets', [])
+        
+        if body_pos is not None:
+            _fill_text_frame(shapes[body_pos].text_frame, bullets)
+        else:
+            # Template has no content placeholder, add a text box
+            _add_text_box_to_slide(slide, bullets)
+        
+        # Add speaker notes if available
+        notes_text = slide_data.get('notes', '')
+        if notes_text:
+            try:
+                slide.notes_slide.notes_text_frame.text = notes_text
+            except Exception:
+                pass  # Skip notes if there's an issue
+    
+    prs.save(out)
+
+def _get_base_template(template=None):
+    """Return cached (template bytes, layout map) for a template.
+    
+    `template` may be None for the python-pptx default, a path to a custom
+    .pptx school template, or the raw bytes of an uploaded template.
+    """
+    from pptx import Presentation
+    
+    if template is None:
+        cache_key = None
+    elif isinstance(template, (bytes, bytearray)):
+        template = bytes(template)
+        cache_key = hashlib.sha1(template).hexdigest()
+    else:
+        template_path = Path(template)
+        cache_key = (str(template_path.resolve()), template_path.stat().st_mtime)
+    
+    cached = _TEMPLATE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    if template is None:
+        prs = Presentation()
+    elif isinstance(template, bytes):
+        prs = Presentation(io.BytesIO(template))
+    else:
+        prs = Presentation(str(template_path))
+    
+    # Keep only the theme and layouts, not any sample slides in the template
+    slide_id_list = prs.slides._sldIdLst
+    for slide_id in list(slide_id_list):
+        prs.part.drop_rel(slide_id.rId)
+        slide_id_list.remove(slide_id)
+    
+    layout_map = _build_layout_map(prs)
+    
+    base_io = io.BytesIO()
+    prs.save(base_io)
+    cached = (base_io.getvalue(), layout_map)
+    
+    if len(_TEMPLATE_CACHE) >= _TEMPLATE_CACHE_SIZE:
+        _TEMPLATE_CACHE.pop(next(iter(_TEMPLATE_CACHE)))
+    _TEMPLATE_CACHE[cache_key] = cached
+    
+    return cached
+
+def _build_layout_map(prs):
+    """Pick the title-and-content layout and record its placeholder positions"""
+    from pptx.enum.shapes import PP_PLACEHOLDER
+    
+    title_types = (PP_PLACEHOLDER.TITLE, PP_PLACEHOLDER.CENTER_TITLE)
+    body_types = (PP_PLACEHOLDER.BODY, PP_PLACEHOLDER.OBJECT)
+    
+    fallback = None
+    for layout_index, layout in enumerate(prs.slide_layouts):
+        title_pos = None
+        body_pos = None
+        for pos, placeholder in enumerate(layout.iter_cloneable_placeholders()):
+            ph_type = placeholder.placeholder_format.type
+            if ph_type in title_types and title_pos is None:
+                title_pos = pos
+            elif ph_type in body_types and body_pos is None:
+                body_pos = pos
+        
+        layout_map = {
+            "layout_index": layout_index,
+            "title_pos": title_pos,
+            "body_pos": body_pos
+        }
+        if title_pos is not None and body_pos is not None:
+            return layout_map
+        if fallback is None and title_pos is not None:
+            fallback = layout_map
+    
+    if fallback is None:
+        raise ValueError("Template has no slide layout with a title placeholder")
+    return fallback
+
+def _fill_text_frame(text_frame, bullets):
+    """Write bullet points into a text frame"""
+    text_frame.clear()
+    
+    if bullets:
+        # Set the first bullet point
+        text_frame.text = bullets[0]
+        
+        # Add additional bullet points
+        for bullet in bullets[1:]:
+            p = text_frame.add_paragraph()
+            p.text = bullet
+            p.level = 0
+    else:
+        text_frame.text = "No content available"
+
 def _add_text_box_to_slide(slide, bullets):
     """Add a text box with bullet points to a slide"""
+    from pptx.util import Inches
+    
     try:
         left = Inches(1)
         top = Inches(2)
@@ -167,16 +396,7 @@ def _add_text_box_to_slide(slide, bullets):
         height = Inches(5)
         
         textbox = slide.shapes.add_textbox(left, top, width, height)
-        text_frame = textbox.text_frame
-        
-        if bullets:
-            text_frame.text = bullets[0]
-            for bullet in bullets[1:]:
-                p = text_frame.add_paragraph()
-                p.text = bullet
-                p.level = 0
-        else:
-            text_frame.text = "No content available"
+        _fill_text_frame(textbox.text_frame, bullets)
     except Exception:
         pass  # Skip if text box creation fails
 
@@ -186,9 +406,7 @@ def _parse_powerpoint_content(content):
     slides = []
     current_slide = None
     
-    lines = content.split('\n')
-    
-    for line in lines:
+    for line in iter_lines(content):
         line = line.strip()
         
         # Look for slide markers with various formats
@@ -240,7 +458,7 @@ def _parse_powerpoint_content(content):
     # If no slides were parsed, create a fallback slide with the raw content
     if not slides:
         # Try to extract some meaningful content
-        content_lines = [line.strip() for line in lines if line.strip() and not line.strip().startswith('#')]
+        content_lines = [line.strip() for line in iter_lines(content) if line.strip() and not line.strip().startswith('#')]
         bullets = content_lines[:10] if content_lines else ["Unable to parse content"]
         
         slides.append({
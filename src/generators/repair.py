@@ -0,0 +1,251 @@
+from llm_handlers.api_handler import get_llm_response
+from generators.schemas import (
+    QuestionRepairs,
+    SlideRepairs,
+    json_schema_for,
+    language_instruction,
+    parse_structured_response,
+    structured_instructions,
+)
+from generators.patterns import ANSWER_KEY_PATTERN, MULTIPLE_CHOICE_PATTERN, OPTION_PATTERN, QUESTION_PATTERN
+from generators.stop_conditions import JsonComplete
+
+# Upper bound on units sent in a single repair request
+MAX_REPAIR_UNITS = 20
+
+def repair_slides(slides_data, params):
+    """Fill in slides that came back without bullet points.
+
+    Only the defective slides are sent back to the LLM; the fixes are spliced
+    into `slides_data` in place. Returns the number of repaired slides.
+    """
+    defective = [
+        number for number, slide in enumerate(slides_data, start=1)
+        if not slide.get('bullets')
+    ][:MAX_REPAIR_UNITS]
+
+    # A single unparseable slide is the whole-document fallback, not a defect
+    if not defective or len(slides_data) == 1:
+        return 0
+
+    outline = '\n'.join(
+        f"{number}. {slide.get('title', '')}"
+        for number, slide in enumerate(slides_data, start=1)
+    )
+    missing = '\n'.join(
+        f"SLIDE {number}: {slides_data[number - 1].get('title', '')}"
+        for number in defective
+    )
+
+    schema = json_schema_for(SlideRepairs)
+    prompt = f"""
+    The following slides of a presentation on "{params['topic']}" for {params['subject']} at {params['grade_level']} level are missing their bullet points.
+
+    Full slide list, for context:
+    {outline}
+
+    Write 3-5 concise bullet points for each of these slides only, keeping their numbers:
+    {missing}
+    {language_instruction(params)}
+    {structured_instructions(schema)}
+    """
+
+    repairs = _request_repairs(prompt, params, schema, SlideRepairs)
+    if repairs is None:
+        return 0
+
+    repaired = 0
+    for fix in repairs.slides:
+        if fix.number in defective and fix.bullets:
+            slides_data[fix.number - 1]['bullets'] = fix.bullets
+            repaired += 1
+
+    return repaired
+
+def repair_exercise_content(content, params):
+    """Complete exercise Markdown with missing options or answer key entries.
+
+    Returns the (possibly) patched content and the number of repaired questions.
+    """
+    questions, answer_lines, answer_key_line = parse_exercise_content(content)
+
+    # Answer key entries are matched by number, which is ambiguous if
+    # numbering restarts in each section
+    numbers = [question['number'] for question in questions]
+    check_answers = len(numbers) == len(set(numbers))
+    for question in questions:
+        question['answer'] = answer_lines.get(question['number'], (None, ''))[1]
+
+    fixes = _repair_questions(questions, params, check_answers)
+    if not fixes:
+        return content, 0
+
+    lines = content.split('\n')
+    insertions = []
+
+    for question in questions:
+        fix = fixes.get(question['number'])
+        if fix is None:
+            continue
+        if fix.options and question['multiple_choice'] and len(question['options']) < 2:
+            option_lines = [f"   {_label_option(letter, option)}" for letter, option in zip("ABCDEFGH", fix.options)]
+            insertions.append((question['line'] + 1, option_lines))
+        if fix.answer and not question['answer']:
+            insertions.append((_answer_insert_line(question['number'], answer_lines, answer_key_line, len(lines)),
+                               [f"{question['number']}. {fix.answer}"]))
+
+    if answer_key_line is None and any(fix.answer for fix in fixes.values()):
+        lines.extend(["", "## Answer Key", ""])
+
+    # Splice from the bottom up so earlier line indices stay valid; entries
+    # sharing an index are inserted last-first to keep their order
+    ordered = sorted(enumerate(insertions), key=lambda item: (item[1][0], item[0]), reverse=True)
+    for _, (index, new_lines) in ordered:
+        lines[index:index] = new_lines
+
+    return '\n'.join(lines), len(fixes)
+
+def repair_exercise_structure(exercises, params):
+    """Complete structured exercises with missing options or answers, in place.
+
+    Returns the number of repaired questions.
+    """
+    questions = []
+    for section in exercises['sections']:
+        for question in section['questions']:
+            questions.append({
+                'number': len(questions) + 1,
+                'question': question['question'],
+                'options': question['options'],
+                'answer': question['answer'] or question['solution'],
+                'multiple_choice': bool(MULTIPLE_CHOICE_PATTERN.search(question['type'])),
+                'source': question
+            })
+
+    fixes = _repair_questions(questions, params, check_answers=True)
+    for question in questions:
+        fix = fixes.get(question['number'])
+        if fix is None:
+            continue
+        if fix.options and question['multiple_choice'] and len(question['options']) < 2:
+            question['source']['options'] = fix.options
+        if fix.answer and not question['answer']:
+            question['source']['answer'] = fix.answer
+
+    return len(fixes)
+
+def _repair_questions(questions, params, check_answers):
+    """Request missing options/answers for defective questions only"""
+
+    defective = []
+    defective_numbers = set()
+    for question in questions:
+        needs = []
+        if question['multiple_choice'] and len(question['options']) < 2:
+            needs.append("NEEDS 4 OPTIONS")
+        if check_answers and not question['answer']:
+            needs.append("NEEDS ANSWER")
+        if needs and len(defective) < MAX_REPAIR_UNITS:
+            defective.append(f"{question['number']}. {question['question']} [{', '.join(needs)}]")
+            defective_numbers.add(question['number'])
+
+    if not defective:
+        return {}
+
+    schema = json_schema_for(QuestionRepairs)
+    prompt = f"""
+    The following questions from an exercise list on "{params['topic']}" for {params['subject']} at {params['grade_level']} level are incomplete.
+
+    {chr(10).join(defective)}
+
+    For each question above return its "number", plus:
+    - "options": 4 answer options (A, B, C, D) if it NEEDS 4 OPTIONS, otherwise an empty list
+    - "answer": the correct answer if it NEEDS ANSWER (the option letter for multiple choice), otherwise an empty string
+    {language_instruction(params)}
+    {structured_instructions(schema)}
+    """
+
+    repairs = _request_repairs(prompt, params, schema, QuestionRepairs)
+    if repairs is None:
+        return {}
+
+    return {
+        fix.number: fix for fix in repairs.questions
+        if fix.number in defective_numbers and (fix.options or fix.answer)
+    }
+
+def _request_repairs(prompt, params, schema, model):
+    """Send a repair prompt; a failed repair leaves the document as it was"""
+    try:
+        response = get_llm_response(prompt, params["llm_config"], json_schema=schema, stop_condition=JsonComplete())
+        return parse_structured_response(response, model)
+    except Exception:
+        return None
+
+def parse_exercise_content(content):
+    """Parse exercise Markdown into numbered questions and answer key entries.
+
+    Returns (questions, answers by number -> (line, text), answer key heading line).
+    """
+    questions = []
+    answer_lines = {}
+    answer_key_line = None
+    in_answer_key = False
+    multiple_choice_section = False
+    section = ""
+    current = None
+
+    for index, raw_line in enumerate(content.split('\n')):
+        line = raw_line.strip().replace('**', '')
+        if not line:
+            continue
+
+        if line.startswith('#'):
+            heading = line.lstrip('#').strip()
+            in_answer_key = bool(ANSWER_KEY_PATTERN.search(heading))
+            if in_answer_key:
+                answer_key_line = index
+            multiple_choice_section = bool(MULTIPLE_CHOICE_PATTERN.search(heading))
+            section = heading
+            current = None
+            continue
+
+        question_match = QUESTION_PATTERN.match(line)
+        if in_answer_key:
+            if question_match:
+                answer_lines[int(question_match.group(1))] = (index, question_match.group(2))
+            continue
+
+        if question_match:
+            current = {
+                'number': int(question_match.group(1)),
+                'question': question_match.group(2),
+                'options': [],
+                'multiple_choice': multiple_choice_section,
+                'section': section,
+                'line': index
+            }
+            questions.append(current)
+        elif current is not None and OPTION_PATTERN.match(line):
+            current['options'].append(OPTION_PATTERN.match(line).group(2))
+            current['multiple_choice'] = True
+
+    return questions, answer_lines, answer_key_line
+
+def _answer_insert_line(number, answer_lines, answer_key_line, line_count):
+    """Find where a new answer key entry belongs to keep the key in order"""
+    later = [line for other, (line, _) in answer_lines.items() if other > number]
+    if later:
+        return min(later)
+    if answer_lines:
+        return max(line for line, _ in answer_lines.values()) + 1
+    if answer_key_line is not None:
+        return answer_key_line + 1
+    # Answer key heading is appended after the existing content
+    return line_count + 3
+
+def _label_option(letter, option):
+    """Prefix an option with its letter unless the model already did"""
+    if OPTION_PATTERN.match(option):
+        return option
+    return f"{letter}) {option}"
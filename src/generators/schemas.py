@@ -0,0 +1,220 @@
+"""
+Schemas for structured (JSON) generation output.
+Each generator asks the LLM for JSON matching one of these models and validates
+the response with pydantic before rendering it.
+"""
+
+import json
+import re
+from typing import List
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+# Names of the output languages documents can be generated in, as given to the LLM
+LANGUAGE_NAMES = {
+    "en": "English",
+    "pt": "Portuguese"
+}
+
+# Where a JSON object starts: a brace opening a key or an empty object, so
+# braces in Markdown answers, e.g. LaTeX "\frac{1}{2}", are not mistaken for one
+_JSON_OBJECT_START = re.compile(r'\{\s*["}]')
+
+
+class NoStructuredOutput(ValueError):
+    """The response contains no JSON object, e.g. the model answered in Markdown."""
+
+
+class _OutputModel(BaseModel):
+    # Models often write numbers where text is expected, e.g. "answer": 4
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+
+class Slide(_OutputModel):
+    title: str
+    bullets: List[str] = Field(default_factory=list)
+    notes: str = ""
+    image: str = ""
+
+
+class PresentationOutline(_OutputModel):
+    slides: List[Slide]
+
+
+class Question(_OutputModel):
+    type: str
+    question: str
+    options: List[str] = Field(default_factory=list)
+    answer: str = ""
+    solution: str = ""
+
+
+class ExerciseSection(_OutputModel):
+    title: str
+    instructions: str = ""
+    questions: List[Question]
+
+
+class ExerciseList(_OutputModel):
+    title: str
+    introduction: str = ""
+    sections: List[ExerciseSection]
+
+
+class SummarySection(_OutputModel):
+    heading: str
+    paragraphs: List[str] = Field(default_factory=list)
+    bullets: List[str] = Field(default_factory=list)
+
+
+class SummaryDocument(_OutputModel):
+    title: str
+    sections: List[SummarySection]
+
+
+class OutlineSection(_OutputModel):
+    heading: str
+    key_points: List[str]
+    examples: List[str] = Field(default_factory=list)
+
+
+class LessonOutline(_OutputModel):
+    title: str
+    learning_objectives: List[str]
+    vocabulary: List[str] = Field(default_factory=list)
+    sections: List[OutlineSection]
+
+
+class SlideRepair(_OutputModel):
+    number: int
+    bullets: List[str]
+
+
+class SlideRepairs(_OutputModel):
+    slides: List[SlideRepair]
+
+
+class QuestionRepair(_OutputModel):
+    number: int
+    options: List[str] = Field(default_factory=list)
+    answer: str = ""
+
+
+class QuestionRepairs(_OutputModel):
+    questions: List[QuestionRepair]
+
+
+
+def json_schema_for(model):
+    """Return a self-contained JSON schema (no $ref) for a pydantic model.
+
+    Provider JSON modes differ in how much of JSON Schema they accept, so
+    references are inlined and titles dropped to keep the schema portable.
+    """
+    schema = model.model_json_schema()
+    definitions = schema.pop("$defs", {})
+    return _inline_refs(schema, definitions)
+
+
+def _inline_refs(node, definitions, is_properties=False):
+    if isinstance(node, dict):
+        if "$ref" in node:
+            name = node["$ref"].split("/")[-1]
+            return _inline_refs(definitions[name], definitions)
+        # Keys of a "properties" mapping are field names, not annotations
+        return {
+            key: _inline_refs(value, definitions, key == "properties" and not is_properties)
+            for key, value in node.items()
+            if is_properties or key != "title"
+        }
+    if isinstance(node, list):
+        return [_inline_refs(item, definitions) for item in node]
+    return node
+
+
+def parse_structured_response(text, model):
+    """Parse and validate an LLM response against a schema model.
+
+    Tolerates Markdown code fences and chatter around the JSON object.
+    Raises NoStructuredOutput if the response has no JSON object, and
+    ValueError if the object is incomplete or does not match the schema.
+    """
+    if not text:
+        raise ValueError("LLM returned empty content")
+
+    candidate = text.strip()
+    fence_match = re.search(r'```(?:json)?\s*(.*?)```', candidate, re.DOTALL | re.IGNORECASE)
+    if fence_match:
+        candidate = fence_match.group(1).strip()
+
+    start_match = _JSON_OBJECT_START.search(candidate)
+    if start_match is None:
+        raise NoStructuredOutput("No JSON object found in LLM response")
+    start = start_match.start()
+    end = candidate.rfind('}')
+    if end <= start:
+        raise ValueError("Structured output is incomplete, it may have been cut off by the output token limit")
+
+    try:
+        return model.model_validate(json.loads(candidate[start:end + 1]))
+    except (json.JSONDecodeError, ValidationError) as e:
+        raise ValueError(f"Structured output did not match schema: {e}")
+
+
+def outline_to_text(outline):
+    """Render a lesson outline as compact text for use as shared prompt context"""
+    lines = [f"Lesson: {outline['title']}", "Learning objectives:"]
+    lines.extend(f"- {objective}" for objective in outline['learning_objectives'])
+    if outline['vocabulary']:
+        lines.append(f"Vocabulary: {', '.join(outline['vocabulary'])}")
+    for number, section in enumerate(outline['sections'], start=1):
+        lines.append(f"{number}. {section['heading']}")
+        lines.extend(f"   - {point}" for point in section['key_points'])
+        lines.extend(f"   - Example: {example}" for example in section['examples'])
+    return '\n'.join(lines)
+
+
+def outline_context(params):
+    """Prompt fragment tying a document to a shared lesson outline, if any"""
+    if not params.get("outline"):
+        return ""
+    return f"""
+    Base the content on this lesson outline, which is shared with the other
+    materials of the lesson. Follow its sections and vocabulary and do not
+    introduce unrelated topics:
+    {params['outline']}
+    """
+
+
+def course_context(params):
+    """Prompt fragment with excerpts retrieved from the course material, if any"""
+    if not params.get("course_excerpts"):
+        return ""
+    excerpts = "\n\n".join(f"[{excerpt['document']}]\n{excerpt['text']}" for excerpt in params["course_excerpts"])
+    return f"""
+    Ground the content in these excerpts from the course material. Prefer their
+    terminology, notation and examples, and do not contradict them:
+    {excerpts}
+    """
+
+
+def language_instruction(params):
+    """Prompt fragment setting the document's output language, if one was chosen"""
+    if not params.get("output_language"):
+        return ""
+    language = LANGUAGE_NAMES.get(params["output_language"], params["output_language"])
+    return f"""
+    LANGUAGE: Write the entire document in {language}, including titles, instructions,
+    answers and notes, even where the outline or course material is in another language.
+    Keep format markers and JSON field names exactly as specified.
+    """
+
+
+def structured_instructions(schema):
+    """Prompt fragment asking for JSON output that matches a schema"""
+    return f"""
+    OUTPUT FORMAT:
+    Respond ONLY with a single JSON object matching this JSON schema.
+    Do not wrap it in Markdown and do not add any text before or after it.
+    {json.dumps(schema)}
+    """
@@ -0,0 +1,175 @@
+"""
+Structural stop conditions for streamed LLM output.
+Each condition is fed the response as it arrives and reports where the
+requested document ends: after the last requested slide, after the answer
+key entry for the last question, or when the JSON object closes. The LLM
+handler then cancels the upstream generation and keeps only that prefix, so
+extra slides, trailing commentary and duplicate answer keys are never paid for.
+"""
+
+import re
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from generators.patterns import ANSWER_KEY_PATTERN, QUESTION_PATTERN
+
+_SLIDE_MARKER_PATTERN = re.compile(r'^\W*SLIDE\s*\d+', re.IGNORECASE)
+# Markdown heading or horizontal rule
+_BREAK_PATTERN = re.compile(r'^(#|---|\*\*\*|___)')
+
+
+class StopCondition(ABC):
+    """Base class: `feed` returns the length of the output to keep once the document is complete."""
+
+    @abstractmethod
+    def reset(self) -> None:
+        """Forget everything fed so far, before a retried request streams again."""
+
+    @abstractmethod
+    def feed(self, chunk: str) -> Optional[int]:
+        """Take the next chunk of output; return the cut offset once the document is complete, else None."""
+
+
+class LineStopCondition(StopCondition):
+    """Stop condition judged line by line; subclasses implement `_line`."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self._buffer = ""
+        self._offset = 0
+
+    def feed(self, chunk: str) -> Optional[int]:
+        self._buffer += chunk
+        while "\n" in self._buffer:
+            line, self._buffer = self._buffer.split("\n", 1)
+            start = self._offset
+            self._offset += len(line) + 1
+            cut = self._line(line, start, self._offset)
+            if cut is not None:
+                return cut
+        return None
+
+    @abstractmethod
+    def _line(self, line: str, start: int, end: int) -> Optional[int]:
+        """Judge one complete, unstripped line spanning [start, end) of the output; return the cut offset or None."""
+
+
+class SlidesComplete(LineStopCondition):
+    """Complete once the last requested slide has its final field (NOTES or IMAGE)."""
+
+    def __init__(self, num_slides: int, include_images: bool):
+        self.num_slides = num_slides
+        self.last_field = "IMAGE:" if include_images else "NOTES:"
+        super().__init__()
+
+    def reset(self) -> None:
+        super().reset()
+        self._slides = 0
+
+    def _line(self, line, start, end):
+        line = line.strip()
+        if _SLIDE_MARKER_PATTERN.match(line):
+            self._slides += 1
+            # An extra slide starts
+            if self._slides > self.num_slides:
+                return start
+        elif self._slides == self.num_slides:
+            if line.upper().startswith(self.last_field):
+                return end
+            if _BREAK_PATTERN.match(line):
+                return start
+        return None
+
+
+class AnswerKeyComplete(LineStopCondition):
+    """Complete once the answer key has an entry for every requested question.
+
+    Entries may span several lines, including worked solutions whose steps are
+    numbered from 1 again, so after the last entry the cut is made where the
+    next structural element starts: a heading or rule, or a numbered line that
+    repeats an answered number or is out of range without continuing such steps.
+    Sub-headings inside the key, e.g. one per question type, stay part of it.
+    """
+
+    def __init__(self, num_questions: int):
+        self.num_questions = num_questions
+        super().__init__()
+
+    def reset(self) -> None:
+        super().reset()
+        self._key_level = 0
+        self._answers = set()
+        # Last numbered solution step under the current entry, 0 outside steps
+        self._step = 0
+
+    def _line(self, line, start, end):
+        indented = line[:1].isspace()
+        line = line.strip().replace('**', '')
+        complete = len(self._answers) >= self.num_questions
+
+        if _BREAK_PATTERN.match(line):
+            if complete:
+                return start
+            self._step = 0
+            if line.startswith('#'):
+                level = len(line) - len(line.lstrip('#'))
+                if not self._key_level or level <= self._key_level:
+                    is_key = bool(ANSWER_KEY_PATTERN.search(line.lstrip('#')))
+                    self._key_level = level if is_key else 0
+            return None
+
+        if not self._key_level:
+            return None
+        question_match = QUESTION_PATTERN.match(line)
+        if not question_match or indented:
+            return None
+
+        number = int(question_match.group(1))
+        if number == self._step + 1 and (self._step or number in self._answers):
+            # Unindented solution steps restart at 1 under an entry
+            self._step = number
+            return None
+        if complete:
+            return start
+        self._step = 0
+        if number <= self.num_questions:
+            self._answers.add(number)
+        return None
+
+
+class JsonComplete(StopCondition):
+    """Complete once the top-level JSON object or array closes."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self._offset = 0
+        self._depth = 0
+        self._started = False
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> Optional[int]:
+        for index, char in enumerate(chunk):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = self._started
+            elif char in "{[":
+                self._depth += 1
+                self._started = True
+            elif char in "}]" and self._started:
+                self._depth -= 1
+                if self._depth == 0:
+                    return self._offset + index + 1
+        self._offset += len(chunk)
+        return None
+
@@ -1,28 +1,218 @@
 from llm_handlers.api_handler import get_llm_response
-from docx import Document
-import io
+from generators.schemas import SummaryDocument, NoStructuredOutput, json_schema_for, parse_structured_response, structured_instructions, outline_context, course_context, language_instruction
+from generators.artifacts import DocumentArtifacts, apply_document_title, document_label, document_title, iter_lines
+from generators.large_documents import word_document
+from generators.stop_conditions import JsonComplete
+from llm_handlers.cancellation import submit_in_scope
+from utils.document_ingestion import iter_text_chunks
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import re
+
+# Source material summarisation (map-reduce) settings
+SOURCE_CHUNK_CHARS = 8000
+REDUCE_BATCH_CHARS = 12000
+MAP_CONCURRENCY = 4
+NOTES_MAX_TOKENS = 1500
+
+# Approximate tokens per page of summary
+TOKENS_PER_PAGE = 600
 
 def generate_summary(params):
-    """Generate summary document"""
+    """Generate summary document
+    
+    With an uploaded `source_file`, the material is condensed into notes first
+    and the summary is written from those notes.
+    """
+    
+    if params.get("source_file") is not None and "source_notes" not in params:
+        return _generate_source_summary(params)
+    
+    if params.get("structured_output"):
+        return _generate_structured_summary(params)
     
     prompt = _build_summary_prompt(params)
     
     try:
         # Get content from LLM
-        content = get_llm_response(prompt, params["llm_config"])
+        content = get_llm_response(prompt, params["llm_config"], max_tokens=_output_token_budget(params))
         
-        # Create Word document
-        docx_file = _create_summary_docx(content, params)
+        return {
+            "success": True,
+            "content": content,
+            "artifacts": _build_summary_artifacts(content, params)
+        }
+        
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+def render_summary(content, params, structured=None):
+    """Build a summary result from existing content without calling the LLM
+    
+    With the structured summary, the Markdown is rebuilt for the current format style.
+    """
+    if structured:
+        content = _summary_to_markdown(apply_document_title(structured, params), params.get("format_style"))
+    return {
+        "success": True,
+        "content": content,
+        "artifacts": _build_summary_artifacts(content, params)
+    }
+
+def _generate_source_summary(params):
+    """Summarise uploaded source material with a map-reduce pass before the final summary"""
+    
+    try:
+        notes = condense_source_material(params)
+    except Exception as e:
+        return {"success": False, "error": f"Source material could not be summarised: {str(e)}"}
+    
+    return generate_summary({**params, "source_notes": notes})
+
+def condense_source_material(params):
+    """Condense the uploaded source file into the notes a summary is written from"""
+    
+    notes = _map_source_chunks(params)
+    if not notes:
+        raise Exception("No text could be extracted from the uploaded file")
+    return _reduce_notes(notes, params)[0]
+
+def _map_source_chunks(params):
+    """Summarise source chunks concurrently, keeping only a bounded number of chunks in memory"""
+    
+    source_file = params["source_file"]
+    source_file.seek(0)
+    chunks = iter_text_chunks(source_file, params.get("source_name", ""), SOURCE_CHUNK_CHARS)
+    
+    notes = {}
+    with ThreadPoolExecutor(max_workers=MAP_CONCURRENCY) as executor:
+        pending = {}
+        for index, chunk in enumerate(chunks):
+            # Wait for a free slot before reading further into the file
+            while len(pending) >= MAP_CONCURRENCY * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    notes[pending.pop(future)] = future.result()
+            pending[submit_in_scope(executor, _summarise_chunk, chunk, params)] = index
+        for future, index in pending.items():
+            notes[index] = future.result()
+    
+    return [notes[index] for index in sorted(notes)]
+
+def _reduce_notes(notes, params):
+    """Combine notes level by level until they fit in a single batch"""
+    
+    while len(notes) > 1:
+        batches = []
+        for note in notes:
+            if batches and sum(len(n) for n in batches[-1]) + len(note) <= REDUCE_BATCH_CHARS:
+                batches[-1].append(note)
+            else:
+                batches.append([note])
+        
+        if len(batches) == len(notes) and len(notes) > 1:
+            # Each note fills a batch by itself; pair them up so the level still shrinks
+            batches = [notes[i:i + 2] for i in range(0, len(notes), 2)]
+        
+        with ThreadPoolExecutor(max_workers=MAP_CONCURRENCY) as executor:
+            futures = [submit_in_scope(executor, _combine_notes, batch, params) for batch in batches]
+            notes = [future.result() for future in futures]
+    
+    return notes
+
+def _summarise_chunk(chunk, params):
+    """Map step: condense one chunk of source material into notes"""
+    
+    prompt = f"""
+    The following is part of source material for a {params['subject']} lesson
+    at {params['grade_level']} level on: {params['topic']}
+    
+    Extract its key facts, concepts, definitions and examples as concise bullet notes.
+    Keep names, numbers and terminology exactly as written. Reply with the notes only.
+    
+    Source material:
+    {chunk}
+    """
+    
+    return get_llm_response(prompt, params["llm_config"], max_tokens=NOTES_MAX_TOKENS).strip()
+
+def _combine_notes(batch, params):
+    """Reduce step: merge consecutive notes into one set without losing key points"""
+    
+    if len(batch) == 1:
+        return batch[0]
+    
+    joined = "\n\n".join(batch)
+    prompt = f"""
+    The following notes were taken, in order, from source material for a
+    {params['subject']} lesson at {params['grade_level']} level on: {params['topic']}
+    
+    Merge them into a single set of concise bullet notes in the same order,
+    removing repetition but keeping every distinct fact and example.
+    Reply with the notes only.
+    
+    Notes:
+    {joined}
+    """
+    
+    return get_llm_response(prompt, params["llm_config"], max_tokens=NOTES_MAX_TOKENS).strip()
+
+def _source_context(params):
+    """Prompt fragment with notes from uploaded source material, if any"""
+    
+    if not params.get("source_notes"):
+        return ""
+    
+    return f"""
+    Base the summary on these notes from the source material provided by the teacher:
+    {params['source_notes']}
+    """
+
+def _generate_structured_summary(params):
+    """Generate summary document from schema-validated JSON output"""
+    
+    schema = json_schema_for(SummaryDocument)
+    prompt = _build_structured_summary_prompt(params, schema)
+    
+    try:
+        raw_content = get_llm_response(
+            prompt,
+            params["llm_config"],
+            json_schema=schema,
+            max_tokens=_output_token_budget(params),
+            stop_condition=JsonComplete()
+        )
+        
+        try:
+            summary = parse_structured_response(raw_content, SummaryDocument)
+        except NoStructuredOutput:
+            # Model ignored the JSON instructions, render the text as Markdown
+            return {
+                "success": True,
+                "content": raw_content,
+                "artifacts": _build_summary_artifacts(raw_content, params)
+            }
+        
+        content = _summary_to_markdown(apply_document_title(summary.model_dump(), params), params.get("format_style"))
         
         return {
             "success": True,
             "content": content,
-            "docx_file": docx_file
+            "structured": summary.model_dump(),
+            "artifacts": _build_summary_artifacts(content, params)
         }
         
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+def _output_token_budget(params):
+    """Expected size of the summary, in tokens, from the page range in its length option"""
+    # Length options read like "Brief (1-2 pages)" or "Comprehensive (5+ pages)" in every language
+    length = params.get('summary_length', "")
+    pages = max((int(number) for number in re.findall(r"\d+", length)), default=3)
+    if "+" in length:
+        pages += 2
+    return pages * TOKENS_PER_PAGE
+
 def _build_summary_prompt(params):
     """Build prompt for summary generation"""
     
@@ -30,6 +220,10 @@ def _build_summary_prompt(params):
     Create a comprehensive summary for {params['subject']} at {params['grade_level']} level.
     
     Topic: {params['topic']}
+    {outline_context(params)}
+    {course_context(params)}
+    {language_instruction(params)}
+    {_source_context(params)}
     Length: {params['summary_length']}
     Format: {params['format_style']}
     Include examples: {params['include_examples']}
@@ -50,35 +244,102 @@ def _build_summary_prompt(params):
     
     return prompt
 
-def _create_summary_docx(content, params):
-    """Create Word document from summary content"""
+def _build_structured_summary_prompt(params, schema):
+    """Build prompt for summary generation as JSON"""
+    
+    prompt = f"""
+    Create a comprehensive summary for {params['subject']} at {params['grade_level']} level.
     
-    doc = Document()
+    Topic: {params['topic']}
+    {outline_context(params)}
+    {course_context(params)}
+    {language_instruction(params)}
+    {_source_context(params)}
+    Length: {params['summary_length']}
+    Format: {params['format_style']}
+    Include examples: {params['include_examples']}
+    
+    Give the summary a "title" and split it into "sections", in this order:
+    1. Introduction to the topic
+    2. Main concepts and key points
+    3. {'Real-world examples and applications' if params['include_examples'] else 'Theoretical explanations'}
+    4. Summary of key takeaways
+    5. Suggested further reading or activities
     
-    # Title
-    title = doc.add_heading(f"{params['subject']} - Summary", 0)
-    title.alignment = 1  # Center alignment
+    Each section has a "heading" plus "paragraphs" and/or "bullets".
+    Favour "bullets" or "paragraphs" according to the {params['format_style']} style.
     
-    # Subtitle
-    doc.add_heading(f"Topic: {params['topic']}", level=2)
-    doc.add_heading(f"Grade Level: {params['grade_level']}", level=3)
+    Make sure the content is:
+    - Age-appropriate for {params['grade_level']}
+    - Well-organized and easy to follow
+    - Educationally comprehensive
+    {structured_instructions(schema)}
+    """
     
-    # Add content based on format style
-    if params['format_style'] == "Bullet Points":
-        _add_bullet_content(doc, content)
-    elif params['format_style'] == "Outline":
-        _add_outline_content(doc, content)
-    elif params['format_style'] == "Q&A Format":
-        _add_qa_content(doc, content)
-    else:  # Paragraphs
-        _add_paragraph_content(doc, content)
+    return prompt
+
+def _summary_to_markdown(summary, format_style=None):
+    """Render a structured summary as Markdown in the given format style"""
     
-    # Save to bytes
-    doc_io = io.BytesIO()
-    doc.save(doc_io)
-    doc_io.seek(0)
+    lines = [f"# {summary['title']}", ""]
+    for number, section in enumerate(summary['sections'], 1):
+        paragraphs = section['paragraphs']
+        bullets = section['bullets']
+        
+        if format_style == "Bullet Points":
+            paragraphs, bullets = [], paragraphs + bullets
+        elif format_style == "Paragraphs":
+            paragraphs, bullets = paragraphs + bullets, []
+        
+        if format_style == "Outline":
+            lines.extend([f"## {number}. {section['heading']}", ""])
+            paragraphs, bullets = [], paragraphs + bullets
+        elif format_style == "Q&A Format":
+            lines.extend([f"## Q: {section['heading']}", ""])
+            if paragraphs or bullets:
+                lines.extend(["A:", ""])
+        else:
+            lines.extend([f"## {section['heading']}", ""])
+        
+        for paragraph in paragraphs:
+            lines.extend([paragraph, ""])
+        if bullets:
+            lines.extend(f"- {bullet}" for bullet in bullets)
+            lines.append("")
     
-    return doc_io.getvalue()
+    return '\n'.join(lines).strip()
+
+def _build_summary_artifacts(content, params):
+    """Downloadable files for a summary, rendered on demand"""
+    return DocumentArtifacts(
+        document_title(params, "Summary"),
+        content,
+        {"docx": lambda out: _create_summary_docx(content, params, out)}
+    )
+
+def _create_summary_docx(content, params, out):
+    """Write the Word document for summary content to a file"""
+
+    # Very large documents are streamed instead of built in memory
+    with word_document(out, len(content)) as doc:
+        
+        # Title
+        title = doc.add_heading(document_title(params, "Summary"), 0)
+        title.alignment = 1  # Center alignment
+        
+        # Subtitle
+        doc.add_heading(f"{document_label(params, 'Topic')}: {params['topic']}", level=2)
+        doc.add_heading(f"{document_label(params, 'Grade Level')}: {params['grade_level']}", level=3)
+        
+        # Add content based on format style
+        if params['format_style'] == "Bullet Points":
+            _add_bullet_content(doc, content)
+        elif params['format_style'] == "Outline":
+            _add_outline_content(doc, content)
+        elif params['format_style'] == "Q&A Format":
+            _add_qa_content(doc, content)
+        else:  # Paragraphs
+            _add_paragraph_content(doc, content)
 
 def _add_bullet_content(doc, content):
     """Add content in bullet point format"""
@@ -98,9 +359,7 @@ def _add_paragraph_content(doc, content):
 
 def _add_formatted_content_to_docx(doc, content):
     """Add formatted content to Word document, parsing Markdown formatting"""
-    lines = content.split('\n')
-    
-    for line in lines:
+    for line in iter_lines(content):
         line = line.strip()
         if not line:
             doc.add_paragraph("")
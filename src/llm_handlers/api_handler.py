@@ -2,53 +2,187 @@ import os
 import requests
 import json
 import time
-import re
+import threading
+from contextlib import nullcontext
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from llm_handlers.cancellation import GenerationCancelled, check_cancelled, current_token
+from llm_handlers.cassettes import get_cassette_store, normalise_request, record_chunks
+from llm_handlers.model_router import get_model_router
+from llm_handlers.ollama_pool import get_ollama_pool, parse_hosts
+from llm_handlers.thinking_filter import ThinkingFilter
+from utils.admission import admit_request
+from utils.text_index import estimate_tokens
 
-def _clean_thinking_tags(text):
-    """Remove <think> and </think> tags and content between them from text"""
-    if not text:
-        return text
+# Shared HTTP session, so connections to providers are pooled and kept alive
+_http_session = None
+_http_session_lock = threading.Lock()
+
+# Serialises local model loading so concurrent requests don't load a model twice
+_pipeline_lock = threading.Lock()
+
+# How long Ollama keeps a model loaded after its last request
+DEFAULT_OLLAMA_KEEP_ALIVE = "30m"
+# Context window bounds. Ollama reloads a model whenever the window size changes,
+# so windows are powers of two from a minimum that fits typical document requests,
+# which is also the size models are preloaded with.
+OLLAMA_MIN_CTX = 8192
+OLLAMA_MAX_CTX = 32768
+
+# Candidate models tried, best first, before an automatically routed request fails
+ROUTED_ATTEMPTS = 2
+
+# (host, model) -> time of the last preload request
+_ollama_preloads = {}
+_ollama_preloads_lock = threading.Lock()
+
+def _get_http_session():
+    """Get or create the process-wide HTTP session"""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _http_session = session
+    return _http_session
+
+def get_llm_response(prompt, llm_config, json_schema=None, max_tokens=None, stop_condition=None):
+    """Get response from configured LLM
     
-    # Remove thinking tags and their content (case-insensitive, multiline)
-    pattern = r'<think>.*?</think>'
-    cleaned_text = re.sub(pattern, '', text, flags=re.IGNORECASE | re.DOTALL)
+    When `json_schema` is given, providers with a native JSON mode are asked
+    for output conforming to it; the others rely on the prompt alone.
+    `max_tokens` is the expected output size, used by Ollama to size its
+    context window and prediction limit and in automatic mode to pick a model.
+    With a `stop_condition` (see generators.stop_conditions) the response is
+    streamed and the generation cancelled as soon as the condition reports the
+    document complete; only the output up to that point is returned.
+    Inside a cancellation scope (see llm_handlers.cancellation) responses are
+    always streamed, and cancelling the scope aborts the call upstream.
+    Every request first waits for a slot of the provider it goes to (see
+    utils.admission); automatic mode resolves the model before queueing.
+    """
     
-    # Also handle self-closing think tags
-    pattern_self_closing = r'<think\s*/>'
-    cleaned_text = re.sub(pattern_self_closing, '', cleaned_text, flags=re.IGNORECASE)
+    check_cancelled()
+    provider = llm_config["provider"]
     
-    # Clean up extra whitespace that might be left behind
-    # Replace multiple consecutive newlines with just two newlines
-    cleaned_text = re.sub(r'\n\s*\n\s*\n+', '\n\n', cleaned_text)
+    if provider == "auto":
+        return _get_routed_response(prompt, llm_config, json_schema, max_tokens, stop_condition)
     
-    # Remove leading/trailing whitespace from each line while preserving structure
-    lines = cleaned_text.split('\n')
-    cleaned_lines = []
-    for line in lines:
-        cleaned_lines.append(line.rstrip())
+    # Each request holds one of the provider's slots, shared fairly by all sessions
+    with admit_request(provider, check_cancelled):
+        # Every call feeds the latency and error statistics used for routing
+        router = get_model_router()
+        start = time.monotonic()
+        try:
+            response = _get_provider_response(prompt, llm_config, json_schema, max_tokens, stop_condition)
+        except GenerationCancelled:
+            # Not the model's fault; leave its statistics alone
+            raise
+        except Exception:
+            router.record(provider, llm_config.get("model", ""), time.monotonic() - start, 0, ok=False)
+            raise
+        router.record(provider, llm_config.get("model", ""), time.monotonic() - start, estimate_tokens(response), ok=True)
+    return response
+
+def _get_routed_response(prompt, config, json_schema=None, max_tokens=None, stop_condition=None):
+    """Send the request to the best candidate model, falling back to the next one on failure"""
     
-    cleaned_text = '\n'.join(cleaned_lines)
-    cleaned_text = cleaned_text.strip()
+    ranked = get_model_router().rank(config["candidates"], max_tokens)
+    if not ranked:
+        raise ValueError("No AI provider is configured for automatic selection")
     
-    return cleaned_text
+    for candidate in ranked[:ROUTED_ATTEMPTS]:
+        try:
+            return get_llm_response(prompt, candidate, json_schema, max_tokens, stop_condition)
+        except GenerationCancelled:
+            raise
+        except Exception as e:
+            last_error = e
+            print(f"Warning: {candidate['provider']} model {candidate['model']} failed, trying the next candidate: {e}")
+    raise last_error
 
-def get_llm_response(prompt, llm_config):
-    """Get response from configured LLM"""
+def _get_provider_response(prompt, llm_config, json_schema=None, max_tokens=None, stop_condition=None):
+    """Dispatch the request to the configured provider, or to its cassette when recording or replaying"""
+    
+    cassettes = get_cassette_store()
+    if cassettes.mode is None:
+        return _dispatch_provider_request(prompt, llm_config, json_schema, max_tokens, stop_condition)
+    
+    request = normalise_request(prompt, llm_config, json_schema, max_tokens)
+    if cassettes.mode == "replay":
+        return _collect_stream(cassettes.replay(request), stop_condition)
+    with cassettes.recording(request):
+        return _dispatch_provider_request(prompt, llm_config, json_schema, max_tokens, stop_condition)
+
+def _dispatch_provider_request(prompt, llm_config, json_schema=None, max_tokens=None, stop_condition=None):
+    """Send the request to the configured provider"""
     
     provider = llm_config["provider"]
     
     if provider == "openai":
-        return _get_openai_response(prompt, llm_config)
+        return _get_openai_response(prompt, llm_config, json_schema, stop_condition)
     elif provider == "ollama":
-        return _get_ollama_response(prompt, llm_config)
+        return _get_ollama_response(prompt, llm_config, json_schema, max_tokens, stop_condition)
     elif provider == "huggingface":
-        return _get_huggingface_response(prompt, llm_config)
+        response = _get_huggingface_response(prompt, llm_config)
+        check_cancelled()
+        # No streaming; filter the complete response the same way
+        return _collect_stream([response], stop_condition)
     elif provider == "google":
-        return _get_google_response(prompt, llm_config)
+        return _get_google_response(prompt, llm_config, json_schema, stop_condition)
     else:
         raise ValueError(f"Unsupported provider: {provider}")
 
-def _get_openai_response(prompt, config):
+def _should_stream(stop_condition):
+    """Stream when the output may be cut short or the call may be cancelled"""
+    return stop_condition is not None or current_token() is not None
+
+def _collect_stream(chunks, stop_condition=None, close=None):
+    """Join streamed text, stopping as soon as the stop condition reports the document complete
+    
+    Reasoning blocks are dropped as they arrive, so the stop condition and
+    the result only see visible text. Complete responses pass through here
+    as a single chunk, and all of them are noted while a cassette is being
+    recorded. The caller closes the underlying response afterwards,
+    which cancels the rest of the generation upstream. If the current
+    cancellation scope is cancelled meanwhile, `close` is called to unblock
+    a pending read and GenerationCancelled is raised.
+    """
+    
+    token = current_token()
+    chunks = record_chunks(chunks)
+    if stop_condition:
+        stop_condition.reset()
+    thinking = ThinkingFilter()
+    parts = []
+    
+    def add(text):
+        parts.append(text)
+        return stop_condition.feed(text) if stop_condition and text else None
+    
+    try:
+        with token.on_cancel(close) if token and close else nullcontext():
+            for chunk in chunks:
+                if token is not None:
+                    token.raise_if_cancelled()
+                cut = add(thinking.feed(chunk))
+                if cut is not None:
+                    return "".join(parts)[:cut]
+    except GenerationCancelled:
+        raise
+    except Exception as e:
+        # Reads fail once a cancelled stream is closed underneath them
+        if token is not None and token.cancelled:
+            raise GenerationCancelled("Generation was cancelled") from e
+        raise
+    
+    cut = add(thinking.finish())
+    return "".join(parts)[:cut]
+
+def _get_openai_response(prompt, config, json_schema=None, stop_condition=None):
     """Get response from OpenAI API"""
     
     if not config.get("api_key"):
@@ -64,12 +198,23 @@ def _get_openai_response(prompt, config):
         "messages": [{"role": "user", "content": prompt}],
     }
     
+    if json_schema:
+        data["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": "document", "schema": json_schema}
+        }
+    
+    stream = _should_stream(stop_condition)
+    if stream:
+        data["stream"] = True
+    
     try:
-        response = requests.post(
+        response = _get_http_session().post(
             "https://api.openai.com/v1/chat/completions",
             headers=headers,
             json=data,
-            timeout=60
+            timeout=60,
+            stream=stream
         )
         
         if response.status_code != 200:
@@ -82,9 +227,15 @@ def _get_openai_response(prompt, config):
                 pass
             raise Exception(error_msg)
         
+        if stream:
+            with response:
+                return _collect_stream(_openai_stream_chunks(response), stop_condition, response.close)
+        
         result = response.json()
-        return result["choices"][0]["message"]["content"]
+        return _collect_stream([result["choices"][0]["message"]["content"]], stop_condition)
         
+    except GenerationCancelled:
+        raise
     except requests.exceptions.Timeout:
         raise Exception("OpenAI API timeout. Please try again.")
     except requests.exceptions.ConnectionError:
@@ -95,8 +246,21 @@ def _get_openai_response(prompt, config):
         else:
             raise Exception(f"OpenAI API error: {str(e)}")
 
-def _get_ollama_response(prompt, config):
-    """Get response from Ollama local instance"""
+def _openai_stream_chunks(response):
+    """Text deltas from an OpenAI server-sent event stream"""
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data: "):
+            continue
+        payload = line[len("data: "):]
+        if payload == "[DONE]":
+            return
+        choices = json.loads(payload).get("choices") or [{}]
+        content = choices[0].get("delta", {}).get("content")
+        if content:
+            yield content
+
+def _get_ollama_response(prompt, config, json_schema=None, max_tokens=None, stop_condition=None):
+    """Get response from the least loaded Ollama host that has the model"""
     
     # Check if connection was verified during configuration
     if not config.get("connected", False):
@@ -105,38 +269,52 @@ def _get_ollama_response(prompt, config):
     data = {
         "model": config["model"],
         "prompt": prompt,
-        "stream": False,
-        "options": {
-            "temperature": config["temperature"]
-        }
+        "stream": _should_stream(stop_condition),
+        "keep_alive": _ollama_keep_alive(),
+        "options": _ollama_options(prompt, config, max_tokens)
     }
     
+    if json_schema:
+        data["format"] = json_schema
+    
+    pool = get_ollama_pool(config.get("hosts") or parse_hosts(config["host"]))
+    failed_hosts = []
+    
     try:
-        # First, check if the model exists
-        models_response = requests.get(f"{config['host']}/api/tags", timeout=5)
-        if models_response.status_code == 200:
-            available_models = [m["name"] for m in models_response.json().get("models", [])]
-            if config["model"] not in available_models:
-                raise Exception(f"Model '{config['model']}' not found. Available models: {', '.join(available_models)}")
+        while True:
+            # Raises if no healthy host has the model
+            with pool.acquire(config["model"], exclude=failed_hosts) as host:
+                try:
+                    # Generate response with longer timeout for generation
+                    response = _get_http_session().post(
+                        f"{host}/api/generate",
+                        json=data,
+                        timeout=300,  # 5 minutes timeout for generation
+                        stream=data["stream"]
+                    )
+                except requests.exceptions.ConnectionError as e:
+                    # Take the host out of rotation and retry on another one
+                    pool.eject(host, str(e))
+                    failed_hosts.append(host)
+                    continue
+                
+                # Read a streamed response while the host is still counted as busy
+                with response:
+                    if response.status_code != 200:
+                        raise Exception(f"Ollama API error: {response.status_code} - {response.text}")
+                    
+                    if data["stream"]:
+                        content = _collect_stream(_ollama_stream_chunks(response), stop_condition, response.close)
+                    else:
+                        content = _collect_stream([response.json().get("response", "No response generated")], stop_condition)
+            break
         
-        # Generate response with longer timeout for generation
-        response = requests.post(
-            f"{config['host']}/api/generate",
-            json=data,
-            timeout=300  # 5 minutes timeout for generation
-        )
-        
-        if response.status_code != 200:
-            raise Exception(f"Ollama API error: {response.status_code} - {response.text}")
-        
-        result = response.json()
-        raw_response = result.get("response", "No response generated")
-        
-        # Clean thinking tags from Ollama response
-        cleaned_response = _clean_thinking_tags(raw_response)
+        pool.mark_loaded(host, config["model"])
         
-        return cleaned_response
+        return content
         
+    except GenerationCancelled:
+        raise
     except requests.exceptions.Timeout:
         raise Exception("Ollama generation timeout. The model might be too slow or the prompt too complex. Try a simpler prompt or a faster model.")
     except requests.exceptions.ConnectionError:
@@ -147,6 +325,77 @@ def _get_ollama_response(prompt, config):
         else:
             raise Exception(f"Ollama error: {str(e)}")
 
+def _ollama_stream_chunks(response):
+    """Text pieces from an Ollama newline-delimited JSON stream"""
+    for line in response.iter_lines():
+        if not line:
+            continue
+        part = json.loads(line)
+        if part.get("error"):
+            raise Exception(f"Ollama API error: {part['error']}")
+        yield part.get("response", "")
+        if part.get("done"):
+            return
+
+def _ollama_keep_alive():
+    return os.getenv("EDUADOCS_OLLAMA_KEEP_ALIVE") or DEFAULT_OLLAMA_KEEP_ALIVE
+
+def _ollama_options(prompt, config, max_tokens=None):
+    """Runtime options sized to the request: prediction limit and context window"""
+    
+    options = {"temperature": config["temperature"]}
+    
+    prompt_tokens = estimate_tokens(prompt) + 1
+    output_tokens = 2048
+    if max_tokens:
+        # Twice the expected size leaves room for reasoning models' thinking;
+        # the context window must hold all of it
+        output_tokens = options["num_predict"] = max_tokens * 2
+    
+    num_ctx = OLLAMA_MIN_CTX
+    while num_ctx < prompt_tokens + output_tokens and num_ctx < OLLAMA_MAX_CTX:
+        num_ctx *= 2
+    options["num_ctx"] = num_ctx
+    
+    return options
+
+def preload_ollama_model(hosts, model):
+    """Load a model in the background on the Ollama host that will serve it next
+    
+    Calls within a minute of the last one are ignored; later ones refresh the
+    keep-alive while the model is in use.
+    """
+    
+    key = (tuple(sorted(hosts)), model)
+    now = time.monotonic()
+    with _ollama_preloads_lock:
+        last = _ollama_preloads.get(key)
+        if last is not None and now - last < 60:
+            return
+        _ollama_preloads[key] = now
+    
+    def preload():
+        pool = get_ollama_pool(hosts)
+        host = pool.choose(model)
+        if host is None:
+            return
+        try:
+            # A generate request without a prompt only loads the model
+            _get_http_session().post(
+                f"{host}/api/generate",
+                json={
+                    "model": model,
+                    "keep_alive": _ollama_keep_alive(),
+                    "options": {"num_ctx": OLLAMA_MIN_CTX}
+                },
+                timeout=300
+            )
+            pool.mark_loaded(host, model)
+        except requests.exceptions.RequestException as e:
+            print(f"Warning: Could not preload Ollama model {model} on {host}: {e}")
+    
+    threading.Thread(target=preload, daemon=True).start()
+
 def _get_huggingface_response(prompt, config):
     """Get response from Hugging Face"""
     
@@ -172,7 +421,7 @@ def _get_huggingface_api_response(prompt, config):
     }
     
     try:
-        response = requests.post(
+        response = _get_http_session().post(
             f"https://api-inference.huggingface.co/models/{config['model']}",
             headers=headers,
             json=data,
@@ -211,36 +460,80 @@ def _get_huggingface_local_response(prompt, config):
     """Get response from local Hugging Face model"""
     
     try:
-        from transformers import pipeline
+        with _pipeline_lock:
+            generator = _load_huggingface_pipeline(config["model"])
         
-        # This is a simplified implementation
-        # In production, you'd want to cache the model loading
-        generator = pipeline(
-            "text-generation",
-            model=config["model"],
-            temperature=config["temperature"]
+        result = generator(
+            prompt,
+            max_length=2000,
+            num_return_sequences=1,
+            temperature=config["temperature"],
+            stopping_criteria=_cancellation_stopping_criteria()
         )
-        
-        result = generator(prompt, max_length=2000, num_return_sequences=1)
+        check_cancelled()
         return result[0]["generated_text"]
         
+    except GenerationCancelled:
+        raise
     except ImportError:
         raise Exception("transformers library not installed for local Hugging Face models. Install with: pip install transformers torch")
     except Exception as e:
         raise Exception(f"Local Hugging Face model error: {str(e)}")
     
-def _get_google_response(prompt, config):
+def _cancellation_stopping_criteria():
+    """Stop local generation between tokens once the current cancellation scope is cancelled"""
+    token = current_token()
+    if token is None:
+        return None
+    
+    from transformers import StoppingCriteria, StoppingCriteriaList
+    
+    class Cancelled(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return token.cancelled
+    
+    return StoppingCriteriaList([Cancelled()])
+
+@lru_cache(maxsize=2)
+def _load_huggingface_pipeline(model):
+    """Load a local text-generation pipeline once per process"""
+    from transformers import pipeline
+    
+    return pipeline("text-generation", model=model)
+
+@lru_cache(maxsize=8)
+def _get_google_client(api_key):
+    """Reuse one Google GenAI client per API key"""
+    import google.genai as genai
+    
+    return genai.Client(api_key=api_key)
+
+def _get_google_response(prompt, config, json_schema=None, stop_condition=None):
     """Get response from Google GenAI API"""
     
     if not config.get("api_key"):
         raise ValueError("Google API key is required")
 
     try:
-        import google.genai as genai
-        os.environ["GOOGLE_API_KEY"] = config["api_key"]
-        client=genai.Client()
-        response = client.models.generate_content(model=config["model"], contents=prompt)
+        client = _get_google_client(config["api_key"])
+        generation_config = None
+        if json_schema:
+            generation_config = {
+                "response_mime_type": "application/json",
+                "response_json_schema": json_schema
+            }
+        if _should_stream(stop_condition):
+            stream = client.models.generate_content_stream(model=config["model"], contents=prompt, config=generation_config)
+            try:
+                return _collect_stream((chunk.text or "" for chunk in stream), stop_condition)
+            finally:
+                # Stops reading the stream, cancelling the rest of the generation
+                stream.close()
+        
+        response = client.models.generate_content(model=config["model"], contents=prompt, config=generation_config)
         
-        return response.text
+        return _collect_stream([response.text or ""], stop_condition)
+    except GenerationCancelled:
+        raise
     except Exception as e:
         raise Exception(f"Google GenAI API error: {str(e)}")
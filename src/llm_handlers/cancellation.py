@@ -0,0 +1,172 @@
+"""
+Cancellation of in-flight generations.
+A generation runs on a worker thread inside a cancellation scope. LLM calls
+made in the scope stream their responses and check the scope's token between
+chunks; cancelling the token (Cancel button, rerun or closed session) closes
+the upstream stream or stops local generation, so the model is freed for
+other users instead of finishing abandoned work.
+"""
+
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+DEFAULT_POLL_SECONDS = 0.5
+# How long an interrupted caller waits for the worker to wind down
+CANCEL_GRACE_SECONDS = 5.0
+
+_current_token: contextvars.ContextVar = contextvars.ContextVar("cancellation_token", default=None)
+
+
+class GenerationCancelled(Exception):
+    """Raised inside a generation whose token was cancelled."""
+
+
+class CancellationToken:
+    """Thread-safe cancellation flag with callbacks for unblocking pending I/O."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep up to `timeout` seconds, waking early if cancelled; returns whether it was."""
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise GenerationCancelled("Generation was cancelled")
+
+    @contextmanager
+    def on_cancel(self, callback: Callable[[], None]) -> Iterator[None]:
+        """Call `callback` if the token is cancelled while the block runs, e.g. to close a blocking stream."""
+        with self._lock:
+            registered = not self._event.is_set()
+            if registered:
+                self._callbacks.append(callback)
+        if not registered:
+            callback()
+        try:
+            yield
+        finally:
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+
+
+@contextmanager
+def cancellation_scope(token: CancellationToken) -> Iterator[None]:
+    """Make `token` the current token for LLM calls in this context."""
+    reset = _current_token.set(token)
+    try:
+        yield
+    finally:
+        _current_token.reset(reset)
+
+
+def current_token() -> Optional[CancellationToken]:
+    """The token of the enclosing cancellation scope, if any."""
+    return _current_token.get()
+
+
+def check_cancelled() -> None:
+    """Raise GenerationCancelled if the enclosing scope was cancelled."""
+    token = current_token()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def submit_in_scope(executor, fn, *args):
+    """Submit a task that shares the caller's cancellation scope."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def run_cancellable(token: CancellationToken, poll: Callable[[float], None], fn, *args,
+                    poll_seconds: float = DEFAULT_POLL_SECONDS):
+    """
+    Run `fn(*args)` on a worker thread inside a cancellation scope for `token`.
+
+    `poll` is called with the elapsed seconds while the work runs. If the
+    wait is interrupted, by `poll` or otherwise, the token is cancelled and
+    the worker given a moment to release its resources before the
+    interruption propagates.
+    """
+    def run():
+        with cancellation_scope(token):
+            return fn(*args)
+
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="generation")
+    # The worker sees the caller's context, e.g. its admission scope
+    future = executor.submit(contextvars.copy_context().run, run)
+    executor.shutdown(wait=False)
+
+    start = time.monotonic()
+    try:
+        while True:
+            try:
+                return future.result(timeout=poll_seconds)
+            except FutureTimeoutError:
+                poll(time.monotonic() - start)
+    except BaseException:
+        if not future.done():
+            token.cancel()
+            wait([future], timeout=CANCEL_GRACE_SECONDS)
+        raise
+
+
+class CancellationMetrics:
+    """Counts of cancelled generations and the generation time they had used."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_reason: Dict[str, int] = defaultdict(int)
+        self._by_provider: Dict[str, int] = defaultdict(int)
+        self._seconds = 0.0
+
+    def record(self, provider: str, reason: str, elapsed_seconds: float) -> None:
+        with self._lock:
+            self._by_reason[reason] += 1
+            self._by_provider[provider] += 1
+            self._seconds += elapsed_seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "count": sum(self._by_reason.values()),
+                "by_reason": dict(self._by_reason),
+                "by_provider": dict(self._by_provider),
+                "seconds": self._seconds
+            }
+
+
+# Global instance
+_cancellation_metrics: Optional[CancellationMetrics] = None
+
+
+def get_cancellation_metrics() -> CancellationMetrics:
+    """Get or create the global cancellation metrics instance."""
+    global _cancellation_metrics
+    if _cancellation_metrics is None:
+        _cancellation_metrics = CancellationMetrics()
+    return _cancellation_metrics
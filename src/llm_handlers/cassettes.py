@@ -0,0 +1,169 @@
+"""
+Record and replay of LLM provider traffic.
+In record mode every successful provider call is saved to a cassette: the
+normalised request and the response chunks with the time each one arrived,
+gzipped in one file per request. In replay mode calls are answered from the
+cassettes without any network access, at the recorded pace or faster, so
+parse failures can be reproduced and parsers and renderers measured on real
+model output.
+"""
+
+import contextvars
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from llm_handlers.cancellation import current_token
+
+DEFAULT_ROOT = Path(tempfile.gettempdir()) / "eduadocs-cassettes"
+# Replay speed relative to the recording; 0 replays without delays
+DEFAULT_REPLAY_SPEED = 1.0
+
+MODES = ("record", "replay")
+CASSETTE_VERSION = 1
+
+_BLANK_LINES = re.compile(r'\n{3,}')
+
+_current_recording: contextvars.ContextVar = contextvars.ContextVar("cassette_recording", default=None)
+
+
+def normalise_request(prompt: str, llm_config: Dict[str, Any], json_schema: Optional[Dict[str, Any]] = None,
+                      max_tokens: Optional[int] = None) -> Dict[str, Any]:
+    """The parts of a request that decide the response, without credentials, hosts or cosmetic whitespace."""
+    lines = [line.rstrip() for line in prompt.strip().split("\n")]
+    return {
+        "provider": llm_config["provider"],
+        "model": llm_config.get("model", ""),
+        "temperature": llm_config.get("temperature"),
+        "json_schema": json_schema,
+        "max_tokens": max_tokens,
+        "prompt": _BLANK_LINES.sub("\n\n", "\n".join(lines))
+    }
+
+
+def request_key(request: Dict[str, Any]) -> str:
+    """Stable hash of a normalised request."""
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _Recording:
+    """Chunks of one provider call, each with the milliseconds since the previous one."""
+
+    def __init__(self):
+        self.chunks: List[List[Any]] = []
+        self._last = time.monotonic()
+
+    def add(self, text: str) -> None:
+        now = time.monotonic()
+        self.chunks.append([round((now - self._last) * 1000), text])
+        self._last = now
+
+
+def record_chunks(chunks: Iterable[str]) -> Iterable[str]:
+    """Pass response chunks through, noting them and their timing if the call is being recorded."""
+    recording = _current_recording.get()
+    if recording is None:
+        return chunks
+
+    def recorded():
+        for chunk in chunks:
+            recording.add(chunk)
+            yield chunk
+
+    return recorded()
+
+
+class CassetteStore:
+    """Directory of gzipped cassettes, one per normalised request; the latest recording wins."""
+
+    def __init__(self, root: Path, mode: Optional[str] = None, speed: float = DEFAULT_REPLAY_SPEED):
+        if mode is not None and mode not in MODES:
+            raise ValueError(f"Unknown cassette mode: {mode} (expected one of {', '.join(MODES)})")
+        self.root = Path(root)
+        self.mode = mode
+        self.speed = speed
+
+    def path(self, key: str) -> Path:
+        return self.root / f"{key}.json.gz"
+
+    @contextmanager
+    def recording(self, request: Dict[str, Any]) -> Iterator[None]:
+        """Save the chunks of the provider call made in the block, if it succeeds."""
+        recording = _Recording()
+        reset = _current_recording.set(recording)
+        try:
+            yield
+        finally:
+            _current_recording.reset(reset)
+        self.save(request, recording.chunks)
+
+    def save(self, request: Dict[str, Any], chunks: List[List[Any]]) -> str:
+        key = request_key(request)
+        cassette = {
+            "version": CASSETTE_VERSION,
+            "recorded_at": time.time(),
+            "request": request,
+            "chunks": chunks
+        }
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so concurrent readers never see a partial cassette
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+                f.write(json.dumps(cassette, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        return key
+
+    def load(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        try:
+            with gzip.open(self.path(request_key(request)), "rb") as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    def replay(self, request: Dict[str, Any]) -> Iterator[str]:
+        """The recorded chunks, at the recorded pace divided by the replay speed."""
+        cassette = self.load(request)
+        if cassette is None:
+            raise Exception(f"No recorded response for this {request['provider']} request "
+                            f"(cassette {request_key(request)[:12]} not found in {self.root})")
+        return self._paced(cassette["chunks"])
+
+    def _paced(self, chunks: List[List[Any]]) -> Iterator[str]:
+        token = current_token()
+        for delay_ms, text in chunks:
+            if self.speed > 0 and delay_ms:
+                seconds = delay_ms / 1000 / self.speed
+                # Cancelling the generation cuts a long recorded pause short
+                if token is not None:
+                    token.wait(seconds)
+                else:
+                    time.sleep(seconds)
+            yield text
+
+
+# Global instance
+_cassette_store: Optional[CassetteStore] = None
+
+
+def get_cassette_store() -> CassetteStore:
+    """Get or create the global cassette store instance."""
+    global _cassette_store
+    if _cassette_store is None:
+        _cassette_store = CassetteStore(
+            Path(os.getenv("EDUADOCS_LLM_CASSETTE_DIR") or DEFAULT_ROOT),
+            mode=(os.getenv("EDUADOCS_LLM_CASSETTES") or "").strip().lower() or None,
+            speed=float(os.getenv("EDUADOCS_LLM_REPLAY_SPEED") or DEFAULT_REPLAY_SPEED)
+        )
+    return _cassette_store
@@ -0,0 +1,144 @@
+"""
+Automatic model selection.
+Every LLM call records its latency, output size and outcome per provider and
+model. In automatic mode each request goes to the candidate model that is
+capable enough for its expected output size and, according to those rolling
+statistics, likely to finish soonest; small jobs go to small, fast models and
+large documents to capable ones.
+"""
+
+import re
+import threading
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Capability of known hosted models: 1 small and fast, 2 mid-size, 3 most capable
+MODEL_CAPABILITY = {
+    "gemini-2.5-flash-lite": 1,
+    "gemini-2.5-flash": 2,
+    "gemini-2.5-pro": 3,
+    "gpt-5-nano": 1,
+    "gpt-4.1-nano": 1,
+    "gpt-4.1-mini": 2
+}
+DEFAULT_CAPABILITY = 2
+
+# Expected output tokens up to which each capability is enough
+CAPABILITY_TOKEN_LIMITS = [(1, 1500), (2, 4000)]
+# Expected output when the caller gives no budget (outlines, repairs)
+DEFAULT_JOB_TOKENS = 1000
+
+# Assumed throughput before a model has been measured, per capability
+PRIOR_TOKENS_PER_SECOND = {1: 120.0, 2: 80.0, 3: 40.0}
+# Weight of the prior, in seconds of measured generation
+PRIOR_SECONDS = 10.0
+# Relative cost of each capability level above the one a job needs
+CAPABILITY_COST = 0.5
+
+# Calls kept per model for the rolling statistics
+ROLLING_WINDOW = 50
+
+
+def model_capability(provider: str, model: str) -> int:
+    """Capability level of a model; local models are judged by their parameter count."""
+    if provider == "ollama":
+        size = re.search(r"(\d+(?:\.\d+)?)b\b", model.lower())
+        if size is None:
+            return 1
+        billions = float(size.group(1))
+        return 3 if billions >= 30 else 2 if billions >= 12 else 1
+    return MODEL_CAPABILITY.get(model, DEFAULT_CAPABILITY)
+
+
+def required_capability(max_tokens: Optional[int]) -> int:
+    """Smallest capability level suited to a job of this expected output size."""
+    tokens = max_tokens or DEFAULT_JOB_TOKENS
+    for capability, limit in CAPABILITY_TOKEN_LIMITS:
+        if tokens <= limit:
+            return capability
+    return 3
+
+
+class ModelRouter:
+    """Rolling per-model telemetry and the ranking of candidates built on it."""
+
+    def __init__(self, window: int):
+        """
+        Args:
+            window: Number of recent calls kept per model
+        """
+        self._calls: Dict[Tuple[str, str], deque] = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, model: str, seconds: float, output_tokens: int, ok: bool) -> None:
+        """Record the outcome of one call."""
+        with self._lock:
+            self._calls[(provider, model)].append((seconds, output_tokens, ok))
+
+    def expected_seconds(self, provider: str, model: str, tokens: int) -> float:
+        """Expected time for a call producing `tokens`, accounting for its failure rate."""
+        capability = model_capability(provider, model)
+        with self._lock:
+            calls = list(self._calls.get((provider, model), ()))
+
+        successes = [(seconds, output) for seconds, output, ok in calls if ok]
+        # Measured throughput, blended with the prior while few calls are known
+        total_seconds = sum(seconds for seconds, _ in successes) + PRIOR_SECONDS
+        total_tokens = sum(output for _, output in successes) + PRIOR_SECONDS * PRIOR_TOKENS_PER_SECOND[capability]
+        seconds = tokens / (total_tokens / total_seconds)
+
+        # A call that fails has to be retried elsewhere
+        success_rate = (len(successes) + 1) / (len(calls) + 1)
+        return seconds / success_rate
+
+    def rank(self, candidates: Sequence[Dict[str, Any]], max_tokens: Optional[int]) -> List[Dict[str, Any]]:
+        """
+        Order candidate configurations from best to worst for one request.
+
+        Models below the capability the job needs are only used when nothing
+        else is available; among the rest, faster models win and more capable
+        (costlier) ones than needed are penalised.
+        """
+        tokens = max_tokens or DEFAULT_JOB_TOKENS
+        required = required_capability(tokens)
+        best_available = max((model_capability(c["provider"], c["model"]) for c in candidates), default=0)
+        required = min(required, best_available)
+
+        def score(candidate):
+            capability = model_capability(candidate["provider"], candidate["model"])
+            seconds = self.expected_seconds(candidate["provider"], candidate["model"], tokens)
+            shortfall = max(0, required - capability)
+            excess = max(0, capability - required)
+            return (shortfall, seconds * (1 + CAPABILITY_COST * excess))
+
+        return sorted(candidates, key=score)
+
+    def stats(self) -> Dict[Tuple[str, str], Dict[str, float]]:
+        """Calls, median latency, throughput and error rate per model, for display."""
+        with self._lock:
+            snapshot = {key: list(calls) for key, calls in self._calls.items()}
+
+        stats = {}
+        for key, calls in snapshot.items():
+            successes = [(seconds, output) for seconds, output, ok in calls if ok]
+            latencies = sorted(seconds for seconds, _ in successes)
+            busy = sum(seconds for seconds, _ in successes)
+            stats[key] = {
+                "calls": len(calls),
+                "p50_seconds": latencies[len(latencies) // 2] if latencies else 0.0,
+                "tokens_per_second": sum(output for _, output in successes) / busy if busy else 0.0,
+                "error_rate": 1 - len(successes) / len(calls)
+            }
+        return stats
+
+
+# Global instance
+_model_router: Optional[ModelRouter] = None
+
+
+def get_model_router() -> ModelRouter:
+    """Get or create the global model router instance."""
+    global _model_router
+    if _model_router is None:
+        _model_router = ModelRouter(window=ROLLING_WINDOW)
+    return _model_router
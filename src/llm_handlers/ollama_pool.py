@@ -0,0 +1,202 @@
+"""
+Pool of Ollama hosts for spreading generations over several inference machines.
+A background thread health-checks every host and records which models each
+one has available and loaded. Requests go to the healthy host with the fewest
+outstanding requests, preferring hosts where the model is already warm, and
+hosts that fail are ejected until a health check succeeds again.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+import requests
+
+DEFAULT_HEALTH_INTERVAL_SECONDS = 15
+
+# Outstanding requests a warm host may have beyond a cold one before the cold
+# host is used instead, roughly what loading the model there costs
+COLD_HOST_PENALTY = 2
+
+# Pools kept for distinct host lists; the least recently used one beyond this
+# is stopped, so every host string typed into the app does not leak a thread
+MAX_POOLS = 8
+
+_HEALTH_TIMEOUT_SECONDS = 3
+
+
+class _HostState:
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = False
+        self.outstanding = 0
+        self.available: Set[str] = set()
+        self.loaded: Set[str] = set()
+        self.last_error = ""
+
+
+class OllamaPool:
+    """Routes Ollama requests across hosts by load, model warmth and health."""
+
+    def __init__(self, hosts: Sequence[str], health_interval_seconds: float):
+        """
+        Args:
+            hosts: Base URLs of the Ollama servers
+            health_interval_seconds: Time between background health checks
+        """
+        self.health_interval_seconds = health_interval_seconds
+        self._hosts = {url: _HostState(url) for url in hosts}
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self._checked = threading.Event()
+        self._stopped = threading.Event()
+
+        thread = threading.Thread(target=self._health_loop, daemon=True)
+        thread.start()
+
+    def _health_loop(self) -> None:
+        try:
+            self.check_health()
+        finally:
+            self._checked.set()
+        while not self._stopped.wait(self.health_interval_seconds):
+            self.check_health()
+        self._session.close()
+
+    def wait_until_checked(self) -> None:
+        """Block until the first health check has finished, so requests are routed on known state."""
+        self._checked.wait()
+
+    def stop(self) -> None:
+        """Stop the background health checks; requests already routed are unaffected."""
+        self._stopped.set()
+
+    def check_health(self) -> None:
+        """Query every host for its available and loaded models; re-admit hosts that answer."""
+        for state in list(self._hosts.values()):
+            try:
+                tags = self._session.get(f"{state.url}/api/tags", timeout=_HEALTH_TIMEOUT_SECONDS)
+                tags.raise_for_status()
+                running = self._session.get(f"{state.url}/api/ps", timeout=_HEALTH_TIMEOUT_SECONDS)
+                loaded = {model["name"] for model in running.json().get("models", [])} if running.ok else set()
+                available = {model["name"] for model in tags.json().get("models", [])}
+            except (requests.exceptions.RequestException, ValueError) as e:
+                with self._lock:
+                    state.healthy = False
+                    state.last_error = str(e)
+                continue
+
+            with self._lock:
+                state.healthy = True
+                state.available = available
+                state.loaded = loaded
+                state.last_error = ""
+
+    def models(self) -> List[str]:
+        """Models available on at least one healthy host."""
+        with self._lock:
+            return sorted({model for state in self._hosts.values() if state.healthy for model in state.available})
+
+    def status(self) -> Dict[str, Dict[str, object]]:
+        """Health, load and warm models per host, for display."""
+        with self._lock:
+            return {
+                url: {
+                    "healthy": state.healthy,
+                    "outstanding": state.outstanding,
+                    "loaded": sorted(state.loaded),
+                    "error": state.last_error
+                }
+                for url, state in self._hosts.items()
+            }
+
+    def choose(self, model: str, exclude: Sequence[str] = ()) -> Optional[str]:
+        """The best host for a model right now, or None if no healthy host has it."""
+        with self._lock:
+            return self._choose(model, exclude)
+
+    def _choose(self, model: str, exclude: Sequence[str]) -> Optional[str]:
+        best: Optional[Tuple[int, str]] = None
+        for url, state in self._hosts.items():
+            if not state.healthy or url in exclude or model not in state.available:
+                continue
+            cost = state.outstanding + (0 if model in state.loaded else COLD_HOST_PENALTY)
+            if best is None or cost < best[0]:
+                best = (cost, url)
+        return best[1] if best else None
+
+    @contextmanager
+    def acquire(self, model: str, exclude: Sequence[str] = ()) -> Iterator[str]:
+        """
+        Reserve the best host for one request and yield its URL.
+
+        Raises:
+            Exception: If no healthy host has the model
+        """
+        with self._lock:
+            url = self._choose(model, exclude)
+            if url is None:
+                raise Exception(self._unavailable_message(model))
+            state = self._hosts[url]
+            state.outstanding += 1
+
+        try:
+            yield url
+        finally:
+            with self._lock:
+                state.outstanding -= 1
+
+    def mark_loaded(self, url: str, model: str) -> None:
+        """Record that a host served the model, so it now holds it in memory."""
+        with self._lock:
+            self._hosts[url].loaded.add(model)
+
+    def eject(self, url: str, error: str) -> None:
+        """Stop routing to a host until a health check succeeds again."""
+        with self._lock:
+            state = self._hosts[url]
+            state.healthy = False
+            state.last_error = error
+        print(f"Warning: Ejected Ollama host {url}: {error}")
+
+    def _unavailable_message(self, model: str) -> str:
+        healthy = [state for state in self._hosts.values() if state.healthy]
+        if not healthy:
+            return "No Ollama host is reachable. Make sure Ollama is running with 'ollama serve'."
+        available = sorted({name for state in healthy for name in state.available})
+        return f"Model '{model}' not found. Available models: {', '.join(available)}"
+
+
+def parse_hosts(host_text: str) -> List[str]:
+    """Split a comma-separated list of Ollama URLs."""
+    return [host.strip().rstrip("/") for host in host_text.split(",") if host.strip()]
+
+
+# Global instances, one per set of hosts, least recently used first
+_pools: "OrderedDict[Tuple[str, ...], OllamaPool]" = OrderedDict()
+_pools_lock = threading.Lock()
+
+
+def get_ollama_pool(hosts: Sequence[str]) -> OllamaPool:
+    """Get or create the shared pool for a set of hosts."""
+    key = tuple(sorted(hosts))
+    evicted = []
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = OllamaPool(
+                key,
+                health_interval_seconds=float(os.getenv("EDUADOCS_OLLAMA_HEALTH_SECONDS") or DEFAULT_HEALTH_INTERVAL_SECONDS)
+            )
+            while len(_pools) > MAX_POOLS:
+                evicted.append(_pools.popitem(last=False)[1])
+        else:
+            _pools.move_to_end(key)
+
+    for old_pool in evicted:
+        old_pool.stop()
+    # Waiting outside the registry lock keeps unreachable hosts from stalling other pools
+    pool.wait_until_checked()
+    return pool
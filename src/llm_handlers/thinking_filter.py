@@ -0,0 +1,126 @@
+"""
+Incremental removal of reasoning blocks from LLM output.
+Reasoning models wrap their thinking in <think>...</think>. The filter is fed
+the response chunk by chunk, drops everything inside those tags as it
+arrives (tags may be split across chunks) and tidies the whitespace left
+behind, so hidden preambles are never buffered and never reach the preview.
+Each character is examined once; only a partial tag or a run of whitespace
+is held back between chunks.
+"""
+
+import re
+
+_OPEN_TAG = re.compile(r'<think\s*(/?)\s*>', re.IGNORECASE)
+_CLOSE_TAG = re.compile(r'</think\s*>', re.IGNORECASE)
+# An incomplete tag at the end of a chunk, to be completed by the next one
+_PARTIAL_OPEN_TAG = re.compile(r'<(?:t(?:h(?:i(?:n(?:k\s*/?\s*)?)?)?)?)?\Z', re.IGNORECASE)
+_PARTIAL_CLOSE_TAG = re.compile(r'<(?:/(?:t(?:h(?:i(?:n(?:k\s*)?)?)?)?)?)?\Z', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+# Longest partial tag held back; anything longer is not a tag
+_MAX_PENDING = 32
+
+
+class ThinkingFilter:
+    """Streaming equivalent of stripping <think> blocks and normalising whitespace.
+
+    Visible text comes out with leading and trailing whitespace removed,
+    trailing spaces removed from each line and blank lines collapsed to one.
+    """
+
+    def __init__(self):
+        self._inside = False
+        self._pending = ""
+        self._started = False
+        # Whitespace run not yet emitted: newline count and the text after the last newline
+        self._newlines = 0
+        self._indent = ""
+
+    def feed(self, chunk: str) -> str:
+        """Return the visible text of the next chunk."""
+        text = self._pending + chunk if self._pending else chunk
+        self._pending = ""
+        # Fast path: nothing tag-like and no reasoning block open
+        if not self._inside and "<" not in text:
+            return self._visible(text)
+
+        visible = []
+        pos = 0
+        while pos < len(text):
+            if self._inside:
+                close = _CLOSE_TAG.search(text, pos)
+                if close is None:
+                    partial = _PARTIAL_CLOSE_TAG.search(text, max(pos, len(text) - _MAX_PENDING))
+                    if partial is not None:
+                        self._pending = partial.group(0)
+                    break
+                self._inside = False
+                pos = close.end()
+                continue
+
+            start = text.find("<", pos)
+            if start == -1:
+                visible.append(text[pos:])
+                break
+            visible.append(text[pos:start])
+
+            tag = _OPEN_TAG.match(text, start)
+            if tag is not None:
+                # <think/> is dropped without opening a block
+                self._inside = not tag.group(1)
+                pos = tag.end()
+            elif len(text) - start <= _MAX_PENDING and _PARTIAL_OPEN_TAG.match(text, start):
+                self._pending = text[start:]
+                break
+            else:
+                visible.append("<")
+                pos = start + 1
+
+        return self._visible("".join(visible))
+
+    def finish(self) -> str:
+        """Return what is left once the response has ended."""
+        pending, self._pending = self._pending, ""
+        if self._inside or not pending:
+            # An unterminated reasoning block stays hidden
+            return ""
+        return self._visible(pending)
+
+    def _visible(self, text: str) -> str:
+        """Normalise whitespace, holding back a trailing run until more text follows."""
+        # Fast path for the common chunk within a line: only trailing spaces are held back
+        if self._started and not self._newlines and "\n" not in text:
+            text = self._indent + text
+            stripped = text.rstrip()
+            self._indent = text[len(stripped):]
+            return stripped
+
+        out = []
+        pos = 0
+        for match in _WHITESPACE.finditer(text):
+            if match.start() > pos:
+                out.append(self._flush_whitespace())
+                out.append(text[pos:match.start()])
+                self._started = True
+            self._hold_whitespace(match.group(0))
+            pos = match.end()
+        if pos < len(text):
+            out.append(self._flush_whitespace())
+            out.append(text[pos:])
+            self._started = True
+        return "".join(out)
+
+    def _hold_whitespace(self, run: str) -> None:
+        newlines = run.count("\n")
+        if newlines:
+            self._newlines += newlines
+            self._indent = run[run.rfind("\n") + 1:]
+        else:
+            self._indent += run
+
+    def _flush_whitespace(self) -> str:
+        newlines, indent = self._newlines, self._indent
+        self._newlines, self._indent = 0, ""
+        if not self._started:
+            return ""
+        return "\n" * min(newlines, 2) + indent
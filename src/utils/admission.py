@@ -0,0 +1,257 @@
+"""
+Server-wide admission control for LLM requests.
+All Streamlit sessions share one controller, which caps how many requests
+run at once per LLM provider and admits waiting requests round-robin across
+sessions, so one teacher queueing several documents cannot starve the others.
+Every provider request takes its own slot, so generations that fan out into
+several concurrent requests (lesson packs, several languages, source
+material summaries) count each of them against the cap.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+# Concurrent requests per provider, overridable with EDUADOCS_CONCURRENCY_<PROVIDER>
+DEFAULT_LIMITS = {
+    "ollama": 2,
+    "huggingface": 2,
+    "openai": 8,
+    "google": 8
+}
+DEFAULT_LIMIT = 4
+DEFAULT_QUEUE_TIMEOUT_SECONDS = 600
+
+# Assumed request time before any request has been measured
+_INITIAL_ESTIMATE_SECONDS = 30.0
+# Weight of the latest request in the moving average of durations
+_ESTIMATE_SMOOTHING = 0.3
+
+
+class AdmissionController:
+    """Per-provider concurrency caps with fair queueing across sessions."""
+
+    def __init__(self, limits: Dict[str, int], default_limit: int, timeout_seconds: float, poll_seconds: float = 0.5):
+        """
+        Args:
+            limits: Maximum concurrent requests per provider
+            default_limit: Limit for providers not in `limits`
+            timeout_seconds: Longest a request waits in the queue before giving up
+            poll_seconds: How often waiting requests report their queue position
+        """
+        self.limits = limits
+        self.default_limit = default_limit
+        self.timeout_seconds = timeout_seconds
+        self.poll_seconds = poll_seconds
+        self._cond = threading.Condition()
+        self._active: Dict[str, int] = defaultdict(int)
+        # Per provider: sessions in round-robin order, and each session's waiting tickets
+        self._rotation: Dict[str, deque] = defaultdict(deque)
+        self._waiting: Dict[str, Dict[str, deque]] = defaultdict(dict)
+        self._durations: Dict[str, float] = {}
+
+    def limit(self, provider: str) -> int:
+        return self.limits.get(provider, self.default_limit)
+
+    @contextmanager
+    def admit(self, provider: str, session_id: str,
+              on_wait: Optional[Callable[[int, float], None]] = None) -> Iterator[None]:
+        """
+        Wait for a request slot for `provider` and hold it for the block.
+
+        Args:
+            provider: LLM provider the request goes to
+            session_id: Requests are admitted round-robin across sessions
+            on_wait: Called while queued with the number of requests ahead
+                and the estimated wait in seconds
+
+        Raises:
+            TimeoutError: If no slot frees up within the queue timeout
+        """
+        ticket = object()
+        deadline = time.monotonic() + self.timeout_seconds
+
+        with self._cond:
+            queue = self._waiting[provider].get(session_id)
+            if queue is None:
+                queue = self._waiting[provider][session_id] = deque()
+                self._rotation[provider].append(session_id)
+            queue.append(ticket)
+
+        try:
+            while True:
+                with self._cond:
+                    if self._active[provider] < self.limit(provider) and self._head(provider) is ticket:
+                        self._dequeue(provider, session_id)
+                        self._active[provider] += 1
+                        break
+                    ahead = self._position(provider, session_id, ticket)
+
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"No {provider} request slot became free within {self.timeout_seconds:.0f} seconds")
+                # Report outside the lock; the callback may update the UI
+                if on_wait:
+                    on_wait(ahead, self.estimated_wait(provider, ahead))
+
+                with self._cond:
+                    self._cond.wait(self.poll_seconds)
+        except BaseException:
+            with self._cond:
+                self._remove(provider, session_id, ticket)
+                self._cond.notify_all()
+            raise
+
+        start = time.monotonic()
+        completed = False
+        try:
+            yield
+            completed = True
+        finally:
+            with self._cond:
+                self._active[provider] -= 1
+                # Cancelled requests say nothing about how long one takes
+                if completed:
+                    self._record_duration(provider, time.monotonic() - start)
+                self._cond.notify_all()
+
+    def estimated_wait(self, provider: str, ahead: int) -> float:
+        """Seconds until a request with `ahead` requests in front of it is likely admitted."""
+        average = self._durations.get(provider, _INITIAL_ESTIMATE_SECONDS)
+        return (ahead // self.limit(provider) + 1) * average
+
+    def _head(self, provider: str) -> Optional[object]:
+        """The ticket admitted next: the oldest ticket of the session first in rotation."""
+        rotation = self._rotation[provider]
+        if not rotation:
+            return None
+        return self._waiting[provider][rotation[0]][0]
+
+    def _dequeue(self, provider: str, session_id: str) -> None:
+        """Admit the head ticket and move its session to the back of the rotation."""
+        rotation = self._rotation[provider]
+        queue = self._waiting[provider][session_id]
+        queue.popleft()
+        rotation.popleft()
+        if queue:
+            rotation.append(session_id)
+        else:
+            del self._waiting[provider][session_id]
+
+    def _remove(self, provider: str, session_id: str, ticket: object) -> None:
+        """Drop a ticket that gave up waiting."""
+        queue = self._waiting[provider].get(session_id)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        if not queue:
+            del self._waiting[provider][session_id]
+            self._rotation[provider].remove(session_id)
+
+    def _position(self, provider: str, session_id: str, ticket: object) -> int:
+        """Number of tickets admitted before this one if the rotation plays out."""
+        index = self._waiting[provider][session_id].index(ticket)
+        ahead = 0
+        for other in self._rotation[provider]:
+            if other == session_id:
+                # Sessions after this one only get `index` turns before it
+                ahead += index
+                continue
+            queued = len(self._waiting[provider][other])
+            before = self._rotation[provider].index(other) < self._rotation[provider].index(session_id)
+            ahead += min(queued, index + 1 if before else index)
+        return ahead
+
+    def _record_duration(self, provider: str, seconds: float) -> None:
+        previous = self._durations.get(provider)
+        if previous is None:
+            self._durations[provider] = seconds
+        else:
+            self._durations[provider] = (1 - _ESTIMATE_SMOOTHING) * previous + _ESTIMATE_SMOOTHING * seconds
+
+
+class AdmissionScope:
+    """Queue state of one session's generation, shared by all the LLM requests it makes."""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self._waiting: Dict[object, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def queue_position(self) -> Optional[Tuple[int, float]]:
+        """Requests ahead and estimated wait of the request closest to a slot, if any is queued."""
+        with self._lock:
+            return min(self._waiting.values(), default=None)
+
+    def _set_waiting(self, request: object, ahead: int, wait_seconds: float) -> None:
+        with self._lock:
+            self._waiting[request] = (ahead, wait_seconds)
+
+    def _clear_waiting(self, request: object) -> None:
+        with self._lock:
+            self._waiting.pop(request, None)
+
+
+_current_scope: contextvars.ContextVar = contextvars.ContextVar("admission_scope", default=None)
+
+
+@contextmanager
+def admission_scope(session_id: str) -> Iterator[AdmissionScope]:
+    """Queue the LLM requests made in this context under `session_id`."""
+    scope = AdmissionScope(session_id)
+    reset = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(reset)
+
+
+@contextmanager
+def admit_request(provider: str, check: Optional[Callable[[], None]] = None) -> Iterator[None]:
+    """
+    Hold a slot for one request to `provider` for the block.
+
+    The request queues under the session of the current admission scope, or
+    with all requests made outside one. `check` is called while it waits and
+    may raise to give up, e.g. when the generation is cancelled.
+    """
+    scope = _current_scope.get()
+    request = object()
+
+    def on_wait(ahead, wait_seconds):
+        if check:
+            check()
+        if scope is not None:
+            scope._set_waiting(request, ahead, wait_seconds)
+
+    try:
+        with get_admission_controller().admit(provider, scope.session_id if scope else "", on_wait):
+            if scope is not None:
+                scope._clear_waiting(request)
+            yield
+    finally:
+        if scope is not None:
+            scope._clear_waiting(request)
+
+
+# Global instance
+_admission_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """Get or create the global admission controller instance."""
+    global _admission_controller
+    if _admission_controller is None:
+        limits = {
+            provider: int(os.getenv(f"EDUADOCS_CONCURRENCY_{provider.upper()}") or limit)
+            for provider, limit in DEFAULT_LIMITS.items()
+        }
+        _admission_controller = AdmissionController(
+            limits,
+            default_limit=DEFAULT_LIMIT,
+            timeout_seconds=float(os.getenv("EDUADOCS_QUEUE_TIMEOUT_SECONDS") or DEFAULT_QUEUE_TIMEOUT_SECONDS)
+        )
+    return _admission_controller
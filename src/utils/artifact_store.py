@@ -0,0 +1,130 @@
+"""
+Content-addressed on-disk store for generated files.
+Outputs are written once under their SHA-256 hash, so identical documents are
+deduplicated, and old or excess files are evicted to bound disk usage.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Callable, Optional
+
+# Defaults, overridable through the environment
+DEFAULT_ROOT = Path(tempfile.gettempdir()) / "eduadocs-artifacts"
+DEFAULT_MAX_MB = 512
+DEFAULT_MAX_AGE_HOURS = 24
+
+# Read size when hashing a written file
+_HASH_BLOCK_BYTES = 1024 * 1024
+
+
+class ArtifactStore:
+    """Stores generated files on disk keyed by content hash."""
+
+    def __init__(self, root: Path, max_bytes: int, max_age_seconds: float):
+        """
+        Args:
+            root: Directory holding the stored files
+            max_bytes: Total size above which the oldest files are evicted
+            max_age_seconds: Files not used for this long are evicted
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+
+    def put(self, data, suffix: str = "") -> str:
+        """
+        Store bytes (or any bytes-like object) and return their key.
+
+        Identical content is only written once; storing it again just marks
+        the existing file as recently used.
+        """
+        return self.write(lambda f: f.write(data), suffix)
+
+    def write(self, writer: Callable[[BinaryIO], None], suffix: str = "") -> str:
+        """
+        Store what `writer` writes to a binary file and return its key.
+
+        The output is spooled straight to disk and hashed from there, so it
+        is not held in memory while it is written; identical content is kept once.
+        """
+        # Write to a temporary file first so readers never see partial files
+        fd, tmp_name = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w+b") as f:
+                writer(f)
+                f.seek(0)
+                digest = hashlib.sha256()
+                for block in iter(lambda: f.read(_HASH_BLOCK_BYTES), b""):
+                    digest.update(block)
+            key = digest.hexdigest() + suffix
+            path = self.path(key)
+            if path.exists():
+                os.utime(path)
+                Path(tmp_name).unlink()
+                return key
+            os.replace(tmp_name, path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+
+        self.evict()
+        return key
+
+    def path(self, key: str) -> Path:
+        """Path of a stored file (which may have been evicted)."""
+        return self.root / key
+
+    def exists(self, key: str) -> bool:
+        return self.path(key).exists()
+
+    def open(self, key: str) -> BinaryIO:
+        """Open a stored file for reading; raises FileNotFoundError if evicted."""
+        path = self.path(key)
+        f = open(path, "rb")
+        os.utime(path)
+        return f
+
+    def evict(self) -> None:
+        """Remove files past the age limit, then the least recently used beyond the size limit."""
+        with self._lock:
+            now = time.time()
+            entries = []
+            for path in self.root.iterdir():
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                # Leave other writers' in-progress files alone unless they are stale
+                if path.suffix == ".tmp" and now - stat.st_mtime < self.max_age_seconds:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            entries.sort()
+            total = sum(size for _, size, _ in entries)
+            for mtime, size, path in entries:
+                if now - mtime <= self.max_age_seconds and total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+
+
+# Global instance
+_artifact_store: Optional[ArtifactStore] = None
+
+
+def get_artifact_store() -> ArtifactStore:
+    """Get or create the global artifact store instance."""
+    global _artifact_store
+    if _artifact_store is None:
+        _artifact_store = ArtifactStore(
+            Path(os.getenv("EDUADOCS_ARTIFACT_DIR") or DEFAULT_ROOT),
+            max_bytes=int(float(os.getenv("EDUADOCS_ARTIFACT_MAX_MB") or DEFAULT_MAX_MB) * 1024 * 1024),
+            max_age_seconds=float(os.getenv("EDUADOCS_ARTIFACT_MAX_AGE_HOURS") or DEFAULT_MAX_AGE_HOURS) * 3600
+        )
+    return _artifact_store
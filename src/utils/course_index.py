@@ -0,0 +1,145 @@
+"""
+Per-course retrieval index over uploaded course material.
+Files are split into chunks and stored in an SQLite FTS5 inverted index, which
+ranks chunks with BM25, is persisted on disk and grows incrementally as new
+files are added. Retrieved chunks ground generation prompts in the material.
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional
+
+from utils.document_ingestion import iter_text_chunks
+from utils.text_index import connect, estimate_tokens, match_query, normalize_text
+
+DEFAULT_PATH = Path(tempfile.gettempdir()) / "eduadocs-course-index.sqlite3"
+DEFAULT_CONTEXT_TOKENS = 1500
+
+# Small chunks keep retrieved context focused and cheap to fit in a prompt
+CHUNK_CHARS = 1200
+
+# Candidates fetched from the index before the token budget is applied
+_CANDIDATES = 20
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    course TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    name TEXT NOT NULL,
+    added REAL NOT NULL,
+    UNIQUE (course, fingerprint)
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    document_id INTEGER NOT NULL REFERENCES documents (id),
+    course TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_course ON chunks (course);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts
+    USING fts5(text, content='chunks', content_rowid='id', tokenize='unicode61 remove_diacritics 2');
+CREATE TRIGGER IF NOT EXISTS chunks_fts_insert AFTER INSERT ON chunks BEGIN
+    INSERT INTO chunks_fts (rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+
+def course_key(subject: str) -> str:
+    """Courses are identified by their subject, ignoring case and accents."""
+    return normalize_text(subject)
+
+
+class CourseIndex:
+    """Chunks uploaded course material and retrieves the chunks most relevant to a topic."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with connect(self.path) as conn:
+            conn.executescript(_SCHEMA)
+
+    def add_document(self, course: str, file: BinaryIO, file_name: str) -> int:
+        """
+        Index a file for a course; files already indexed for the course are skipped.
+
+        Returns:
+            Number of chunks added
+        """
+        digest = hashlib.sha256()
+        file.seek(0)
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+        file.seek(0)
+
+        with connect(self.path) as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO documents (course, fingerprint, name, added) VALUES (?, ?, ?, ?)",
+                (course, digest.hexdigest(), file_name, time.time())
+            )
+            if not cursor.rowcount:
+                return 0
+            document_id = cursor.lastrowid
+
+            added = 0
+            for chunk in iter_text_chunks(file, file_name, CHUNK_CHARS):
+                conn.execute(
+                    "INSERT INTO chunks (document_id, course, text) VALUES (?, ?, ?)",
+                    (document_id, course, chunk)
+                )
+                added += 1
+            return added
+
+    def search(self, course: str, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """Return the chunks of a course most relevant to the query, best matches first."""
+        match = match_query(query)
+        if not match:
+            return []
+
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                "SELECT c.text, d.name, bm25(chunks_fts) AS score FROM chunks_fts "
+                "JOIN chunks c ON c.id = chunks_fts.rowid JOIN documents d ON d.id = c.document_id "
+                "WHERE chunks_fts MATCH ? AND c.course = ? ORDER BY score LIMIT ?",
+                (match, course, limit)
+            ).fetchall()
+
+        return [{"text": row["text"], "document": row["name"], "score": -row["score"]} for row in rows]
+
+    def retrieve(self, course: str, query: str, token_budget: int) -> List[Dict[str, Any]]:
+        """Top-ranked chunks for the query that fit together within the token budget."""
+        selected = []
+        used = 0
+        for chunk in self.search(course, query, _CANDIDATES):
+            tokens = estimate_tokens(chunk["text"])
+            if used + tokens > token_budget:
+                continue
+            selected.append(chunk)
+            used += tokens
+        return selected
+
+    def documents(self, course: str) -> List[str]:
+        """Names of the files indexed for a course."""
+        with connect(self.path) as conn:
+            rows = conn.execute("SELECT name FROM documents WHERE course = ? ORDER BY added", (course,)).fetchall()
+        return [row["name"] for row in rows]
+
+
+# Global instance
+_course_index: Optional[CourseIndex] = None
+
+
+def get_course_index() -> CourseIndex:
+    """Get or create the global course index instance."""
+    global _course_index
+    if _course_index is None:
+        _course_index = CourseIndex(Path(os.getenv("EDUADOCS_COURSE_INDEX") or DEFAULT_PATH))
+    return _course_index
+
+
+def context_token_budget() -> int:
+    """Token budget for retrieved course material in a single prompt."""
+    return int(os.getenv("EDUADOCS_COURSE_CONTEXT_TOKENS") or DEFAULT_CONTEXT_TOKENS)
@@ -0,0 +1,128 @@
+"""
+Streaming text extraction from uploaded source material.
+DOCX, PDF and plain-text files are read incrementally and yielded as chunks of
+bounded size, so memory use depends on the chunk size rather than the file.
+"""
+
+import io
+import zipfile
+from typing import BinaryIO, Iterator
+
+# Default maximum characters per chunk
+DEFAULT_CHUNK_CHARS = 8000
+
+_WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def iter_text_chunks(file: BinaryIO, file_name: str, chunk_chars: int = DEFAULT_CHUNK_CHARS) -> Iterator[str]:
+    """
+    Yield the text of an uploaded file in chunks of at most `chunk_chars` characters.
+
+    Chunks end on paragraph boundaries where possible.
+
+    Args:
+        file: Binary file-like object positioned at the start of the file
+        file_name: Original file name, used to pick the reader
+        chunk_chars: Maximum characters per chunk
+    """
+    extension = file_name.rsplit(".", 1)[-1].lower() if "." in file_name else ""
+
+    if extension == "docx":
+        paragraphs = _iter_docx_paragraphs(file)
+    elif extension == "pdf":
+        paragraphs = _iter_pdf_paragraphs(file)
+    else:
+        paragraphs = _iter_text_paragraphs(file, chunk_chars)
+
+    chunk = []
+    size = 0
+    for paragraph in paragraphs:
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+
+        # Split paragraphs that are too long to fit in any chunk
+        while len(paragraph) > chunk_chars:
+            if chunk:
+                yield "\n".join(chunk)
+                chunk, size = [], 0
+            yield paragraph[:chunk_chars]
+            paragraph = paragraph[chunk_chars:]
+
+        if size + len(paragraph) > chunk_chars and chunk:
+            yield "\n".join(chunk)
+            chunk, size = [], 0
+        chunk.append(paragraph)
+        size += len(paragraph) + 1
+
+    if chunk:
+        yield "\n".join(chunk)
+
+
+def _iter_text_paragraphs(file: BinaryIO, max_chars: int) -> Iterator[str]:
+    """
+    Read plain text line by line, grouping lines into blank-line separated paragraphs.
+
+    Paragraphs are cut once they reach `max_chars` and lines are read at most
+    `max_chars` characters at a time, so text without blank lines or line
+    breaks is never held in memory as a whole.
+    """
+    reader = io.TextIOWrapper(file, encoding="utf-8", errors="replace")
+    try:
+        paragraph = ""
+        # Whether the last read stopped in the middle of a line
+        continued = False
+        while True:
+            line = reader.readline(max_chars)
+            if not line:
+                break
+            ends_line = line.endswith("\n")
+            text = line if continued else line.lstrip()
+            if ends_line:
+                text = text.rstrip()
+
+            if continued:
+                paragraph += text
+            elif text:
+                paragraph = f"{paragraph} {text}" if paragraph else text
+            elif paragraph:
+                # Blank line
+                yield paragraph
+                paragraph = ""
+            continued = not ends_line
+
+            if len(paragraph) >= max_chars:
+                yield paragraph
+                paragraph = ""
+        if paragraph.strip():
+            yield paragraph
+    finally:
+        # Leave the caller's file open
+        reader.detach()
+
+
+def _iter_docx_paragraphs(file: BinaryIO) -> Iterator[str]:
+    """Stream paragraphs out of word/document.xml without building the whole tree."""
+    from lxml import etree
+
+    with zipfile.ZipFile(file) as archive:
+        with archive.open("word/document.xml") as document_xml:
+            for _, element in etree.iterparse(document_xml, events=("end",), tag=f"{_WORD_NAMESPACE}p"):
+                yield "".join(text.text or "" for text in element.iter(f"{_WORD_NAMESPACE}t"))
+                # Free the paragraph and any already processed siblings
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+
+
+def _iter_pdf_paragraphs(file: BinaryIO) -> Iterator[str]:
+    """Extract text page by page."""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise Exception("pypdf library not installed for PDF source material. Install with: pip install pypdf")
+
+    for page in PdfReader(file).pages:
+        text = page.extract_text() or ""
+        for paragraph in text.split("\n\n"):
+            yield " ".join(paragraph.split())
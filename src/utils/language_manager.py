@@ -1,16 +1,44 @@
 """
 Language management utility for multi-language support in the app.
-Handles loading and retrieving localized text from JSON files.
+Handles loading and retrieving localized text from JSON files, which are
+compiled on first use into flat lookup tables and reloaded when they change.
 """
 
 import json
+import sys
+import threading
+import time
 import streamlit as st
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 
 # Path to locales folder
 LOCALES_DIR = Path(__file__).parent.parent.parent / "locales"
 
+# Language whose keys every other locale is checked against
+REFERENCE_LANGUAGE = "en"
+
+# Minimum seconds between checks of a locale file for changes
+RELOAD_CHECK_SECONDS = 2.0
+
+
+def _compile(value: Any, prefix: str, table: Dict[str, Any]) -> Any:
+    """Flatten nested locale data into `table` under dotted keys and return the interned value."""
+    if isinstance(value, dict):
+        compiled = {}
+        for key, child in value.items():
+            compiled[sys.intern(key)] = _compile(child, f"{prefix}.{key}" if prefix else key, table)
+    elif isinstance(value, list):
+        compiled = [_compile(item, "", {}) for item in value]
+    elif isinstance(value, str):
+        compiled = sys.intern(value)
+    else:
+        compiled = value
+    
+    if prefix:
+        table[sys.intern(prefix)] = compiled
+    return compiled
+
 
 class LanguageManager:
     """Manages language selection and localization for the app."""
@@ -22,21 +50,64 @@ class LanguageManager:
     }
     
     def __init__(self):
-        """Initialize the language manager and load all language files."""
-        self.languages = {}
-        self._load_all_languages()
+        """Initialize the language manager; locale files are loaded on first use."""
+        # Per language: (file mtime, flat key -> value table, time of last change check)
+        self._tables: Dict[str, Tuple[float, Dict[str, Any], float]] = {}
+        self._warned_keys = set()
+        self._lock = threading.Lock()
     
-    def _load_all_languages(self) -> None:
-        """Load all language JSON files from the locales directory."""
-        for lang_name, lang_code in self.SUPPORTED_LANGUAGES.items():
+    def _get_table(self, lang_code: str) -> Dict[str, Any]:
+        """Return the flat lookup table for a language, loading or reloading it if needed."""
+        entry = self._tables.get(lang_code)
+        now = time.monotonic()
+        if entry is not None and now - entry[2] < RELOAD_CHECK_SECONDS:
+            return entry[1]
+        
+        with self._lock:
+            entry = self._tables.get(lang_code)
+            locale_file = LOCALES_DIR / f"{lang_code}.json"
             try:
-                locale_file = LOCALES_DIR / f"{lang_code}.json"
-                with open(locale_file, "r", encoding="utf-8") as f:
-                    self.languages[lang_code] = json.load(f)
+                mtime = locale_file.stat().st_mtime
             except FileNotFoundError:
-                print(f"Warning: Language file not found: {locale_file}")
-            except json.JSONDecodeError as e:
-                print(f"Warning: Error parsing language file {lang_code}.json: {e}")
+                mtime = None
+            
+            if entry is not None and entry[0] == mtime:
+                self._tables[lang_code] = (mtime, entry[1], now)
+                return entry[1]
+            
+            table = self._load_table(lang_code, locale_file)
+            if table is None:
+                # Keep serving the last good version of a file being edited
+                table = entry[1] if entry is not None else {}
+            self._tables[lang_code] = (mtime, table, now)
+        
+        if lang_code != REFERENCE_LANGUAGE and table:
+            self._report_missing_keys(lang_code, table)
+        return table
+    
+    def _load_table(self, lang_code: str, locale_file: Path) -> Optional[Dict[str, Any]]:
+        """Read a locale file and compile it into a flat table."""
+        try:
+            with open(locale_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            print(f"Warning: Language file not found: {locale_file}")
+            return None
+        except json.JSONDecodeError as e:
+            print(f"Warning: Error parsing language file {lang_code}.json: {e}")
+            return None
+        
+        table = {}
+        _compile(data, "", table)
+        return table
+    
+    def _report_missing_keys(self, lang_code: str, table: Dict[str, Any]) -> None:
+        """Warn once per load about keys the reference language has and this one lacks."""
+        missing = sorted(key for key in self._get_table(REFERENCE_LANGUAGE) if key not in table)
+        if missing:
+            print(f"Warning: {len(missing)} key(s) missing for language {lang_code}: {', '.join(missing)}")
+        # Missing keys were reported for this version; don't repeat it per lookup
+        self._warned_keys.update((lang_code, key) for key in missing)
     
     def get_current_language(self) -> str:
         """Get the current language code from session state."""
@@ -70,18 +141,14 @@ class LanguageManager:
             Translated text or default value
         """
         lang_code = self.get_current_language()
-        lang_dict = self.languages.get(lang_code, {})
+        value = self._get_table(lang_code).get(key_path)
         
-        keys = key_path.split(".")
-        value = lang_dict
-        
-        try:
-            for key in keys:
-                value = value[key]
-            return str(value)
-        except (KeyError, TypeError):
-            print(f"Warning: Key not found: {key_path} for language {lang_code}")
+        if value is None:
+            if (lang_code, key_path) not in self._warned_keys:
+                self._warned_keys.add((lang_code, key_path))
+                print(f"Warning: Key not found: {key_path} for language {lang_code}")
             return default
+        return value if isinstance(value, str) else str(value)
     
     def get_list(self, key_path: str, default: list = None) -> list:
         """
@@ -97,19 +164,8 @@ class LanguageManager:
         if default is None:
             default = []
         
-        try:
-            lang_code = self.get_current_language()
-            lang_dict = self.languages.get(lang_code, {})
-            
-            keys = key_path.split(".")
-            value = lang_dict
-            
-            for key in keys:
-                value = value[key]
-            
-            return value if isinstance(value, list) else default
-        except (KeyError, TypeError):
-            return default
+        value = self._get_table(self.get_current_language()).get(key_path)
+        return value if isinstance(value, list) else default
     
     def get_dict(self, key_path: str, default: dict = None) -> dict:
         """
@@ -125,19 +181,8 @@ class LanguageManager:
         if default is None:
             default = {}
         
-        try:
-            lang_code = self.get_current_language()
-            lang_dict = self.languages.get(lang_code, {})
-            
-            keys = key_path.split(".")
-            value = lang_dict
-            
-            for key in keys:
-                value = value[key]
-            
-            return value if isinstance(value, dict) else default
-        except (KeyError, TypeError):
-            return default
+        value = self._get_table(self.get_current_language()).get(key_path)
+        return value if isinstance(value, dict) else default
 
 
 # Global instance
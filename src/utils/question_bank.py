@@ -0,0 +1,192 @@
+"""
+Local question bank backed by SQLite full-text search.
+Generated questions are stored with their subject, grade level, difficulty,
+type and language so new exercise lists can be assembled from them without
+calling the LLM.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from utils.text_index import connect, match_query, normalize_text
+
+DEFAULT_PATH = Path(tempfile.gettempdir()) / "eduadocs-question-bank.sqlite3"
+# Language of questions stored without one, from before banks kept languages
+DEFAULT_LANGUAGE = "en"
+
+# Question types answered by picking an option (English and Portuguese)
+_MULTIPLE_CHOICE_PATTERN = re.compile(r'multiple[\s-]*choice|m[úu]ltipla\s+escolha', re.IGNORECASE)
+_OPTION_LETTER_PATTERN = re.compile(r'^\(?([A-Ha-h])[\)\.:]?$')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    fingerprint TEXT NOT NULL UNIQUE,
+    subject TEXT NOT NULL,
+    grade_level TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    question_type TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    question TEXT NOT NULL,
+    options TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    solution TEXT NOT NULL,
+    created REAL NOT NULL,
+    language TEXT NOT NULL DEFAULT 'en'
+);
+CREATE INDEX IF NOT EXISTS questions_filter
+    ON questions (subject, grade_level, difficulty, question_type);
+CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts
+    USING fts5(question, topic, content='questions', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS questions_fts_insert AFTER INSERT ON questions BEGIN
+    INSERT INTO questions_fts (rowid, question, topic) VALUES (new.id, new.question, new.topic);
+END;
+CREATE TRIGGER IF NOT EXISTS questions_fts_delete AFTER DELETE ON questions BEGIN
+    INSERT INTO questions_fts (questions_fts, rowid, question, topic) VALUES ('delete', old.id, old.question, old.topic);
+END;
+"""
+
+
+def _fingerprint(subject: str, grade_level: str, question: str) -> str:
+    """Identical questions (ignoring case, accents and punctuation) share a fingerprint."""
+    key = "\x1f".join(normalize_text(part) for part in (subject, grade_level, question))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def is_complete_question(question: Dict[str, Any]) -> bool:
+    """
+    Whether a question can be reused as is: it has text and an answer or solution,
+    and a multiple choice question has at least two options and an answer naming one.
+    """
+    if not question.get("question", "").strip():
+        return False
+    answer = (question.get("answer") or "").strip()
+    if not _MULTIPLE_CHOICE_PATTERN.search(question.get("type", "")):
+        return bool(answer or (question.get("solution") or "").strip())
+
+    options = [option for option in question.get("options") or [] if str(option).strip()]
+    if len(options) < 2 or not answer:
+        return False
+    letter = _OPTION_LETTER_PATTERN.match(answer)
+    return letter is None or ord(letter.group(1).upper()) - ord("A") < len(options)
+
+
+class QuestionBank:
+    """Stores generated questions and retrieves them by tags and topic."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with connect(self.path) as conn:
+            conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(questions)")}
+            if "language" not in columns:
+                conn.execute(f"ALTER TABLE questions ADD COLUMN language TEXT NOT NULL DEFAULT '{DEFAULT_LANGUAGE}'")
+
+    def add_questions(self, tags: Dict[str, str], questions: List[Dict[str, Any]]) -> int:
+        """
+        Store complete questions, skipping incomplete ones and ones already in the bank.
+
+        Args:
+            tags: "subject", "grade_level", "difficulty", "topic" and optionally "language"
+                shared by the questions
+            questions: Dicts with "type", "question", "options", "answer" and "solution"
+
+        Returns:
+            Number of newly stored questions
+        """
+        rows = []
+        now = time.time()
+        for question in questions:
+            # A question missing its options or answer would spoil every list it is reused in
+            if not is_complete_question(question):
+                continue
+            text = question["question"].strip()
+            rows.append((
+                _fingerprint(tags["subject"], tags["grade_level"], text),
+                tags["subject"].strip(),
+                tags["grade_level"],
+                tags["difficulty"],
+                question.get("type", ""),
+                tags.get("topic", ""),
+                text,
+                json.dumps(question.get("options", []), ensure_ascii=False),
+                question.get("answer", ""),
+                question.get("solution", ""),
+                now,
+                tags.get("language") or DEFAULT_LANGUAGE
+            ))
+
+        with connect(self.path) as conn:
+            # The cursor's row count leaves out the writes of the full-text index triggers
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO questions (fingerprint, subject, grade_level, difficulty, question_type, "
+                "topic, question, options, answer, solution, created, language) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            return cursor.rowcount
+
+    def search(self, subject: str, grade_level: str, topic: str, difficulty: Optional[str] = None,
+               question_types: Optional[List[str]] = None, limit: int = 10,
+               language: str = DEFAULT_LANGUAGE) -> List[Dict[str, Any]]:
+        """
+        Find stored questions for a subject, grade and language, ranked by topic relevance.
+
+        Returns question dicts with an extra "id", best matches first.
+        """
+        query = match_query(topic)
+        if not query:
+            return []
+
+        sql = (
+            "SELECT q.* FROM questions_fts JOIN questions q ON q.id = questions_fts.rowid "
+            "WHERE questions_fts MATCH ? AND q.subject = ? COLLATE NOCASE AND q.grade_level = ? AND q.language = ?"
+        )
+        args: List[Any] = [query, subject.strip(), grade_level, language]
+        if difficulty:
+            sql += " AND q.difficulty = ?"
+            args.append(difficulty)
+        if question_types:
+            sql += f" AND q.question_type IN ({', '.join('?' for _ in question_types)})"
+            args.extend(question_types)
+        sql += " ORDER BY bm25(questions_fts) LIMIT ?"
+        args.append(limit)
+
+        with connect(self.path) as conn:
+            rows = conn.execute(sql, args).fetchall()
+
+        questions = [
+            {
+                "id": row["id"],
+                "type": row["question_type"],
+                "question": row["question"],
+                "options": json.loads(row["options"]),
+                "answer": row["answer"],
+                "solution": row["solution"]
+            }
+            for row in rows
+        ]
+        # Incomplete questions banked before they were validated are never handed out
+        return [question for question in questions if is_complete_question(question)]
+
+    def count(self) -> int:
+        with connect(self.path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+
+
+# Global instance
+_question_bank: Optional[QuestionBank] = None
+
+
+def get_question_bank() -> QuestionBank:
+    """Get or create the global question bank instance."""
+    global _question_bank
+    if _question_bank is None:
+        _question_bank = QuestionBank(Path(os.getenv("EDUADOCS_QUESTION_BANK") or DEFAULT_PATH))
+    return _question_bank
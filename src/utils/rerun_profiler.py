@@ -0,0 +1,117 @@
+"""
+Timing of Streamlit script reruns.
+Every widget interaction reruns the app script; this records how long each
+rerun takes, broken down into named sections, so slow parts can be found.
+Waiting for work that is not UI cost, such as an LLM generation, is timed
+separately and left out of the rerun time, so the percentiles keep measuring
+the UI.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+DEFAULT_BUDGET_MS = 50
+DEFAULT_HISTORY = 200
+
+
+class RerunProfiler:
+    """Records per-rerun and per-section wall-clock times across all sessions."""
+
+    def __init__(self, budget_ms: float, history: int, log: bool):
+        """
+        Args:
+            budget_ms: Reruns slower than this are reported as over budget
+            history: Number of recent reruns kept for percentiles
+            log: Print every rerun over budget to the console
+        """
+        self.budget_ms = budget_ms
+        self.log = log
+        self._history = deque(maxlen=history)
+        self._lock = threading.Lock()
+        # Sessions rerun concurrently on separate threads
+        self._local = threading.local()
+
+    @contextmanager
+    def rerun(self) -> Iterator[None]:
+        """Time one full rerun of the script."""
+        self._local.sections = {}
+        self._local.excluded = {}
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            sections = self._local.sections
+            excluded = self._local.excluded
+            self._local.sections = None
+            self._local.excluded = None
+            total_ms = (time.perf_counter() - start) * 1000 - sum(excluded.values())
+            with self._lock:
+                self._history.append({"total_ms": total_ms, "sections": sections, "excluded": excluded, "time": time.time()})
+            if self.log and total_ms > self.budget_ms:
+                breakdown = ", ".join(f"{name} {ms:.1f} ms" for name, ms in sections.items())
+                print(f"Warning: Rerun took {total_ms:.1f} ms (budget {self.budget_ms:.0f} ms): {breakdown}")
+
+    @contextmanager
+    def section(self, name: str) -> Iterator[None]:
+        """Time a named part of the current rerun; repeated sections add up."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            sections = getattr(self._local, "sections", None)
+            if sections is not None:
+                sections[name] = sections.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    @contextmanager
+    def excluded(self, name: str) -> Iterator[None]:
+        """Time a named part of the current rerun that is not UI work, and leave it out of the rerun time."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            excluded = getattr(self._local, "excluded", None)
+            if excluded is not None:
+                excluded[name] = excluded.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def stats(self) -> Optional[Dict[str, Any]]:
+        """Summary of recent reruns, or None before the first one completes."""
+        with self._lock:
+            history = list(self._history)
+        if not history:
+            return None
+
+        totals = sorted(entry["total_ms"] for entry in history)
+        return {
+            "count": len(totals),
+            "last_ms": history[-1]["total_ms"],
+            "p50_ms": totals[len(totals) // 2],
+            "p95_ms": totals[min(len(totals) - 1, int(len(totals) * 0.95))],
+            "over_budget": sum(1 for total in totals if total > self.budget_ms),
+            "sections": history[-1]["sections"],
+            "excluded": history[-1]["excluded"]
+        }
+
+
+# Global instance
+_rerun_profiler: Optional[RerunProfiler] = None
+
+
+def get_rerun_profiler() -> RerunProfiler:
+    """Get or create the global rerun profiler instance."""
+    global _rerun_profiler
+    if _rerun_profiler is None:
+        _rerun_profiler = RerunProfiler(
+            budget_ms=float(os.getenv("EDUADOCS_RERUN_BUDGET_MS") or DEFAULT_BUDGET_MS),
+            history=DEFAULT_HISTORY,
+            log=profiling_enabled()
+        )
+    return _rerun_profiler
+
+
+def profiling_enabled() -> bool:
+    """Whether rerun timings are shown in the app and logged."""
+    return os.getenv("EDUADOCS_PROFILE_RERUNS", "").lower() in ("1", "true", "yes")
@@ -0,0 +1,244 @@
+"""
+Similarity-based reuse of past generations.
+Requests of the same document type and grade level are indexed by MinHash
+signatures over normalized subject and topic text, so near-duplicates like
+"Photosynthesis for 7th graders" and "photosynthesis - grade 7" find each
+other without any network model. The index lives in SQLite, so a lookup
+reads only signatures and the matched document, and using or adding an entry
+writes only that entry.
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import struct
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from utils.text_index import connect, normalize_text
+
+# Defaults, overridable through the environment
+DEFAULT_PATH = Path(tempfile.gettempdir()) / "eduadocs-similarity-cache.sqlite3"
+DEFAULT_MAX_ENTRIES = 200
+DEFAULT_MAX_AGE_DAYS = 30
+DEFAULT_SUGGEST_THRESHOLD = 0.5
+DEFAULT_REUSE_THRESHOLD = 0.9
+
+# Parameters that change the generated content besides the indexed text;
+# a match is only reused directly when all of them are equal
+OPTION_KEYS = [
+    "num_questions", "difficulty", "question_types",
+    "num_slides", "include_images", "presentation_style",
+    "summary_length", "include_examples", "format_style",
+    "structured_output", "use_question_bank", "use_course_material",
+    "output_languages"
+]
+
+_NUM_PERMUTATIONS = 64
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240607)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(_NUM_PERMUTATIONS)
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    key TEXT PRIMARY KEY,
+    doc_type TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    grade_level TEXT NOT NULL,
+    options TEXT NOT NULL,
+    signature BLOB NOT NULL,
+    content TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS generations_lookup ON generations (doc_type, grade_level);
+CREATE INDEX IF NOT EXISTS generations_last_used ON generations (last_used);
+"""
+_SIGNATURE_FORMAT = f"<{_NUM_PERMUTATIONS}Q"
+
+# Words that carry no topic information (English and Portuguese)
+_STOPWORDS = {
+    "a", "an", "and", "the", "of", "for", "to", "in", "on", "about", "with",
+    "grade", "grader", "level", "year", "class", "student", "students",
+    "o", "os", "as", "e", "de", "da", "do", "das", "dos", "para", "sobre",
+    "com", "em", "no", "na", "ano", "serie", "nivel", "turma", "aluno", "alunos"
+}
+
+
+def _tokens(text: str) -> List[str]:
+    """Lowercase, strip accents, drop stopwords and reduce simple inflections."""
+    tokens = []
+    for token in normalize_text(text).split():
+        token = re.sub(r"^(\d+)(st|nd|rd|th|o|a)$", r"\1", token)
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        if token not in _STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+def _shingles(text: str) -> set:
+    """Word tokens plus character trigrams, which absorb spelling variants."""
+    shingles = set()
+    for token in _tokens(text):
+        shingles.add(token)
+        padded = f"^{token}$"
+        shingles.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return shingles
+
+
+def _signature(shingles: set) -> List[int]:
+    hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles] or [0]
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def _similarity(first: List[int], second: List[int]) -> float:
+    """Estimated Jaccard similarity of two MinHash signatures."""
+    return sum(1 for x, y in zip(first, second) if x == y) / _NUM_PERMUTATIONS
+
+
+def _indexed_text(params: Dict[str, Any]) -> str:
+    return f"{params.get('subject', '')} {params.get('topic', '')}"
+
+
+def _options(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: params[key] for key in OPTION_KEYS if key in params}
+
+
+class SimilarityCache:
+    """Persistent index of past generations searchable by similarity."""
+
+    def __init__(self, path: Path, max_entries: int, max_age_seconds: float,
+                 suggest_threshold: float, reuse_threshold: float):
+        """
+        Args:
+            path: SQLite file the index is persisted to
+            max_entries: Least recently used entries beyond this count are evicted
+            max_age_seconds: Entries not used for this long are evicted
+            suggest_threshold: Minimum similarity to offer a match as a starting point
+            reuse_threshold: Minimum similarity to reuse a match directly
+        """
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.suggest_threshold = suggest_threshold
+        self.reuse_threshold = reuse_threshold
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with connect(self.path) as conn:
+            conn.executescript(_SCHEMA)
+
+    def find(self, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Find the most similar past generation of the same document type and grade level.
+
+        Returns None below the suggest threshold, otherwise the match with its
+        "score" and a "reusable" flag (above the reuse threshold with the same options
+        and the same normalized words; other matches are only suggested).
+        """
+        signature = _signature(_shingles(_indexed_text(params)))
+        options = _options(params)
+
+        best = None
+        best_score = 0.0
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                "SELECT key, subject, topic, grade_level, options, signature FROM generations"
+                " WHERE doc_type = ? AND grade_level = ? AND last_used >= ?",
+                (params.get("doc_type"), params.get("grade_level", ""), time.time() - self.max_age_seconds)
+            )
+            for row in rows:
+                score = _similarity(signature, struct.unpack(_SIGNATURE_FORMAT, row["signature"]))
+                if score > best_score:
+                    best, best_score = row, score
+
+            if best is None or best_score < self.suggest_threshold:
+                return None
+            content = conn.execute("SELECT content FROM generations WHERE key = ?", (best["key"],)).fetchone()
+        if content is None:
+            # Evicted by another session in the meantime
+            return None
+
+        # A close score alone is not enough to reuse: "World War 1" and "World War 2"
+        # share nearly every shingle, so the requests must name the same words
+        reusable = (
+            best_score >= self.reuse_threshold
+            and json.loads(best["options"]) == options
+            and set(_tokens(_indexed_text(params))) == set(_tokens(_indexed_text(dict(best))))
+        )
+        return {
+            "score": best_score,
+            "reusable": reusable,
+            "subject": best["subject"],
+            "topic": best["topic"],
+            "grade_level": best["grade_level"],
+            "content": content["content"],
+            "key": best["key"]
+        }
+
+    def add(self, params: Dict[str, Any], content: str) -> None:
+        """Index a successful generation, replacing an identical request's entry."""
+        signature = _signature(_shingles(_indexed_text(params)))
+        request = json.dumps([_indexed_text(params), params.get("grade_level", ""), _options(params)],
+                             sort_keys=True, default=str)
+        key = f"{params.get('doc_type')}:{hashlib.sha1(request.encode('utf-8')).hexdigest()}"
+        now = time.time()
+
+        with connect(self.path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO generations"
+                " (key, doc_type, subject, topic, grade_level, options, signature, content, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    params.get("doc_type"),
+                    params.get("subject", ""),
+                    params.get("topic", ""),
+                    params.get("grade_level", ""),
+                    json.dumps(_options(params), default=str),
+                    struct.pack(_SIGNATURE_FORMAT, *signature),
+                    content,
+                    now,
+                    now
+                )
+            )
+            self._evict(conn, now)
+
+    def touch(self, key: str) -> None:
+        """Mark an entry as used so it survives eviction longer."""
+        with connect(self.path) as conn:
+            conn.execute("UPDATE generations SET last_used = ? WHERE key = ?", (time.time(), key))
+
+    def _evict(self, conn, now: float) -> None:
+        conn.execute("DELETE FROM generations WHERE last_used < ?", (now - self.max_age_seconds,))
+        conn.execute(
+            "DELETE FROM generations WHERE key NOT IN"
+            " (SELECT key FROM generations ORDER BY last_used DESC LIMIT ?)",
+            (self.max_entries,)
+        )
+
+
+# Global instance
+_similarity_cache: Optional[SimilarityCache] = None
+
+
+def get_similarity_cache() -> SimilarityCache:
+    """Get or create the global similarity cache instance."""
+    global _similarity_cache
+    if _similarity_cache is None:
+        _similarity_cache = SimilarityCache(
+            Path(os.getenv("EDUADOCS_SIMILARITY_CACHE") or DEFAULT_PATH),
+            max_entries=int(os.getenv("EDUADOCS_SIMILARITY_MAX_ENTRIES") or DEFAULT_MAX_ENTRIES),
+            max_age_seconds=float(os.getenv("EDUADOCS_SIMILARITY_MAX_AGE_DAYS") or DEFAULT_MAX_AGE_DAYS) * 86400,
+            suggest_threshold=float(os.getenv("EDUADOCS_SIMILARITY_SUGGEST") or DEFAULT_SUGGEST_THRESHOLD),
+            reuse_threshold=float(os.getenv("EDUADOCS_SIMILARITY_REUSE") or DEFAULT_REUSE_THRESHOLD)
+        )
+    return _similarity_cache
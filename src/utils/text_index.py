@@ -0,0 +1,45 @@
+"""
+Helpers shared by the local SQLite indexes.
+The question bank, course index and similarity cache open connections, normalize
+text and build full-text queries the same way; token estimates are shared with
+the model router so prompt budgets agree everywhere.
+"""
+
+import re
+import sqlite3
+import unicodedata
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+
+@contextmanager
+def connect(path: Path) -> Iterator[sqlite3.Connection]:
+    """Open a connection for one transaction; committed on success, always closed."""
+    # A connection per operation keeps an index safe to share across sessions
+    conn = sqlite3.connect(path, timeout=10)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, strip accents and punctuation, and join the words with single spaces."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+def match_query(text: str) -> str:
+    """Turn free text into an FTS5 query matching any of its significant words."""
+    terms = sorted({term for term in normalize_text(text).split() if len(term) > 2})
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count; about three characters per token also covers non-English text."""
+    return len(text) // 3
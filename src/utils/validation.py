@@ -22,5 +22,8 @@ def validate_inputs(subject, topic, llm_config):
     elif llm_config["provider"] == "huggingface":
         if not llm_config.get("model"):
             return False, "Hugging Face model is required"
+    elif llm_config["provider"] == "auto":
+        if not llm_config.get("candidates"):
+            return False, "No AI provider is available for automatic selection"
     
     return True, "Valid"
\ No newline at end of file
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The app imports its packages relative to src/, as `streamlit run src/app.py` does
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
@@ -0,0 +1,196 @@
+import threading
+import time
+
+import pytest
+
+from utils import admission
+from utils.admission import AdmissionController, admission_scope, admit_request
+
+PROVIDER = "ollama"
+
+
+def make_controller(limit, timeout_seconds=5.0):
+    return AdmissionController({PROVIDER: limit}, default_limit=limit, timeout_seconds=timeout_seconds, poll_seconds=0.01)
+
+
+class Holder:
+    """Holds one slot on a thread until released."""
+
+    def __init__(self, controller, session_id="holder"):
+        self._admitted = threading.Event()
+        self._release = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(controller, session_id))
+        self._thread.start()
+        assert self._admitted.wait(2)
+
+    def _run(self, controller, session_id):
+        with controller.admit(PROVIDER, session_id):
+            self._admitted.set()
+            self._release.wait(5)
+
+    def release(self):
+        self._release.set()
+        self._thread.join(2)
+
+
+def start_queued(controller, session_id, on_admit, positions=None):
+    """Start a request on a thread and return once it is waiting in the queue."""
+    queued = threading.Event()
+
+    def on_wait(ahead, wait_seconds):
+        if positions is not None:
+            positions[session_id, threading.current_thread().name] = ahead
+        queued.set()
+
+    def run():
+        with controller.admit(PROVIDER, session_id, on_wait):
+            on_admit(session_id)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert queued.wait(2)
+    return thread
+
+
+def test_concurrent_requests_never_exceed_the_limit():
+    controller = make_controller(limit=2)
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def request(session_id):
+        with controller.admit(PROVIDER, session_id):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+    threads = [threading.Thread(target=request, args=(f"session-{n % 3}",)) for n in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert peak[0] == 2
+    assert controller._active[PROVIDER] == 0
+
+
+def test_limits_are_per_provider():
+    controller = AdmissionController({"ollama": 1, "openai": 1}, default_limit=1, timeout_seconds=0.2, poll_seconds=0.01)
+    holder = Holder(controller)
+    try:
+        with controller.admit("openai", "other"):
+            pass
+    finally:
+        holder.release()
+
+
+def test_sessions_are_admitted_round_robin():
+    controller = make_controller(limit=1)
+    order = []
+    holder = Holder(controller)
+
+    # One session queues three requests before another queues its three
+    threads = [start_queued(controller, session_id, order.append) for session_id in ("a", "a", "a", "b", "b", "b")]
+    holder.release()
+    for thread in threads:
+        thread.join(5)
+
+    assert order == ["a", "b", "a", "b", "a", "b"]
+
+
+def test_queue_position_counts_the_rotation():
+    controller = make_controller(limit=1)
+    positions = {}
+    holder = Holder(controller)
+
+    first = start_queued(controller, "a", lambda session_id: None, positions)
+    second = start_queued(controller, "a", lambda session_id: None, positions)
+    other = start_queued(controller, "b", lambda session_id: None, positions)
+    expected = {("a", first.name): 0, ("b", other.name): 1, ("a", second.name): 2}
+    try:
+        # Waiting requests report their position on every poll; session b's
+        # first request goes right after a's first one
+        deadline = time.monotonic() + 2
+        while positions != expected and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert positions == expected
+    finally:
+        holder.release()
+        for thread in (first, second, other):
+            thread.join(5)
+
+
+def test_queued_request_times_out_and_leaves_the_queue():
+    controller = make_controller(limit=1, timeout_seconds=0.1)
+    holder = Holder(controller)
+    try:
+        with pytest.raises(TimeoutError):
+            with controller.admit(PROVIDER, "late"):
+                pass
+        assert controller._waiting[PROVIDER] == {}
+        assert not controller._rotation[PROVIDER]
+    finally:
+        holder.release()
+
+    with controller.admit(PROVIDER, "late"):
+        pass
+
+
+def test_cancelled_request_leaves_the_queue_without_a_slot():
+    controller = make_controller(limit=1)
+    holder = Holder(controller)
+
+    class Cancelled(Exception):
+        pass
+
+    def on_wait(ahead, wait_seconds):
+        raise Cancelled()
+
+    try:
+        with pytest.raises(Cancelled):
+            with controller.admit(PROVIDER, "cancelled", on_wait):
+                pass
+        assert controller._waiting[PROVIDER] == {}
+    finally:
+        holder.release()
+    assert controller._active[PROVIDER] == 0
+
+
+def test_slot_is_released_when_the_request_fails():
+    controller = make_controller(limit=1, timeout_seconds=0.2)
+
+    with pytest.raises(RuntimeError):
+        with controller.admit(PROVIDER, "a"):
+            raise RuntimeError("provider error")
+
+    assert controller._active[PROVIDER] == 0
+    with controller.admit(PROVIDER, "b"):
+        pass
+
+
+def test_admit_request_reports_the_queue_position_to_its_scope(monkeypatch):
+    controller = make_controller(limit=1)
+    monkeypatch.setattr(admission, "_admission_controller", controller)
+    holder = Holder(controller)
+    seen = []
+
+    def run():
+        with admission_scope("teacher") as scope:
+            def check():
+                seen.append(scope.queue_position())
+                if len(seen) == 3:
+                    holder.release()
+            with admit_request(PROVIDER, check):
+                seen.append(scope.queue_position())
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join(5)
+
+    assert seen[0] is None
+    assert seen[1][0] == 0
+    # Admitted requests no longer count as queued
+    assert seen[-1] is None
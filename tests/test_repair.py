@@ -0,0 +1,155 @@
+import json
+
+import pytest
+
+from generators import repair
+
+PARAMS = {"topic": "Arithmetic", "subject": "Math", "grade_level": "Elementary (K-5)", "llm_config": {}}
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """Answer repair requests with a canned response and keep the prompts sent."""
+    calls = {"prompts": [], "response": {"questions": []}}
+
+    def get_llm_response(prompt, llm_config, **kwargs):
+        calls["prompts"].append(prompt)
+        return json.dumps(calls["response"])
+
+    monkeypatch.setattr(repair, "get_llm_response", get_llm_response)
+    return calls
+
+
+def test_missing_options_are_inserted_after_the_question(llm):
+    content = (
+        "## Multiple Choice\n"
+        "\n"
+        "1. What is 2 + 2?\n"
+        "\n"
+        "2. What is 3 + 3?\n"
+        "   A) 6\n"
+        "   B) 9\n"
+        "\n"
+        "## Answer Key\n"
+        "1. B\n"
+        "2. A"
+    )
+    llm["response"] = {"questions": [{"number": 1, "options": ["3", "4", "5", "6"], "answer": ""}]}
+
+    repaired, count = repair.repair_exercise_content(content, PARAMS)
+
+    assert count == 1
+    assert repaired == (
+        "## Multiple Choice\n"
+        "\n"
+        "1. What is 2 + 2?\n"
+        "   A) 3\n"
+        "   B) 4\n"
+        "   C) 5\n"
+        "   D) 6\n"
+        "\n"
+        "2. What is 3 + 3?\n"
+        "   A) 6\n"
+        "   B) 9\n"
+        "\n"
+        "## Answer Key\n"
+        "1. B\n"
+        "2. A"
+    )
+    assert "1. What is 2 + 2? [NEEDS 4 OPTIONS]" in llm["prompts"][0]
+
+
+def test_lettered_options_are_not_labelled_twice(llm):
+    content = "## Multiple Choice\n1. What is 2 + 2?\n## Answer Key\n1. B"
+    llm["response"] = {"questions": [{"number": 1, "options": ["A) 3", "B) 4"], "answer": ""}]}
+
+    repaired, _ = repair.repair_exercise_content(content, PARAMS)
+
+    assert repaired == "## Multiple Choice\n1. What is 2 + 2?\n   A) 3\n   B) 4\n## Answer Key\n1. B"
+
+
+def test_missing_answer_is_inserted_in_order_in_the_existing_key(llm):
+    content = "## Short Answer\n1. One?\n2. Two?\n3. Three?\n## Answer Key\n1. one\n3. three"
+    llm["response"] = {"questions": [{"number": 2, "options": [], "answer": "two"}]}
+
+    repaired, count = repair.repair_exercise_content(content, PARAMS)
+
+    assert count == 1
+    assert repaired == "## Short Answer\n1. One?\n2. Two?\n3. Three?\n## Answer Key\n1. one\n2. two\n3. three"
+
+
+def test_missing_last_answer_is_appended_to_the_key(llm):
+    content = "## Short Answer\n1. One?\n2. Two?\n## Answer Key\n1. one\n\nGood luck!"
+    llm["response"] = {"questions": [{"number": 2, "options": [], "answer": "two"}]}
+
+    repaired, _ = repair.repair_exercise_content(content, PARAMS)
+
+    assert repaired == "## Short Answer\n1. One?\n2. Two?\n## Answer Key\n1. one\n2. two\n\nGood luck!"
+
+
+def test_missing_answer_key_is_added_at_the_end(llm):
+    content = "## Short Answer\n1. One?\n2. Two?"
+    llm["response"] = {"questions": [
+        {"number": 1, "options": [], "answer": "one"},
+        {"number": 2, "options": [], "answer": "two"}
+    ]}
+
+    repaired, count = repair.repair_exercise_content(content, PARAMS)
+
+    assert count == 2
+    assert repaired == "## Short Answer\n1. One?\n2. Two?\n\n## Answer Key\n\n1. one\n2. two"
+
+
+def test_restarted_numbering_does_not_ask_for_answers(llm):
+    content = (
+        "## Multiple Choice\n"
+        "1. Pick one\n"
+        "## Short Answer\n"
+        "1. Explain\n"
+        "2. Describe\n"
+        "## Answer Key\n"
+        "1. A"
+    )
+    llm["response"] = {"questions": [{"number": 1, "options": ["yes", "no"], "answer": "A"}]}
+
+    repaired, count = repair.repair_exercise_content(content, PARAMS)
+
+    # Answer key entries cannot be matched to questions, so only options are repaired
+    assert "1. Pick one [NEEDS 4 OPTIONS]" in llm["prompts"][0]
+    assert "Explain" not in llm["prompts"][0]
+    assert count == 1
+    assert repaired.endswith("## Answer Key\n1. A")
+    assert "1. Pick one\n   A) yes\n   B) no\n## Short Answer" in repaired
+
+
+def test_complete_content_makes_no_request(llm):
+    content = "## Short Answer\n1. One?\n2. Two?\n## Answer Key\n1. one\n2. two"
+
+    assert repair.repair_exercise_content(content, PARAMS) == (content, 0)
+    assert llm["prompts"] == []
+
+
+def test_failed_repair_leaves_the_content_unchanged(monkeypatch):
+    def get_llm_response(prompt, llm_config, **kwargs):
+        raise Exception("provider down")
+
+    monkeypatch.setattr(repair, "get_llm_response", get_llm_response)
+    content = "## Short Answer\n1. One?"
+
+    assert repair.repair_exercise_content(content, PARAMS) == (content, 0)
+
+
+@pytest.mark.parametrize("number, expected", [
+    (1, 5),   # before the first later entry
+    (4, 7),   # after the last entry
+])
+def test_answer_insert_line_keeps_the_key_in_order(number, expected):
+    answer_lines = {2: (5, "b"), 3: (6, "c")}
+
+    assert repair._answer_insert_line(number, answer_lines, 4, 10) == expected
+
+
+def test_answer_insert_line_without_entries():
+    assert repair._answer_insert_line(1, {}, 4, 10) == 5
+    # The key heading is appended after the content: blank line, heading, blank line
+    assert repair._answer_insert_line(1, {}, None, 10) == 13
@@ -0,0 +1,56 @@
+import random
+import re
+
+import pytest
+
+from llm_handlers.thinking_filter import ThinkingFilter
+
+# Whole-text equivalent of the filter: reasoning blocks (an unterminated one
+# runs to the end) and self-closing tags removed, trailing spaces stripped
+# from each line, blank lines collapsed to one and the ends trimmed
+_REASONING = re.compile(r'<think\s*/\s*>|<think\s*>.*?(?:</think\s*>|\Z)', re.IGNORECASE | re.DOTALL)
+
+# Fragments that exercise tags split across chunks, look-alike tags and whitespace runs
+_FRAGMENTS = [
+    "a", "b", " ", "\n", "\t", "  \n", " \n\n\n", "<", ">", "x<y", "</", "<thin", "k",
+    "<think>", "</think>", "<think/>", "<THINK>", "</Think >", "< think>", "<think >"
+]
+
+
+def reference(text):
+    text = _REASONING.sub("", text)
+    text = "\n".join(line.rstrip() for line in text.split("\n"))
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def stream(text, sizes):
+    thinking = ThinkingFilter()
+    out = []
+    pos = 0
+    for size in sizes:
+        out.append(thinking.feed(text[pos:pos + size]))
+        pos += size
+    out.append(thinking.feed(text[pos:]))
+    out.append(thinking.finish())
+    return "".join(out)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("<think>plan</think>Answer", "Answer"),
+    ("<think>\nplan\n</think>\n\n# Title\n\nBody  \n", "# Title\n\nBody"),
+    ("Before<think/> after", "Before after"),
+    ("a < b and c > d", "a < b and c > d"),
+    ("Visible<think>never closed", "Visible"),
+    ("one\n\n\n\ntwo", "one\n\ntwo"),
+])
+def test_examples(text, expected):
+    assert stream(text, [1] * len(text)) == expected
+    assert stream(text, []) == expected
+
+
+def test_matches_the_whole_text_reference_for_any_chunking():
+    rng = random.Random(1)
+    for _ in range(20000):
+        text = "".join(rng.choice(_FRAGMENTS) for _ in range(rng.randint(0, 25)))
+        sizes = [rng.randint(1, 6) for _ in range(40)]
+        assert stream(text, sizes) == reference(text), (text, sizes)